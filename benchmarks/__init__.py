@@ -0,0 +1,9 @@
+import os
+
+# Benchmarks run offline, so fill in the settings the application requires at import time
+os.environ.setdefault("API_OPENAI_KEY", "sk-benchmark")
+os.environ.setdefault("API_DEBUG", "false")
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("MONGO_DATABASE", "benchmark")
+os.environ.setdefault("MONGO_DOCUMENTS_COLLECTION", "documents")
+os.environ.setdefault("MONGO_EMBEDDED_COLLECTION", "embedded_documents")
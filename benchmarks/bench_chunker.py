@@ -0,0 +1,53 @@
+"""
+Compares the CPU time of splitting large documents with the former text splitter against the TokenChunker.
+
+The baseline reproduces the former DocumentHandler chunking: get_token_counts over the whole text to
+choose the chunk size, RecursiveCharacterTextSplitter.from_tiktoken_encoder re-encoding the pieces
+while merging them, then get_token_counts again on every chunk for the embedding batches. The
+TokenChunker encodes the text once and returns the token count of every chunk.
+
+Usage:
+    python -m benchmarks.bench_chunker --documents 5 --paragraphs 4000 --chunk-size 1000
+"""
+import argparse
+import random
+import time
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks.corpus import make_document
+from utils.chunker import TokenChunker
+from utils.utils import get_token_counts
+
+def split_with_text_splitter(text: str, chunk_size: int) -> list:
+    token_count = get_token_counts(text)
+    splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name="cl100k_base", chunk_size=min(token_count, chunk_size), chunk_overlap=0)
+    chunks = splitter.split_text(text)
+    return [(chunk, get_token_counts(chunk)) for chunk in chunks]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--documents", type=int, default=5)
+    parser.add_argument("--paragraphs", type=int, default=4000, help="Paragraphs per document")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    documents = [make_document(args.paragraphs, rng) for _ in range(args.documents)]
+    tokens = sum(get_token_counts(document) for document in documents)
+    print(f"{args.documents} documents, {sum(map(len, documents)) / 1e6:.1f}M characters, {tokens} tokens")
+
+    chunker = TokenChunker(chunk_size=args.chunk_size)
+    for name, split in (("text splitter", lambda text: split_with_text_splitter(text, args.chunk_size)),
+                        ("token chunker", chunker.split)):
+        started = time.process_time()
+        chunks = [chunk for document in documents for chunk in split(document)]
+        elapsed = time.process_time() - started
+        print(f"{name:>14}: {len(chunks):6d} chunks in {elapsed:7.2f}s CPU "
+              f"({tokens / elapsed / 1e6:5.2f}M tokens/s)")
+
+
+if __name__ == "__main__":
+    main()
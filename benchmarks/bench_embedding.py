@@ -0,0 +1,51 @@
+"""
+Compares per-chunk embedding calls with the batched embedding path.
+
+Usage:
+    python -m benchmarks.bench_embedding --chunks 500 --latency 0.05
+"""
+import argparse
+import asyncio
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from services.openai_client import OpenAIClient
+from utils.utils import get_token_counts
+
+
+async def per_chunk(client: OpenAIClient, chunks):
+    return [(await client.create_embedding(chunk))[0] for chunk in chunks]
+
+
+async def batched(client: OpenAIClient, chunks):
+    token_counts = [get_token_counts(chunk) for chunk in chunks]
+    return await client.create_embeddings(chunks, token_counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chunks", type=int, default=500)
+    parser.add_argument("--chunk-words", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    chunks = [" ".join(f"word{i}-{j}" for j in range(args.chunk_words))
+              for i in range(args.chunks)]
+
+    with FakeOpenAIServer(latency=args.latency) as server:
+        for name, run in (("per-chunk", per_chunk), ("batched", batched)):
+            client = OpenAIClient("sk-benchmark", base_url=server.url,
+                                  batch_size=args.batch_size, concurrency=args.concurrency)
+            requests_before = server.requests
+            started = time.perf_counter()
+            vectors = asyncio.run(run(client, chunks))
+            elapsed = time.perf_counter() - started
+            assert len(vectors) == len(chunks)
+            print(f"{name:>10}: {len(chunks) / elapsed:8.1f} chunks/sec "
+                  f"({server.requests - requests_before} requests, {elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Compares loading a local repository with one DirectoryLoader glob per extension against the RepoWalker.
+
+The glob baseline reproduces the former GithubHandler loading: a DirectoryLoader per extension, each
+walking the whole tree, reading files with TextLoader (DirectoryLoader's default, unstructured, is much
+slower still). The RepoWalker walks the tree once and reads the files in a thread pool.
+
+Usage:
+    python -m benchmarks.bench_repo_walker --repo /path/to/large/repo --workers 8
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from langchain_community.document_loaders import DirectoryLoader, TextLoader
+
+from services.repo_walker import EXTENSIONS, RepoWalker
+
+
+def load_with_globs(repo: str) -> int:
+    loaded = 0
+    for extension in sorted(EXTENSIONS - {"ipynb"}):
+        loader = DirectoryLoader(repo, glob=f"**/*.{extension}", loader_cls=TextLoader,
+                                 loader_kwargs={"autodetect_encoding": True}, silent_errors=True)
+        loaded += len(loader.load())
+    return loaded
+
+
+async def load_with_walker(repo: str, workers: int, stats: Counter) -> int:
+    walker = RepoWalker(workers=workers)
+    loaded = 0
+    async for _ in walker.load(repo, stats):
+        loaded += 1
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repo", required=True)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--skip-globs", action="store_true", help="Only time the RepoWalker")
+    args = parser.parse_args()
+
+    if not args.skip_globs:
+        started = time.perf_counter()
+        loaded = load_with_globs(args.repo)
+        elapsed = time.perf_counter() - started
+        print(f"   globs: {loaded:7d} files in {elapsed:7.2f}s ({len(EXTENSIONS) - 1} tree walks)")
+
+    stats = Counter()
+    started = time.perf_counter()
+    loaded = asyncio.run(load_with_walker(args.repo, args.workers, stats))
+    elapsed = time.perf_counter() - started
+    print(f"  walker: {loaded:7d} files in {elapsed:7.2f}s (1 tree walk, {args.workers} readers)")
+    print(f" skipped: {dict((reason, count) for reason, count in stats.items() if reason != 'loaded')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Measures every hot path of ingestion and chat on its own, offline, and writes the timings as JSON.
+
+OpenAI is replaced by the local FakeOpenAIServer and MongoDB by the in-memory FakeMongoClient, so the
+timings cover the application's own work plus the configured fake latencies, and compare between
+releases run on the same machine. The synthetic text documents are ingested one stage at a time:
+
+    load_document     DocumentHandler._load_document of every document
+    chunk             DocumentHandler._chunk_documents of every loaded document
+    create_vectors    DocumentHandler._create_vectors of the chunks of every document
+    save_many         EmbeddedDocumentRepository.save_many of the vectors of every document
+    vector_store_load NumpyVectorStore.load of every stored vector
+
+then every synthetic question is answered one stage at a time:
+
+    vector_search     VectorRetriever._vector_search of the question alone
+    chat              ChatHandler.chat, expanding the question as --expansion says
+
+With --compare, the mean of every stage is checked against an earlier report and the run fails when a
+stage got slower by more than --tolerance.
+
+Usage:
+    python -m benchmarks.bench_stages --documents 20 --paragraphs 500 --questions 50 --output stages.json
+    python -m benchmarks.bench_stages --compare stages.json --tolerance 0.2
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+import numpy as np
+
+from benchmarks.corpus import make_document, make_questions
+from benchmarks.fake_mongo import FakeMongoClient
+from benchmarks.fake_openai import FakeOpenAIServer
+from core.model import ChatRequest
+from models.embedded_document import EmbeddedDocumentRepository
+from services.chat_handler import ChatHandler
+from services.document_handler import DocumentHandler
+from services.openai_client import OpenAIClient
+from services.vector_retriever import VectorRetriever
+from services.vector_store import NumpyVectorStore
+from utils.chunker import TokenChunker
+from config.settings import mongo
+
+
+class StageTimer:
+    """
+    Collects the duration of every call of every stage, with the number of items it processed.
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self.items: Dict[str, int] = defaultdict(int)
+
+    async def time(self, stage: str, call, items: Callable[[Any], int] = None):
+        """
+        Awaits a call of a stage, `items` counts the items processed from its result, 1 by default.
+        """
+        started = time.perf_counter()
+        result = await call
+        self.durations[stage].append(time.perf_counter() - started)
+        self.items[stage] += items(result) if items else 1
+        return result
+
+    def summary(self) -> Dict[str, dict]:
+        summary = {}
+        for stage, durations in self.durations.items():
+            milliseconds = np.array(durations) * 1000
+            total = float(np.sum(durations))
+            summary[stage] = {
+                "calls": len(durations),
+                "items": self.items[stage],
+                "total_seconds": round(total, 6),
+                "mean_ms": round(float(np.mean(milliseconds)), 3),
+                "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+                "p95_ms": round(float(np.percentile(milliseconds, 95)), 3),
+                "max_ms": round(float(np.max(milliseconds)), 3),
+                "items_per_second": round(self.items[stage] / total, 1) if total else None,
+            }
+        return summary
+
+
+def compare(stages: Dict[str, dict], baseline: Dict[str, dict], tolerance: float) -> List[str]:
+    """
+    Returns the stages whose mean duration grew by more than `tolerance` over the baseline.
+    """
+    regressions = []
+    for stage, timings in stages.items():
+        before = baseline.get(stage)
+        if before and before["mean_ms"] and timings["mean_ms"] > before["mean_ms"] * (1 + tolerance):
+            regressions.append(f"{stage}: {before['mean_ms']:.3f} ms -> {timings['mean_ms']:.3f} ms "
+                               f"(+{timings['mean_ms'] / before['mean_ms'] - 1:.0%})")
+    return regressions
+
+
+async def run(args: argparse.Namespace, server: FakeOpenAIServer, directory: str) -> Dict[str, dict]:
+    rng = random.Random(args.seed)
+    mongo_client = FakeMongoClient()
+    openai = OpenAIClient("sk-benchmark", base_url=server.url, batch_size=args.batch_size)
+    openai.warm_up()
+    handler = DocumentHandler(openai, mongo_client, chunker=TokenChunker(args.chunk_size, args.chunk_overlap))
+    repository = EmbeddedDocumentRepository(database=mongo_client.db)
+    vector_store = NumpyVectorStore(mongo_client, mongo.embedded_collection, mongo.documents_collection,
+                                    mode=args.vector_store_mode)
+    retriever = VectorRetriever(openai, mongo_client, vector_store, expansion_mode=args.expansion,
+                                expansion_questions=server.completion_lines)
+    chat_handler = ChatHandler(openai, mongo_client, retriever)
+    timer = StageTimer()
+
+    files = []
+    for index in range(args.documents):
+        path = os.path.join(directory, f"document-{index}.txt")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(make_document(args.paragraphs, rng))
+        files.append(path)
+
+    document_ids = []
+    for index, path in enumerate(files):
+        document_id = f"{index:024x}"
+        documents = await timer.time("load_document", handler._load_document(path, "txt"), items=len)
+        chunks = await timer.time("chunk", handler._chunk_documents(documents), items=len)
+        vectors = await timer.time("create_vectors", handler._create_vectors(
+            chunks, document_id, os.path.basename(path)), items=len)
+        await timer.time("save_many", repository.save_many(vectors), items=lambda _: len(vectors))
+        document_ids.append(document_id)
+    await timer.time("vector_store_load", vector_store.load(), items=lambda _: len(vector_store.index))
+
+    for question in make_questions(args.questions, rng):
+        document_id = rng.choice(document_ids)
+        filters = {"documents_id": document_id}
+        hits = await timer.time("vector_search", retriever._vector_search(
+            [mongo.embedded_collection], [question], filters))
+        if not hits:
+            raise RuntimeError(f"No hits for '{question}' in document {document_id}")
+        await timer.time("chat", chat_handler.chat(ChatRequest(
+            document_id=document_id, question=question, filters=filters, expansion=args.expansion)))
+
+    return timer.summary()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=500, help="Paragraphs per document")
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=256, help="Texts per embedding request")
+    parser.add_argument("--vector-store-mode", choices=("exact", "ivf"), default="exact")
+    parser.add_argument("--expansion", choices=("off", "cached", "on"), default="on")
+    parser.add_argument("--latency", type=float, default=0.0, help="Fake OpenAI latency per request, in seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--compare", help="Fail when a stage is slower than in this earlier JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown of a stage mean")
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(latency=args.latency, per_item_latency=0) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        stages = asyncio.run(run(args, server, directory))
+        elapsed = time.perf_counter() - started
+
+    report = {
+        "benchmark": "stages",
+        "config": vars(args),
+        "environment": {"python": sys.version.split()[0], "platform": platform.platform(),
+                        "cpus": os.cpu_count()},
+        "elapsed_seconds": round(elapsed, 3),
+        "stages": stages,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(stages, json.load(file)["stages"], args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Measures cold start: the time to import the application and the latency of the first requests.
+
+Every run starts a fresh interpreter, so nothing is imported or cached yet. It imports `main`, then times
+the first question embedding against a local fake OpenAI server, which builds the OpenAI client and loads
+the tokenizer, and the first parse of a text upload, which imports its loader. With --warm-up the
+OpenAIClient.warm_up() step runs, and is timed, before the first request.
+
+Usage:
+    python -m benchmarks.bench_startup --runs 5 --warm-up
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+async def first_requests(warm_up: bool, text_file: str) -> dict:
+    from benchmarks.fake_openai import FakeOpenAIServer
+    from services.document_parser import DocumentParser
+    from services.openai_client import OpenAIClient
+
+    timings = {}
+    with FakeOpenAIServer(latency=0, per_item_latency=0) as server:
+        client = OpenAIClient("sk-benchmark", base_url=server.url)
+        if warm_up:
+            started = time.perf_counter()
+            client.warm_up()
+            timings["warm_up"] = time.perf_counter() - started
+        for name in ("first_embedding", "second_embedding"):
+            started = time.perf_counter()
+            await client.create_embeddings(["How are chunks embedded?"])
+            timings[name] = time.perf_counter() - started
+
+    parser = DocumentParser()
+    for name in ("first_parse", "second_parse"):
+        started = time.perf_counter()
+        await parser.load(text_file, "txt")
+        timings[name] = time.perf_counter() - started
+    return timings
+
+
+def child(warm_up: bool, text_file: str):
+    started = time.perf_counter()
+    import main  # noqa: F401
+    timings = {"import_main": time.perf_counter() - started}
+    timings.update(asyncio.run(first_requests(warm_up, text_file)))
+    print(json.dumps(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--warm-up", action="store_true", help="Run OpenAIClient.warm_up() before the first request")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--text-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.warm_up, args.text_file)
+        return
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as file:
+        file.write("Cold start benchmark.\n" * 100)
+    try:
+        runs = []
+        command = [sys.executable, "-m", "benchmarks.bench_startup", "--child", "--text-file", file.name]
+        if args.warm_up:
+            command.append("--warm-up")
+        for _ in range(args.runs):
+            output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+            runs.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        os.unlink(file.name)
+
+    print(f"median of {args.runs} cold starts{' with warm-up' if args.warm_up else ''}:")
+    for name in runs[0]:
+        print(f"{name:>17}: {statistics.median(run[name] for run in runs) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Compares the storage size and load time of the vector storage formats.
+
+Encodes the same vectors as embedded document rows in every format, measures the BSON size, then
+decodes the rows and builds the float32 matrix the way the numpy vector store loads them. Also reports
+how well each packed format preserves the top 10 neighbours of the float vectors.
+
+Usage:
+    python -m benchmarks.bench_vector_storage --vectors 20000 --dimensions 1536
+"""
+import argparse
+import time
+import bson
+import numpy as np
+
+from utils.vectors import VECTOR_FORMATS, encode_vector, decode_vector
+
+
+def encode_rows(vectors: np.ndarray, vector_format: str) -> bytes:
+    rows = []
+    for i, vector in enumerate(vectors):
+        data, scale = encode_vector(vector, vector_format)
+        row = {"_id": bson.ObjectId(), "chunk_id": f"benchmark-{i}", "vector_chunk": data}
+        if vector_format != "float":
+            row.update({"vector_format": vector_format, "vector_scale": scale})
+        rows.append(bson.encode(row))
+    return b"".join(rows)
+
+
+def load_matrix(blob: bytes, dimensions: int) -> np.ndarray:
+    rows = bson.decode_all(blob)
+    matrix = np.empty((len(rows), dimensions), dtype=np.float32)
+    for vector, row in zip(matrix, rows):
+        decode_vector(row["vector_chunk"], row.get("vector_format"), row.get("vector_scale"), out=vector)
+    return matrix
+
+
+def top_k(matrix: np.ndarray, queries: np.ndarray, k: int = 10) -> np.ndarray:
+    scores = queries @ matrix.T
+    return np.argpartition(-scores, k, axis=1)[:, :k]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vectors", type=int, default=20000)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=100)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(args.vectors, args.dimensions)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = vectors[rng.choice(args.vectors, args.queries, replace=False)] + \
+        0.05 * rng.normal(size=(args.queries, args.dimensions)).astype(np.float32)
+    expected = top_k(vectors, queries)
+
+    baseline = None
+    for vector_format in VECTOR_FORMATS:
+        blob = encode_rows(vectors, vector_format)
+        started = time.perf_counter()
+        matrix = load_matrix(blob, args.dimensions)
+        elapsed = time.perf_counter() - started
+        baseline = baseline or len(blob)
+
+        found = top_k(matrix, queries)
+        recall = np.mean([len(set(e) & set(f)) / len(e) for e, f in zip(expected, found)])
+        print(f"{vector_format:>8}: {len(blob) / args.vectors:8.0f} bytes/row "
+              f"({len(blob) / baseline:5.1%} of float), load {elapsed:6.2f}s "
+              f"({args.vectors / elapsed:9.0f} rows/sec), recall@10 {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
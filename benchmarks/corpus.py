@@ -0,0 +1,40 @@
+import random
+from typing import List
+
+WORDS = ("the of and to in is was for that with as on by it from at this are be or an which ingest vector "
+         "embedding retrieval chunk token document paragraph boundary overlap encoder latency throughput "
+         "naïve café résumé 数据 検索").split()
+
+
+def make_document(paragraphs: int, rng: random.Random) -> str:
+    """
+    Builds a synthetic document of prose-like paragraphs, with some non-ASCII words.
+
+    Args:
+        paragraphs (int): The number of paragraphs.
+        rng (random.Random): The random generator, seeded for reproducible documents.
+
+    Returns:
+        str: The paragraphs separated by blank lines.
+    """
+    lines = []
+    for _ in range(paragraphs):
+        sentences = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 24))).capitalize() + "."
+                     for _ in range(rng.randint(1, 6))]
+        lines.append(" ".join(sentences))
+    return "\n\n".join(lines)
+
+
+def make_questions(count: int, rng: random.Random) -> List[str]:
+    """
+    Builds synthetic questions over the words of the synthetic documents.
+
+    Args:
+        count (int): The number of questions.
+        rng (random.Random): The random generator, seeded for reproducible questions.
+
+    Returns:
+        List[str]: The questions.
+    """
+    return [f"How does the {' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 6)))} work?"
+            for _ in range(count)]
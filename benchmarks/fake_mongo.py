@@ -0,0 +1,259 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional
+import bson
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, UpdateMany, UpdateOne
+from pymongo.results import BulkWriteResult, DeleteResult, InsertManyResult, InsertOneResult, UpdateResult
+
+
+def get_field(document: dict, path: str) -> Any:
+    """
+    Reads a dotted field path, None when a part is missing.
+    """
+    value = document
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def matches(document: dict, query: Optional[dict]) -> bool:
+    """
+    Evaluates a find filter on a document.
+
+    Supports equality, $eq, $ne, $gt, $gte, $lt, $lte, $in, $nin, $exists, $regex, $and, $or and $nor.
+
+    Raises:
+        ValueError: If the filter uses another operator.
+    """
+    for field, condition in (query or {}).items():
+        if field in ("$and", "$or", "$nor"):
+            results = [matches(document, clause) for clause in condition]
+            if (field == "$and" and not all(results)) or (field == "$or" and not any(results)) or \
+                    (field == "$nor" and any(results)):
+                return False
+            continue
+
+        value = get_field(document, field)
+        if not isinstance(condition, dict) or not any(key.startswith("$") for key in condition):
+            condition = {"$eq": condition}
+        for operator, operand in condition.items():
+            if operator == "$eq":
+                found = value == operand or (isinstance(value, list) and operand in value)
+            elif operator == "$ne":
+                found = value != operand
+            elif operator in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                found = {"$gt": value > operand, "$gte": value >= operand,
+                         "$lt": value < operand, "$lte": value <= operand}[operator]
+            elif operator == "$in":
+                found = value in operand
+            elif operator == "$nin":
+                found = value not in operand
+            elif operator == "$exists":
+                found = (field in document) == bool(operand)
+            elif operator == "$regex":
+                found = isinstance(value, str) and re.search(operand, value) is not None
+            else:
+                raise ValueError(f"Unsupported query operator: {operator}")
+            if not found:
+                return False
+    return True
+
+
+def project(document: dict, projection: Optional[dict]) -> dict:
+    """
+    Applies an inclusion or exclusion projection to a document.
+    """
+    if not projection:
+        return dict(document)
+    include = {field for field, value in projection.items() if value and field != "_id"}
+    if include:
+        result = {field: document[field] for field in include if field in document}
+        if projection.get("_id", 1) and "_id" in document:
+            result["_id"] = document["_id"]
+        return result
+    return {field: value for field, value in document.items() if field not in projection}
+
+
+class FakeCursor:
+    """
+    The subset of a Motor cursor used by the application: sort, skip, limit, to_list and async iteration.
+    """
+
+    def __init__(self, documents: List[dict], projection: Optional[dict]):
+        self._documents = documents
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction: int = 1) -> "FakeCursor":
+        self._sort = key if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, skip: int) -> "FakeCursor":
+        self._skip = skip
+        return self
+
+    def limit(self, limit: int) -> "FakeCursor":
+        self._limit = limit
+        return self
+
+    def _results(self) -> List[dict]:
+        documents = self._documents
+        # Stable sorts from the last key to the first give a multi-key sort
+        for field, direction in reversed(self._sort):
+            documents = sorted(documents, key=lambda document: (get_field(document, field) is not None,
+                                                                get_field(document, field)),
+                               reverse=direction < 0)
+        documents = documents[self._skip:]
+        if self._limit:
+            documents = documents[:self._limit]
+        return [project(document, self._projection) for document in documents]
+
+    async def to_list(self, length: Optional[int] = None) -> List[dict]:
+        results = self._results()
+        return results[:length] if length else results
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self._results():
+            yield document
+
+
+class FakeCollection:
+    """
+    An in-memory stand-in for a Motor collection.
+
+    Documents are round tripped through BSON on every write, like the driver encodes them, and kept in
+    insertion order. There are no indexes: every query scans the collection.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._documents: Dict[Any, dict] = {}
+
+    async def create_index(self, keys, **kwargs) -> str:
+        keys = keys if isinstance(keys, list) else [(keys, 1)]
+        return "_".join(f"{field}_{direction}" for field, direction in keys)
+
+    async def insert_one(self, document: dict) -> InsertOneResult:
+        return InsertOneResult(self._insert(document), acknowledged=True)
+
+    async def insert_many(self, documents: Iterable[dict], ordered: bool = True) -> InsertManyResult:
+        return InsertManyResult([self._insert(document) for document in documents], acknowledged=True)
+
+    def find(self, filter: dict = None, projection: dict = None, **kwargs) -> FakeCursor:
+        return FakeCursor([document for document in self._documents.values() if matches(document, filter)],
+                          projection)
+
+    async def find_one(self, filter: dict = None, projection: dict = None, **kwargs) -> Optional[dict]:
+        for document in self._documents.values():
+            if matches(document, filter):
+                return project(document, projection)
+        return None
+
+    async def count_documents(self, filter: dict, **kwargs) -> int:
+        return sum(1 for document in self._documents.values() if matches(document, filter))
+
+    async def update_one(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, many=False), acknowledged=True)
+
+    async def update_many(self, filter: dict, update: dict, upsert: bool = False, **kwargs) -> UpdateResult:
+        return UpdateResult(self._update(filter, update, upsert, many=True), acknowledged=True)
+
+    async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, many=False)}, acknowledged=True)
+
+    async def delete_many(self, filter: dict, **kwargs) -> DeleteResult:
+        return DeleteResult({"n": self._delete(filter, many=True)}, acknowledged=True)
+
+    async def bulk_write(self, requests: list, ordered: bool = True, **kwargs) -> BulkWriteResult:
+        result = {"nInserted": 0, "nMatched": 0, "nModified": 0, "nUpserted": 0, "nRemoved": 0, "upserted": []}
+        for request in requests:
+            if isinstance(request, InsertOne):
+                self._insert(request._doc)
+                result["nInserted"] += 1
+            elif isinstance(request, (UpdateOne, UpdateMany)):
+                raw = self._update(request._filter, request._doc, request._upsert, many=isinstance(request, UpdateMany))
+                result["nMatched"] += raw["n"] - ("upserted" in raw)
+                result["nModified"] += raw["nModified"]
+                result["nUpserted"] += "upserted" in raw
+            elif isinstance(request, (DeleteOne, DeleteMany)):
+                result["nRemoved"] += self._delete(request._filter, many=isinstance(request, DeleteMany))
+            else:
+                raise ValueError(f"Unsupported bulk write request: {type(request).__name__}")
+        return BulkWriteResult(result, acknowledged=True)
+
+    def _insert(self, document: dict) -> Any:
+        if "_id" not in document:
+            document["_id"] = ObjectId()
+        if document["_id"] in self._documents:
+            raise ValueError(f"Duplicate key: {document['_id']}")
+        self._documents[document["_id"]] = bson.decode(bson.encode(document))
+        return document["_id"]
+
+    def _update(self, filter: dict, update: dict, upsert: bool, many: bool) -> dict:
+        unsupported = set(update) - {"$set", "$unset", "$setOnInsert"}
+        if unsupported:
+            raise ValueError(f"Unsupported update operators: {sorted(unsupported)}")
+        matched = [document for document in self._documents.values() if matches(document, filter)]
+        if not many:
+            matched = matched[:1]
+        if not matched:
+            if not upsert:
+                return {"n": 0, "nModified": 0}
+            document = {field: value for field, value in filter.items() if not field.startswith("$")
+                        and not isinstance(value, dict)}
+            document.update(update.get("$setOnInsert", {}))
+            document.update(update.get("$set", {}))
+            return {"n": 1, "nModified": 0, "upserted": self._insert(document)}
+
+        for document in matched:
+            changes = bson.decode(bson.encode(update.get("$set", {})))
+            document.update(changes)
+            for field in update.get("$unset", {}):
+                document.pop(field, None)
+        return {"n": len(matched), "nModified": len(matched)}
+
+    def _delete(self, filter: dict, many: bool) -> int:
+        ids = [_id for _id, document in self._documents.items() if matches(document, filter)]
+        if not many:
+            ids = ids[:1]
+        for _id in ids:
+            del self._documents[_id]
+        return len(ids)
+
+
+class FakeDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, FakeCollection] = {}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name)
+        return self._collections[name]
+
+
+class FakeMongoClient:
+    """
+    An in-memory stand-in for MongoDBAtlasClient, for offline benchmarks.
+
+    Implements the subset of the Motor API used by the repositories, the NumpyVectorStore and the
+    handlers. Aggregation pipelines, and so the Atlas $vectorSearch store, are not supported.
+
+    Attributes:
+        db (FakeDatabase): The database, collections are created on first access.
+    """
+
+    def __init__(self, db_name: str = "benchmark"):
+        self.db = FakeDatabase(db_name)
+
+    def close(self):
+        pass
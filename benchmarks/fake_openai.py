@@ -0,0 +1,172 @@
+import base64
+import hashlib
+import json
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Union
+
+
+def fake_embedding(value: Union[str, List[int]], dimensions: int) -> List[float]:
+    """
+    Builds a deterministic embedding for the given input.
+
+    Args:
+        value (Union[str, List[int]]): The text or token ids sent to the embeddings endpoint.
+        dimensions (int): The size of the embedding.
+
+    Returns:
+        List[float]: A unit length embedding that only depends on the input.
+    """
+    seed = hashlib.sha256(json.dumps(value).encode()).digest()
+    vector = ([(b - 127.5) / 127.5 for b in seed] * (dimensions // len(seed) + 1))[:dimensions]
+    norm = sum(v * v for v in vector) ** 0.5 or 1.0
+    return [v / norm for v in vector]
+
+
+def fake_completion(messages: list, lines: int, words_per_line: int) -> List[str]:
+    """
+    Builds a deterministic chat completion for the given messages.
+
+    Args:
+        messages (list): The messages sent to the chat completions endpoint.
+        lines (int): The number of lines of the completion.
+        words_per_line (int): The number of words of every line.
+
+    Returns:
+        List[str]: The lines of the completion, which only depend on the messages.
+    """
+    seed = hashlib.sha256(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+    # Words are 6 hex digits of the digest, read at a different offset for every word
+    words = [seed[offset % 59:offset % 59 + 6] for offset in range(lines * words_per_line)]
+    return [" ".join(words[line * words_per_line:(line + 1) * words_per_line]) for line in range(lines)]
+
+
+class FakeOpenAIServer:
+    """
+    A local HTTP server imitating the OpenAI embeddings and chat completions APIs.
+
+    Every embedding request sleeps for `latency` seconds plus `per_item_latency` seconds per input, which
+    mimics the round trip cost that dominates real embedding calls. Chat completions sleep for `latency`
+    seconds plus `per_token_latency` seconds per generated word and answer `completion_lines` lines of
+    `completion_words` words, streamed word by word when requested.
+
+    Attributes:
+        latency (float): Fixed latency added to every request, in seconds.
+        per_item_latency (float): Latency added per embedded input, in seconds.
+        per_token_latency (float): Latency added per generated word, in seconds.
+        dimensions (int): Size of the returned embeddings.
+        completion_lines (int): Number of lines of every completion, e.g. alternate questions.
+        completion_words (int): Number of words of every completion line.
+        requests (int): Number of requests served so far.
+    """
+
+    def __init__(self, latency: float = 0.05, per_item_latency: float = 0.0005, dimensions: int = 1536,
+                 per_token_latency: float = 0.0, completion_lines: int = 5, completion_words: int = 12):
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.per_token_latency = per_token_latency
+        self.dimensions = dimensions
+        self.completion_lines = completion_lines
+        self.completion_words = completion_words
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length))
+                if self.path.endswith("/chat/completions"):
+                    with server._lock:
+                        server.requests += 1
+                    self._complete(payload)
+                    return
+                if not self.path.endswith("/embeddings"):
+                    self.send_error(404)
+                    return
+
+                with server._lock:
+                    server.requests += 1
+                inputs = payload["input"]
+                if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                    inputs = [inputs]
+                time.sleep(server.latency +
+                           server.per_item_latency * len(inputs))
+
+                dimensions = payload.get("dimensions") or server.dimensions
+                data = []
+                for index, value in enumerate(inputs):
+                    vector = fake_embedding(value, dimensions)
+                    if payload.get("encoding_format") == "base64":
+                        vector = base64.b64encode(
+                            array("f", vector).tobytes()).decode()
+                    data.append(
+                        {"object": "embedding", "index": index, "embedding": vector})
+                self._send_json({
+                    "object": "list",
+                    "data": data,
+                    "model": payload.get("model"),
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                })
+
+            def _complete(self, payload: dict) -> None:
+                lines = fake_completion(payload["messages"], server.completion_lines, server.completion_words)
+                words = sum(len(line.split()) for line in lines)
+                time.sleep(server.latency + server.per_token_latency * words)
+                completion = {"id": "chatcmpl-fake", "created": 0, "model": payload.get("model")}
+                if not payload.get("stream"):
+                    self._send_json({
+                        **completion,
+                        "object": "chat.completion",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "\n".join(lines)}}],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": words, "total_tokens": words},
+                    })
+                    return
+
+                # Server-Sent Events, one delta per word, ending with [DONE]; closing the connection ends the body
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                pieces = [f"{word} " for line in lines for word in line.split()]
+                for piece in pieces + [None]:
+                    choice = {"index": 0, "delta": {"content": piece} if piece else {},
+                              "finish_reason": None if piece else "stop"}
+                    chunk = {**completion, "object": "chat.completion.chunk", "choices": [choice]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.close_connection = True
+
+            def _send_json(self, body: dict) -> None:
+                raw = json.dumps(body).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers()
+                self.wfile.write(raw)
+
+        return Handler
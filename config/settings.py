@@ -1,3 +1,4 @@
+from typing import List, Literal, Optional
 from pydantic_settings import BaseSettings as PydanticBaseSettings
 
 
@@ -23,13 +24,19 @@ class APISettings(BaseSettings):
         prefix (str): Prefix for API endpoints (defaults to "/api").
         version (str): API version (defaults to "0.1.0").
         openai_key (str): API key for OpenAI.
+        openai_base_url (str, optional): Base URL of an OpenAI compatible API (defaults to the public OpenAI API).
         debug (bool): Flag indicating whether debugging mode is enabled.
+        warm_up (bool): Flag indicating whether the OpenAI clients and tokenizer are loaded in the background at startup instead of on the first request (defaults to True).
+        metrics_path (str): Path of the Prometheus metrics endpoint, outside the API prefix, empty to disable it (defaults to "/metrics").
     """
     project_name: str = "documentsrag"
     prefix: str = "/api"
     version: str = "0.1.0"
     openai_key: str
+    openai_base_url: Optional[str] = None
     debug: bool
+    warm_up: bool = True
+    metrics_path: str = "/metrics"
 
     class Config:
         env_prefix = "API_"
@@ -44,16 +51,306 @@ class MongoDBSettings(BaseSettings):
         database (str): Name of the MongoDB database.
         documents_collection (str): Name of the collection for documents.
         embedded_collection (str): Name of the collection for embedded documents.
+        max_pool_size (int): Maximum number of connections in the client pool (defaults to 100).
+        min_pool_size (int): Minimum number of connections kept open in the client pool (defaults to 0).
+        max_idle_time_ms (int, optional): Time an idle pooled connection is kept alive before being closed.
+        connect_timeout_ms (int): Timeout for opening a connection (defaults to 20000).
+        server_selection_timeout_ms (int): Timeout for selecting a server for an operation (defaults to 30000).
+        socket_timeout_ms (int, optional): Timeout for a single socket read or write, unlimited when not set.
+        read_preference (str): Read preference of the client, e.g. "primary" or "secondaryPreferred" (defaults to "primary").
+        write_batch_size (int): Maximum number of documents converted and written by a single bulk write (defaults to 500).
     """
     uri: str
     database: str
     documents_collection: str
     embedded_collection: str
+    max_pool_size: int = 100
+    min_pool_size: int = 0
+    max_idle_time_ms: Optional[int] = None
+    connect_timeout_ms: int = 20000
+    server_selection_timeout_ms: int = 30000
+    socket_timeout_ms: Optional[int] = None
+    read_preference: str = "primary"
+    write_batch_size: int = 500
 
     class Config:
         env_prefix = "MONGO_"
 
 
+class OpenAISettings(BaseSettings):
+    """
+    Settings class for the HTTP connections to OpenAI.
+
+    Attributes:
+        timeout (float): Timeout of a single OpenAI request in seconds (defaults to 60).
+        max_retries (int): Number of retries of a failed OpenAI request (defaults to 2).
+        max_connections (int): Maximum number of open connections to OpenAI (defaults to 100).
+        max_keepalive_connections (int): Maximum number of idle connections kept alive (defaults to 20).
+        keepalive_expiry (float): Time in seconds an idle connection is kept alive (defaults to 30).
+    """
+    timeout: float = 60
+    max_retries: int = 2
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30
+
+    class Config:
+        env_prefix = "OPENAI_"
+
+
+class EmbeddingSettings(BaseSettings):
+    """
+    Settings class for embedding requests.
+
+    Attributes:
+        batch_size (int): Maximum number of texts sent in a single embedding request (defaults to 256).
+        batch_tokens (int): Maximum number of tokens sent in a single embedding request (defaults to 100000).
+        concurrency (int): Maximum number of embedding requests in flight at once (defaults to 4).
+        cache_enabled (bool): Flag indicating whether created embeddings are cached (defaults to True).
+        cache_memory_items (int): Maximum number of embeddings kept in the in-process cache (defaults to 10000).
+        cache_path (str): Path of the sqlite file backing the persistent cache, empty to disable it.
+        cache_max_bytes (int): Maximum size of the persistent cache in bytes (defaults to 1 GiB).
+        chunk_size (int): Number of tokens per chunk of an uploaded document, below the 8192 limit of the embedding models (defaults to 8100).
+        chunk_overlap (int): Number of tokens shared by consecutive chunks (defaults to 0).
+        chunk_anchor_modulus (int): Checksum modulus of the paragraphs cutting documents into sections chunked independently, 0 to disable sections (defaults to 4).
+        vector_format (Literal["float", "float16", "int8"]): Storage format of new embedded chunks, "float16" and "int8" pack them as BinData with a scale factor and can only be searched by the "numpy" vector store backend (defaults to "float").
+    """
+    batch_size: int = 256
+    batch_tokens: int = 100000
+    concurrency: int = 4
+    cache_enabled: bool = True
+    cache_memory_items: int = 10000
+    cache_path: str = "/tmp/documentsrag-embeddings.sqlite3"
+    cache_max_bytes: int = 1024 ** 3
+    chunk_size: int = 8100
+    chunk_overlap: int = 0
+    chunk_anchor_modulus: int = 4
+    vector_format: Literal["float", "float16", "int8"] = "float"
+
+    class Config:
+        env_prefix = "EMBEDDING_"
+
+
+class QueueSettings(BaseSettings):
+    """
+    Settings class for the document ingestion queue.
+
+    Attributes:
+        staging_dir (str): Directory uploads are staged in until a worker ingests them. Must be shared
+            storage when workers run on other nodes (defaults to "/tmp").
+        workers (int): Number of ingestion workers started inside the API process, 0 when ingestion only
+            runs in dedicated `worker.py` processes (defaults to 1).
+        lease_seconds (int): How long a claimed document stays leased without a heartbeat (defaults to 300).
+        heartbeat_seconds (int): Interval at which a worker renews its lease (defaults to 30).
+        poll_interval (float): Seconds an idle worker waits before polling the queue again (defaults to 1).
+        max_attempts (int): Number of times a document is claimed before it is marked as failed (defaults to 3).
+        metrics_port (int): Port on which `worker.py` processes serve their Prometheus metrics, 0 to disable it (defaults to 0).
+    """
+    staging_dir: str = "/tmp"
+    workers: int = 1
+    lease_seconds: int = 300
+    heartbeat_seconds: int = 30
+    poll_interval: float = 1.0
+    max_attempts: int = 3
+    metrics_port: int = 0
+
+    class Config:
+        env_prefix = "QUEUE_"
+
+
+class UploadSettings(BaseSettings):
+    """
+    Settings class for receiving uploads.
+
+    Attributes:
+        max_file_bytes (int): Maximum size of a single uploaded file (defaults to 512 MiB).
+        max_request_bytes (int): Maximum size of a whole upload request (defaults to 2 GiB).
+        chunk_size (int): Number of bytes buffered before they are written to the staging directory (defaults to 1 MiB).
+    """
+    max_file_bytes: int = 512 * 1024 ** 2
+    max_request_bytes: int = 2 * 1024 ** 3
+    chunk_size: int = 1024 ** 2
+
+    class Config:
+        env_prefix = "UPLOAD_"
+
+
+class ParserSettings(BaseSettings):
+    """
+    Settings class for document parsing.
+
+    Attributes:
+        workers (int, optional): Number of processes parsing documents, defaults to the number of CPUs.
+        pdf_pages_per_task (int): PDFs with more pages are split into page ranges of this size parsed in parallel (defaults to 50).
+    """
+    workers: Optional[int] = None
+    pdf_pages_per_task: int = 50
+
+    class Config:
+        env_prefix = "PARSER_"
+
+
+class GithubSettings(BaseSettings):
+    """
+    Settings class for ingesting GitHub repositories.
+
+    Attributes:
+        max_file_bytes (int): Files of a repository larger than this are skipped (defaults to 1 MB).
+        reader_threads (int): Number of threads reading the files of a repository (defaults to 8).
+        skip_dirs (List[str]): Names of the directories never walked into, at any depth, besides the .gitignored ones, a JSON list in the environment (defaults to [".git", "node_modules", "__pycache__"]).
+        chunk_size (int): Number of tokens per chunk of a file (defaults to 1000).
+        chunk_overlap (int): Number of tokens shared by consecutive chunks of a file (defaults to 0).
+        embed_batch_chunks (int): Number of chunks embedded and stored together (defaults to 256).
+        mirror_dir (str): Directory of the bare mirrors repositories are fetched into (defaults to "/tmp/documentsrag-git").
+        clone_depth (int, optional): Number of commits fetched, unset for the full history (defaults to 1).
+        git_timeout_seconds (float): How long a git clone or fetch may run (defaults to 600).
+        allow_file_urls (bool): Flag indicating whether file:// repository URLs are accepted, e.g. for tests (defaults to False).
+    """
+    max_file_bytes: int = 1000000
+    reader_threads: int = 8
+    skip_dirs: List[str] = [".git", "node_modules", "__pycache__"]
+    chunk_size: int = 1000
+    chunk_overlap: int = 0
+    embed_batch_chunks: int = 256
+    mirror_dir: str = "/tmp/documentsrag-git"
+    clone_depth: Optional[int] = 1
+    git_timeout_seconds: float = 600
+    allow_file_urls: bool = False
+
+    class Config:
+        env_prefix = "GITHUB_"
+
+
+class VectorStoreSettings(BaseSettings):
+    """
+    Settings class for the vector search backend.
+
+    Attributes:
+        backend (Literal["atlas", "numpy"]): "atlas" searches with $vectorSearch, "numpy" searches an in-process copy of the vectors (defaults to "atlas").
+        index_name (str): The Atlas vector search index (defaults to "rag_doc_index").
+        num_candidates (int): The number of candidates the Atlas index considers per query (defaults to 100).
+        mode (Literal["exact", "ivf"]): Search mode of the "numpy" backend (defaults to "exact").
+        ivf_lists (int, optional): The number of IVF inverted lists, defaults to the square root of the number of vectors.
+        ivf_probes (int): The number of IVF lists searched per query (defaults to 8).
+        ivf_min_rows (int): Below this many vectors "ivf" mode searches exactly (defaults to 10000).
+        refresh_seconds (float): Interval at which the "numpy" backend picks up documents ingested or deleted by other processes, 0 disables it (defaults to 30).
+    """
+    backend: Literal["atlas", "numpy"] = "atlas"
+    index_name: str = "rag_doc_index"
+    num_candidates: int = 100
+    mode: Literal["exact", "ivf"] = "exact"
+    ivf_lists: Optional[int] = None
+    ivf_probes: int = 8
+    ivf_min_rows: int = 10000
+    refresh_seconds: float = 30
+
+    class Config:
+        env_prefix = "VECTOR_STORE_"
+
+
+class AnswerCacheSettings(BaseSettings):
+    """
+    Settings class for the chat answer cache.
+
+    Attributes:
+        enabled (bool): Flag indicating whether chat answers are cached (defaults to True).
+        threshold (float): Cosine similarity of question embeddings from which a cached answer is reused (defaults to 0.95).
+        max_items (int): Maximum number of answers kept, the least recently used are evicted (defaults to 10000).
+        ttl_seconds (float): How long an answer stays valid in seconds (defaults to 3600).
+    """
+    enabled: bool = True
+    threshold: float = 0.95
+    max_items: int = 10000
+    ttl_seconds: float = 3600
+
+    class Config:
+        env_prefix = "ANSWER_CACHE_"
+
+
+class RetrieverSettings(BaseSettings):
+    """
+    Settings class for retrieval.
+
+    Attributes:
+        expansion_mode (Literal["off", "cached", "on"]): Whether the question is expanded into alternate questions before the vector search, "cached" reuses the expansions of previous identical questions (defaults to "cached").
+        expansion_questions (int): Number of alternate questions requested (defaults to 5).
+        expansion_skip_keywords (bool): Flag indicating whether short, keyword-like questions are searched without expansion (defaults to True).
+        expansion_keyword_max_words (int): Questions of at most this many words without question words count as keyword-like (defaults to 4).
+        expansion_cache_items (int): Maximum number of cached expansions (defaults to 10000).
+        expansion_cache_ttl_seconds (float): How long an expansion stays cached in seconds (defaults to 86400).
+    """
+    expansion_mode: Literal["off", "cached", "on"] = "cached"
+    expansion_questions: int = 5
+    expansion_skip_keywords: bool = True
+    expansion_keyword_max_words: int = 4
+    expansion_cache_items: int = 10000
+    expansion_cache_ttl_seconds: float = 86400
+
+    class Config:
+        env_prefix = "RETRIEVER_"
+
+
+class LexicalSettings(BaseSettings):
+    """
+    Settings class for the BM25 lexical index fused with the vector search.
+
+    Attributes:
+        enabled (bool): Flag indicating whether the lexical index is built and searched (defaults to True).
+        path (str): Directory the index is persisted in by the one process holding its lock, the others keep theirs in memory; empty to keep it in memory only (defaults to "/tmp/documentsrag-lexical").
+        limit (int): Number of BM25 hits fused with the vector hits (defaults to 10).
+        rrf_k (int): Rank offset of the reciprocal rank fusion (defaults to 60).
+        identifier_shortcut (bool): Flag indicating whether questions naming a code identifier are answered from the BM25 hits alone, skipping expansion and embedding, when a chunk holds the whole identifier (defaults to True).
+        refresh_seconds (float): Seconds between checks for documents changed by other processes, 0 to disable (defaults to 30).
+        max_segments (int): Number of index segments above which they are merged (defaults to 8).
+    """
+    enabled: bool = True
+    path: str = "/tmp/documentsrag-lexical"
+    limit: int = 10
+    rrf_k: int = 60
+    identifier_shortcut: bool = True
+    refresh_seconds: float = 30
+    max_segments: int = 8
+
+    class Config:
+        env_prefix = "LEXICAL_"
+
+
+class ProfilingSettings(BaseSettings):
+    """
+    Settings class for profiling single API requests on demand.
+
+    Attributes:
+        admin_token (str): Token an admin sends in the profiling header to profile a request, empty to disable profiling (defaults to "").
+        header (str): Request header carrying the admin token (defaults to "X-Profile-Token").
+        interval_seconds (float): Seconds between two stack samples (defaults to 0.005).
+        output_dir (str): Directory the collapsed stacks and the memory report of every profiled request are written to (defaults to "/tmp/documentsrag-profiles").
+        trace_memory (bool): Flag indicating whether the memory peak and top allocations are tracked with tracemalloc (defaults to True).
+        memory_frames (int): Number of frames tracemalloc keeps per allocation (defaults to 1).
+        include_idle (bool): Flag indicating whether samples of threads waiting on a selector, lock or queue are kept (defaults to False).
+    """
+    admin_token: str = ""
+    header: str = "X-Profile-Token"
+    interval_seconds: float = 0.005
+    output_dir: str = "/tmp/documentsrag-profiles"
+    trace_memory: bool = True
+    memory_frames: int = 1
+    include_idle: bool = False
+
+    class Config:
+        env_prefix = "PROFILING_"
+
+
 # Instances of settings classes
 mongo = MongoDBSettings()
 api = APISettings()
+openai = OpenAISettings()
+embedding = EmbeddingSettings()
+queue = QueueSettings()
+upload = UploadSettings()
+parser = ParserSettings()
+github = GithubSettings()
+vector_store = VectorStoreSettings()
+answer_cache = AnswerCacheSettings()
+retriever = RetrieverSettings()
+lexical = LexicalSettings()
+profiling = ProfilingSettings()
@@ -0,0 +1,64 @@
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Seconds, from an in-process vector search up to a long completion or a large PDF
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "documentsrag_stage_seconds", "Duration of the ingestion and chat pipeline stages.", ["stage"], buckets=BUCKETS)
+# Children are bound once, recording a value then skips the label lookup
+UPLOAD_SAVE_SECONDS = STAGE_SECONDS.labels("upload_save")
+PARSE_SECONDS = STAGE_SECONDS.labels("parse")
+CHUNK_SECONDS = STAGE_SECONDS.labels("chunk")
+EMBED_BATCH_SECONDS = STAGE_SECONDS.labels("embed_batch")
+MONGO_WRITE_SECONDS = STAGE_SECONDS.labels("mongo_write")
+EXPANSION_SECONDS = STAGE_SECONDS.labels("expansion")
+VECTOR_SEARCH_SECONDS = STAGE_SECONDS.labels("vector_search")
+LLM_COMPLETION_SECONDS = STAGE_SECONDS.labels("llm_completion")
+GIT_CLONE_SECONDS = STAGE_SECONDS.labels("git_clone")
+GIT_FETCH_SECONDS = STAGE_SECONDS.labels("git_fetch")
+GIT_CHECKOUT_SECONDS = STAGE_SECONDS.labels("git_checkout")
+
+TOKENS = Counter("documentsrag_tokens", "Tokens sent to the embedding model or generated by the chat model.", ["kind"])
+EMBEDDED_TOKENS = TOKENS.labels("embedded")
+GENERATED_TOKENS = TOKENS.labels("generated")
+
+CACHE_LOOKUPS = Counter("documentsrag_cache_lookups", "Cache lookups by cache and result.", ["cache", "result"])
+EMBEDDING_CACHE_HITS = CACHE_LOOKUPS.labels("embedding", "hit")
+EMBEDDING_CACHE_MISSES = CACHE_LOOKUPS.labels("embedding", "miss")
+EXPANSION_CACHE_HITS = CACHE_LOOKUPS.labels("expansion", "hit")
+EXPANSION_CACHE_MISSES = CACHE_LOOKUPS.labels("expansion", "miss")
+ANSWER_CACHE_HITS = CACHE_LOOKUPS.labels("answer", "hit")
+ANSWER_CACHE_MISSES = CACHE_LOOKUPS.labels("answer", "miss")
+
+IN_FLIGHT_REQUESTS = Gauge("documentsrag_in_flight_requests", "HTTP requests being served.")
+
+
+class InFlightMiddleware:
+    """
+    Counts the HTTP requests being served, streamed responses until their last byte.
+
+    A plain ASGI middleware, it adds a gauge increment and decrement to every request and nothing else.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        IN_FLIGHT_REQUESTS.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            IN_FLIGHT_REQUESTS.dec()
+
+
+async def metrics(request: Request) -> Response:
+    """
+    Serves the metrics of the process in the Prometheus text format.
+    """
+    return Response(generate_latest(REGISTRY), media_type=CONTENT_TYPE_LATEST)
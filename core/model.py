@@ -1,7 +1,10 @@
 from pydantic import BaseModel
+from typing import Literal, Optional
 
 
 class ChatRequest(BaseModel):
     document_id: str
     question: str
     filters: dict
+    # Overrides the deployment's RETRIEVER_EXPANSION_MODE for this request
+    expansion: Optional[Literal["off", "cached", "on"]] = None
@@ -0,0 +1,284 @@
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from typing import Any, AsyncIterator, Callable, Coroutine, Dict, Optional
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+from starlette.responses import StreamingResponse
+from loguru import logger
+
+from config.settings import profiling
+from exceptions.exceptions import AuthenticationFailed
+
+# Innermost frames of a thread blocked until it has work: the event loop, a pool worker, a lock or queue
+IDLE_FRAMES = {("selectors.py", "select"), ("thread.py", "_worker"), ("threading.py", "wait"), ("queue.py", "get")}
+
+# tracemalloc and the sampler are process wide, so a single request is profiled at a time
+PROFILE_LOCK = threading.Lock()
+
+
+def short_path(path: str) -> str:
+    """
+    Strips the longest sys.path entry from a source file path.
+    """
+    for root in sorted((entry for entry in sys.path if entry), key=len, reverse=True):
+        if path.startswith(root + os.sep):
+            return path[len(root) + 1:]
+    return path
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of every thread of the process from a background thread.
+
+    The stacks are aggregated in the collapsed format read by flamegraph.pl and speedscope, one line per
+    distinct stack: the thread name and the frames from the outermost, separated by semicolons, then
+    the number of samples. Frames are labelled by function, not by line, so a flame graph shows one
+    box per function call. While the profiled request awaits, the event loop serves other requests and
+    their frames are sampled too.
+    """
+
+    def __init__(self, interval: float, include_idle: bool = False):
+        self.interval = interval
+        self.include_idle = include_idle
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._labels: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if not self.include_idle and \
+                        (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in IDLE_FRAMES:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                self.stacks[";".join(reversed(labels))] += 1
+
+
+class MemoryTracker:
+    """
+    Tracks the memory peak of a request with tracemalloc, relative to the memory traced when it started.
+
+    tracemalloc is started for the request and stopped after it, unless it was already tracing.
+    """
+
+    def __init__(self, frames: int = 1, top: int = 20):
+        self.frames = frames
+        self.top = top
+        self._started = False
+        self._baseline = 0
+
+    def start(self):
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+
+    def stop(self) -> dict:
+        """
+        Returns the peak and retained bytes, and the source lines holding the most retained memory.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        # The sampler allocates while the request runs, leave it and tracemalloc out of the top allocations
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)])
+        if self._started:
+            tracemalloc.stop()
+        return {
+            "peak_bytes": peak - self._baseline,
+            "retained_bytes": current - self._baseline,
+            "top_allocations": [
+                {"location": str(statistic.traceback), "size_bytes": statistic.size, "count": statistic.count}
+                for statistic in snapshot.statistics("lineno")[:self.top]
+            ],
+        }
+
+
+class RequestProfile:
+    """
+    Profiles a single request and writes the report to PROFILING_OUTPUT_DIR.
+
+    Two files are named after the profile id: `<id>.collapsed` holds the sampled stacks, ready for
+    flamegraph.pl or speedscope, and `<id>.json` the request, its duration and the memory report.
+    """
+
+    def __init__(self, method: str, path: str):
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.profiler = SamplingProfiler(profiling.interval_seconds, profiling.include_idle)
+        self.memory = MemoryTracker(profiling.memory_frames) if profiling.trace_memory else None
+        self.report: Optional[dict] = None
+        self._started = 0.0
+
+    def start(self):
+        if self.memory:
+            self.memory.start()
+        self._started = time.perf_counter()
+        self.profiler.start()
+
+    def finish(self, status_code: Optional[int], error: Optional[BaseException] = None) -> dict:
+        """
+        Stops profiling and writes the report, returns the report.
+
+        The files are small and only written for profiled requests, so they are written from the event loop.
+        """
+        self.profiler.stop()
+        seconds = time.perf_counter() - self._started
+        self.report = {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": status_code,
+            "error": repr(error) if error else None,
+            "seconds": round(seconds, 6),
+            "interval_seconds": self.profiler.interval,
+            "samples": self.profiler.samples,
+            "memory": self.memory.stop() if self.memory else None,
+        }
+        try:
+            os.makedirs(profiling.output_dir, exist_ok=True)
+            with open(os.path.join(profiling.output_dir, f"{self.id}.collapsed"), "w") as file:
+                file.write(self.profiler.collapsed())
+            with open(os.path.join(profiling.output_dir, f"{self.id}.json"), "w") as file:
+                json.dump(self.report, file, indent=2)
+        except OSError as e:
+            logger.error(f"Failed to write profile {self.id}: {str(e)}")
+        logger.info(f"Profiled {self.method} {self.path} in {seconds:.3f}s as {self.id}")
+        return self.report
+
+    def set_headers(self, response: Response):
+        response.headers["X-Profile-Id"] = self.id
+        if self.report:
+            response.headers["X-Profile-Seconds"] = f"{self.report['seconds']:.6f}"
+            response.headers["X-Profile-Samples"] = str(self.report["samples"])
+            if self.report["memory"]:
+                response.headers["X-Profile-Memory-Peak"] = str(self.report["memory"]["peak_bytes"])
+
+
+class ProfiledStream:
+    """
+    Passes a streamed body through and finishes the profile after its last chunk.
+
+    The profile is also finished when the stream fails, is cancelled or is dropped before being read,
+    like when the client disconnects before the first chunk, so the profile lock is always released.
+    """
+
+    def __init__(self, body: AsyncIterator, profile: RequestProfile, status_code: int):
+        self.body = body.__aiter__()
+        self.profile = profile
+        self.status_code = status_code
+        self.finished = False
+
+    def __aiter__(self) -> "ProfiledStream":
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.body.__anext__()
+        except StopAsyncIteration:
+            self.finish()
+            raise
+        except BaseException as e:
+            self.finish(e)
+            raise
+
+    def finish(self, error: Optional[BaseException] = None):
+        if self.finished:
+            return
+        self.finished = True
+        try:
+            self.profile.finish(self.status_code, error)
+        finally:
+            PROFILE_LOCK.release()
+
+    def __del__(self):
+        self.finish()
+
+
+class ProfiledRoute(APIRoute):
+    """
+    An APIRoute that profiles the requests carrying PROFILING_ADMIN_TOKEN in the PROFILING_HEADER header.
+
+    A profiled request runs under the SamplingProfiler and the MemoryTracker, from the parsing of its body
+    to its last byte for streamed responses, and its report is written to PROFILING_OUTPUT_DIR. The
+    response carries the profile id in X-Profile-Id and, when not streamed, the duration, number of samples
+    and memory peak. When another request is being profiled, the request is served without profiling and
+    the response says so with X-Profile-Status: busy.
+
+    With PROFILING_ADMIN_TOKEN empty the route handler is FastAPI's own, so profiling costs nothing; when
+    set, a request without the header costs a header lookup.
+    """
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+        if not profiling.admin_token:
+            return handler
+
+        async def profiled_handler(request: Request) -> Response:
+            token = request.headers.get(profiling.header)
+            if token is None:
+                return await handler(request)
+            if not hmac.compare_digest(token.encode(), profiling.admin_token.encode()):
+                raise AuthenticationFailed(message="Invalid profiling token")
+            if not PROFILE_LOCK.acquire(blocking=False):
+                response = await handler(request)
+                response.headers["X-Profile-Status"] = "busy"
+                return response
+
+            profile = RequestProfile(request.method, request.url.path)
+            try:
+                profile.start()
+                response = await handler(request)
+            except BaseException as e:
+                try:
+                    profile.finish(None, e)
+                finally:
+                    PROFILE_LOCK.release()
+                raise
+
+            if isinstance(response, StreamingResponse):
+                response.body_iterator = ProfiledStream(response.body_iterator, profile, response.status_code)
+            else:
+                try:
+                    profile.finish(response.status_code)
+                finally:
+                    PROFILE_LOCK.release()
+            profile.set_headers(response)
+            return response
+
+        return profiled_handler
@@ -1,19 +1,88 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from typing import Callable
 from loguru import logger
 
-from config.settings import api
-from config.settings import api
+from config.settings import api, queue, vector_store, lexical
 from routes.router import base_router as router
+from models.document import DocumentRepository
+from models.embedded_document import EmbeddedDocumentRepository
+from vendor.mongodb import create_mongodb_client
+from vendor.openai import create_openai_client, get_embedding_cache
+from vendor.parser import create_document_parser
+from vendor.worker import create_ingestion_worker
+from vendor.vector_store import create_vector_store
+from vendor.lexical import create_lexical_index
+from vendor.chat import create_answer_cache
+from core.metrics import InFlightMiddleware, metrics
 from exceptions.exceptions import RAGAPIError, EntityDoesNotExistError, InvalidOperationError, AuthenticationFailed, InvalidTokenError, ServiceError, TypeError
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates the clients shared by every request at startup and closes them on shutdown.
+
+    Also runs QUEUE_WORKERS in-process ingestion workers, which hand their documents back to the
+    queue when the application stops, and loads and refreshes an in-process vector store. With
+    API_WARM_UP, the heavy OpenAI dependencies are loaded in a background thread once the
+    application accepts requests.
+    """
+    app.state.mongo_client = create_mongodb_client()
+    app.state.openai_client = create_openai_client()
+    app.state.document_parser = create_document_parser()
+    await DocumentRepository(database=app.state.mongo_client.db).ensure_indexes()
+    await EmbeddedDocumentRepository(database=app.state.mongo_client.db).ensure_indexes()
+    app.state.vector_store = create_vector_store(app.state.mongo_client)
+    await app.state.vector_store.load()
+    app.state.lexical_index = create_lexical_index(app.state.mongo_client)
+    if app.state.lexical_index is not None:
+        await app.state.lexical_index.load()
+    app.state.answer_cache = create_answer_cache(app.state.openai_client, app.state.mongo_client)
+
+    stop_workers = asyncio.Event()
+    workers = [
+        asyncio.create_task(create_ingestion_worker(
+            app.state.openai_client, app.state.mongo_client, app.state.document_parser,
+            app.state.vector_store, app.state.lexical_index).run(stop_workers))
+        for _ in range(queue.workers)
+    ]
+    if vector_store.backend == "numpy" and vector_store.refresh_seconds > 0:
+        workers.append(asyncio.create_task(
+            app.state.vector_store.watch(stop_workers, vector_store.refresh_seconds)))
+    if app.state.lexical_index is not None and lexical.refresh_seconds > 0:
+        workers.append(asyncio.create_task(
+            app.state.lexical_index.watch(stop_workers, lexical.refresh_seconds)))
+    if api.warm_up:
+        workers.append(asyncio.create_task(asyncio.to_thread(app.state.openai_client.warm_up)))
+    try:
+        yield
+    finally:
+        stop_workers.set()
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        app.state.document_parser.executor.shutdown(cancel_futures=True)
+        await app.state.openai_client.close()
+        app.state.mongo_client.close()
+        embedding_cache = get_embedding_cache()
+        if embedding_cache is not None:
+            embedding_cache.close()
+            get_embedding_cache.cache_clear()
+
+
 app = FastAPI(
     title=api.project_name,
     debug=api.debug,
-    version=api.version
+    version=api.version,
+    lifespan=lifespan
 )
 app.include_router(router, prefix=api.prefix)
+if api.metrics_path:
+    app.add_route(api.metrics_path, metrics, include_in_schema=False)
+    app.add_middleware(InFlightMiddleware)
 
 
 def create_exception_handler(
@@ -0,0 +1,70 @@
+"""
+Rewrites the vectors of the embedded documents in another storage format.
+
+Usage:
+    python migrate_vectors.py --format float16
+    python migrate_vectors.py --format float --batch-size 500
+
+Rows already in the target format are skipped, so an interrupted migration can be run again.
+Set EMBEDDING_VECTOR_FORMAT to the same format so new chunks are written in it too.
+"""
+import argparse
+import asyncio
+import time
+from loguru import logger
+from pymongo import UpdateOne
+
+import core.logging
+from config.settings import mongo
+from vendor.mongodb import create_mongodb_client
+from utils.vectors import VECTOR_FORMATS, encode_vector, decode_vector
+
+
+async def migrate(vector_format: str, batch_size: int):
+    """
+    Converts every embedded document not stored in `vector_format`, in bulk writes of `batch_size` rows.
+
+    Args:
+        vector_format (str): One of "float", "float16" and "int8".
+        batch_size (int): The number of rows per bulk write.
+    """
+    mongo_client = create_mongodb_client()
+    collection = mongo_client.db[mongo.embedded_collection]
+    if vector_format == "float":
+        query = {"vector_format": {"$nin": [None, "float"]}}
+    else:
+        query = {"vector_format": {"$ne": vector_format}}
+
+    started = time.perf_counter()
+    migrated = 0
+    try:
+        cursor = collection.find(
+            query, {"vector_chunk": 1, "vector_format": 1, "vector_scale": 1}, batch_size=batch_size)
+        updates = []
+        async for row in cursor:
+            vector = decode_vector(row["vector_chunk"], row.get("vector_format"), row.get("vector_scale"))
+            data, scale = encode_vector(vector, vector_format)
+            if vector_format == "float":
+                update = {"$set": {"vector_chunk": data}, "$unset": {"vector_format": "", "vector_scale": ""}}
+            else:
+                update = {"$set": {"vector_chunk": data, "vector_format": vector_format, "vector_scale": scale}}
+            updates.append(UpdateOne({"_id": row["_id"]}, update))
+            if len(updates) >= batch_size:
+                await collection.bulk_write(updates, ordered=False)
+                migrated += len(updates)
+                updates = []
+                logger.info(f"Migrated {migrated} vectors")
+        if updates:
+            await collection.bulk_write(updates, ordered=False)
+            migrated += len(updates)
+    finally:
+        mongo_client.close()
+    logger.info(f"Migrated {migrated} vectors to {vector_format} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=VECTOR_FORMATS, required=True)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(migrate(args.format, args.batch_size))
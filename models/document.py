@@ -1,9 +1,11 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from pydantic import BaseModel, Field, field_validator, ValidationInfo
-from typing import Literal, Dict
-from pydantic_mongo import AbstractRepository, ObjectIdField
+from typing import Literal, Dict, List, Optional
+from pydantic_mongo import ObjectIdField
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
 from bson import ObjectId
 
+from models.repository import AsyncAbstractRepository
 from exceptions.exceptions import EntityDoesNotExistError, TypeError as TError
 
 
@@ -16,7 +18,16 @@ class Document(BaseModel):
         name (str): The name of the document.
         type (str): The type of the document.
         url (str, optional): The URL of the document (required if type is 'github').
-        status (Literal["pending", "completed"]): The status of the document, which can be either "pending" or "completed".
+        status (Literal["pending", "processing", "completed", "failed"]): The status of the document. Uploaded documents are queued as "pending", move to "processing" while a worker holds their lease and end as "completed" or "failed".
+        path (str, optional): The staged file a worker ingests, set for queued uploads.
+        content_hash (str, optional): The sha256 hex digest of the uploaded file.
+        size (int, optional): The size of the uploaded file in bytes.
+        commit_sha (str, optional): The last commit of a 'github' repository whose files are embedded.
+        lease_owner (str, optional): The worker currently processing the document.
+        lease_expires_at (datetime, optional): The UTC time after which another worker may reclaim the document.
+        attempts (int): The number of times a worker claimed the document.
+        chunks_version (int): Incremented every time the embedded chunks of the document change, so the in-process indexes and the answer cache of every process notice it.
+        error (str, optional): The error of the last failed attempt.
         created_at (datetime): The timestamp indicating when the document was created. Defaults to the current datetime when not provided.
         updated_at (datetime): The timestamp indicating when the document was last updated. Defaults to the current datetime when not provided.
     """
@@ -24,8 +35,17 @@ class Document(BaseModel):
         default_factory=ObjectIdField, primary_key=True, alias="_id")
     name: str
     type: Literal['txt', 'docx', 'doc', 'pdf', 'ppt', 'github']
-    url: str = None
-    status: Literal["pending", "completed"]
+    url: Optional[str] = None
+    status: Literal["pending", "processing", "completed", "failed"]
+    path: Optional[str] = None
+    content_hash: Optional[str] = None
+    size: Optional[int] = None
+    commit_sha: Optional[str] = None
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[datetime] = None
+    attempts: int = 0
+    chunks_version: int = 0
+    error: Optional[str] = None
     created_at: datetime = datetime.now()
     updated_at: datetime = datetime.now()
 
@@ -38,7 +58,7 @@ class Document(BaseModel):
         return v
 
 
-class DocumentRepository(AbstractRepository[Document]):
+class DocumentRepository(AsyncAbstractRepository[Document]):
     """
     Repository class for interacting with the 'documents' collection.
 
@@ -49,21 +69,88 @@ class DocumentRepository(AbstractRepository[Document]):
     class Meta:
         collection_name = 'documents'
 
+    async def ensure_indexes(self):
+        """
+        Creates the indexes used to claim queued documents.
+        """
+        await self.get_collection().create_index(
+            [("status", ASCENDING), ("lease_expires_at", ASCENDING)])
+        await self.get_collection().create_index(
+            [("content_hash", ASCENDING)], sparse=True)
+        await self.get_collection().create_index(
+            [("url", ASCENDING)], sparse=True)
+
+    async def find_by_content_hash(self, content_hash: str, statuses: List[str]) -> Optional[Document]:
+        """
+        Finds the oldest document with the given content hash.
+
+        Args:
+            content_hash (str): The sha256 hex digest of the uploaded file.
+            statuses (List[str]): The statuses a matching document may have.
+
+        Returns:
+            Optional[Document]: The matching document, or None when no identical document exists.
+        """
+        document = await self.get_collection().find_one(
+            {"content_hash": content_hash, "status": {"$in": statuses}},
+            sort=[("_id", ASCENDING)])
+        return self.to_model(document) if document else None
+
+    async def find_by_url(self, url: str) -> Optional[Document]:
+        """
+        Finds the latest 'github' document of a repository URL.
+
+        Args:
+            url (str): The repository URL.
+
+        Returns:
+            Optional[Document]: The matching document, or None when the repository was never ingested.
+        """
+        document = await self.get_collection().find_one(
+            {"url": url, "type": "github"}, sort=[("_id", DESCENDING)])
+        return self.to_model(document) if document else None
+
     async def get_document(self, document_id: str) -> Document:
+        if not ObjectId.is_valid(document_id):
+            raise EntityDoesNotExistError(message="Document not found")
         collection = self.get_collection()
-        document = collection.find_one({"_id": document_id})
+        document = await collection.find_one({"_id": ObjectId(document_id)})
         if not document:
             raise EntityDoesNotExistError(message="Document not found")
         return document
 
+    async def get_chunks_version(self, document_id: str) -> Optional[int]:
+        """
+        Returns the version of the embedded chunks of a document, without loading it.
+
+        Args:
+            document_id (str): The ID of the document.
+
+        Returns:
+            Optional[int]: The chunks version, or None when the document does not exist.
+        """
+        if not ObjectId.is_valid(document_id):
+            return None
+        document = await self.get_collection().find_one({"_id": ObjectId(document_id)}, {"chunks_version": 1})
+        return document.get("chunks_version", 0) if document else None
+
+    async def bump_chunks_version(self, document_id: str):
+        """
+        Records that the embedded chunks of a document were written or deleted.
+
+        Args:
+            document_id (str): The ID of the document.
+        """
+        await self.get_collection().update_one({"_id": ObjectId(document_id)}, {"$inc": {"chunks_version": 1}})
+
     async def delete_document(self, document_id: str) -> int:
         collection = self.get_collection()
-        response = collection.delete_one({"_id": ObjectId(document_id)})
+        response = await collection.delete_one({"_id": ObjectId(document_id)})
         if response.deleted_count == 0:
             raise EntityDoesNotExistError(message="Document not found")
         return response.deleted_count
 
-    def update_document(self, filters: Dict[str, str], update_data: Dict[str, str]) -> int:
+    async def update_document(self, filters: Dict[str, str], update_data: Dict[str, str]) -> int:
         """
         Update documents in the MongoDB collection based on partial matching filters and partial update data.
 
@@ -79,7 +166,117 @@ class DocumentRepository(AbstractRepository[Document]):
 
         # Execute the update operation
         collection = self.get_collection()
-        response = collection.update_one(filters, update_query)
+        response = await collection.update_one(filters, update_query)
         if response.modified_count == 0:
             raise EntityDoesNotExistError(message="Document not found")
         return response.modified_count
+
+    async def requeue_document(self, document_id: str, update_data: Dict[str, str]) -> bool:
+        """
+        Queues a document again for ingestion, unless a worker is processing it.
+
+        Args:
+            document_id (str): The ID of the document.
+            update_data (Dict[str, str]): The fields to set besides the queue state, e.g. the new staged path.
+
+        Returns:
+            bool: False when the document is being processed and was not updated.
+        """
+        response = await self.get_collection().update_one(
+            {"_id": ObjectId(document_id), "status": {"$ne": "processing"}},
+            {"$set": {**update_data, "status": "pending", "attempts": 0, "error": None,
+                      "lease_owner": None, "lease_expires_at": None, "updated_at": datetime.now()}},
+        )
+        return response.matched_count == 1
+
+    async def claim_document(self, owner: str, lease_seconds: int, max_attempts: int) -> Optional[Document]:
+        """
+        Atomically claims the oldest queued document, or one whose lease expired, for a worker.
+
+        Args:
+            owner (str): The identifier of the claiming worker.
+            lease_seconds (int): How long the claim holds without a heartbeat.
+            max_attempts (int): Documents claimed this many times are not claimed again.
+
+        Returns:
+            Optional[Document]: The claimed document, or None when the queue is empty.
+        """
+        # Leases are compared across hosts, so they are kept in UTC whatever the local time zone
+        now = datetime.now(timezone.utc)
+        document = await self.get_collection().find_one_and_update(
+            {
+                "path": {"$ne": None},
+                "attempts": {"$lt": max_attempts},
+                "$or": [
+                    {"status": "pending"},
+                    {"status": "processing", "lease_expires_at": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": "processing",
+                    "lease_owner": owner,
+                    "lease_expires_at": now + timedelta(seconds=lease_seconds),
+                    "updated_at": datetime.now(),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("_id", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        return self.to_model(document) if document else None
+
+    async def renew_lease(self, document_id: ObjectId, owner: str, lease_seconds: int) -> bool:
+        """
+        Extends the lease a worker holds on a document.
+
+        Args:
+            document_id (ObjectId): The ID of the claimed document.
+            owner (str): The identifier of the worker holding the lease.
+            lease_seconds (int): The new lease duration from now.
+
+        Returns:
+            bool: False when the worker no longer holds the lease.
+        """
+        response = await self.get_collection().update_one(
+            {"_id": document_id, "status": "processing", "lease_owner": owner},
+            {"$set": {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=lease_seconds),
+                      "updated_at": datetime.now()}},
+        )
+        return response.matched_count == 1
+
+    async def release_document(self, document_id: ObjectId, owner: str, update_data: Dict[str, str]) -> bool:
+        """
+        Records the outcome of a claimed document and drops the worker's lease.
+
+        Args:
+            document_id (ObjectId): The ID of the claimed document.
+            owner (str): The identifier of the worker holding the lease.
+            update_data (Dict[str, str]): The fields to set, e.g. the new status.
+
+        Returns:
+            bool: False when the worker no longer held the lease and nothing was updated.
+        """
+        response = await self.get_collection().update_one(
+            {"_id": document_id, "lease_owner": owner},
+            {"$set": {**update_data, "lease_owner": None, "lease_expires_at": None, "updated_at": datetime.now()}},
+        )
+        return response.matched_count == 1
+
+    async def fail_expired_documents(self, max_attempts: int) -> int:
+        """
+        Marks documents as failed once their last allowed attempt lost its lease.
+
+        Args:
+            max_attempts (int): The number of attempts a document is allowed.
+
+        Returns:
+            int: The number of documents marked as failed.
+        """
+        response = await self.get_collection().update_many(
+            {"status": "processing", "lease_expires_at": {"$lt": datetime.now(timezone.utc)},
+             "attempts": {"$gte": max_attempts}},
+            {"$set": {"status": "failed", "error": "Lease expired on the last attempt",
+                      "lease_owner": None, "lease_expires_at": None, "updated_at": datetime.now()}},
+        )
+        return response.modified_count
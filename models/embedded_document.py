@@ -1,11 +1,14 @@
 from datetime import datetime
 from pydantic import BaseModel, Field
-from pydantic_mongo import AbstractRepository, ObjectIdField
-from typing import Optional, List, Dict, Mapping
-from pymongo.database import Database
+from pydantic_mongo import ObjectIdField
+from typing import Optional, List, Dict, Mapping, Union
+from pymongo import ASCENDING
+from bson import ObjectId
 
-from config.settings import mongo
+from config.settings import mongo, embedding
+from models.repository import AsyncAbstractRepository
 from exceptions.exceptions import EntityDoesNotExistError
+from utils.vectors import encode_vector
 
 
 class EmbeddedDocument(BaseModel):
@@ -16,8 +19,12 @@ class EmbeddedDocument(BaseModel):
         id (ObjectIdField): The unique identifier of the document.
         chunk_id (str): The ID of the chunk.
         documents_id (str): The ID of the documents.
+        file_name (Optional[str]): The name of the source file of the chunk.
         raw_chunk (str): The raw chunk data.
-        vector_chunk (List[float]): The vector chunk data.
+        content_hash (Optional[str]): The sha256 hex digest of the raw chunk, used to re-embed only changed chunks.
+        vector_chunk (Union[List[float], bytes]): The vector chunk data, an array of doubles or packed in the vector_format.
+        vector_format (Optional[str]): "float16" or "int8" for packed vectors, None for an array of doubles.
+        vector_scale (Optional[float]): The scale factor multiplying a packed vector.
         token_count (int): The count of tokens.
         created_at (datetime): The timestamp indicating when the document was created. Defaults to the current datetime when not provided.
         expires_at (Optional[datetime]): The timestamp indicating when the document expires (if applicable).
@@ -26,14 +33,18 @@ class EmbeddedDocument(BaseModel):
         default_factory=ObjectIdField, primary_key=True, alias="_id")
     chunk_id: str
     documents_id: str
+    file_name: Optional[str] = None
     raw_chunk: str
-    vector_chunk: List[float]
+    content_hash: Optional[str] = None
+    vector_chunk: Union[List[float], bytes]
+    vector_format: Optional[str] = None
+    vector_scale: Optional[float] = None
     token_count: int
     created_at: datetime = datetime.now()
     expires_at: Optional[datetime]
 
 
-class EmbeddedDocumentRepository(AbstractRepository[EmbeddedDocument]):
+class EmbeddedDocumentRepository(AsyncAbstractRepository[EmbeddedDocument]):
     """
     Repository class for interacting with the 'embedded_documents' collection.
     """
@@ -41,9 +52,121 @@ class EmbeddedDocumentRepository(AbstractRepository[EmbeddedDocument]):
     class Meta:
         collection_name = mongo.embedded_collection
 
+    @staticmethod
+    def to_document(model: EmbeddedDocument) -> dict:
+        """
+        Converts a model to a MongoDB document, packing a float vector in the configured storage format.
+
+        Args:
+            model (EmbeddedDocument): The model to convert.
+
+        Returns:
+            dict: The document, with the model id stored as _id.
+        """
+        data = AsyncAbstractRepository.to_document(model)
+        if model.vector_format is None and embedding.vector_format != "float":
+            data["vector_chunk"], data["vector_scale"] = encode_vector(model.vector_chunk, embedding.vector_format)
+            data["vector_format"] = embedding.vector_format
+        return data
+
+    async def ensure_indexes(self):
+        """
+        Creates the index used to look up the chunks of a document, or of some of its files.
+        """
+        await self.get_collection().create_index([("documents_id", ASCENDING), ("file_name", ASCENDING)])
+
+    async def clone_embedded_documents(self, source_id: str, target_id: str, file_name: str):
+        """
+        Copies the chunks of a document to another document on the server, without re-embedding them.
+
+        Args:
+            source_id (str): The ID of the document whose chunks are copied.
+            target_id (str): The ID of the document receiving the copies.
+            file_name (str): The file name stored on the copies.
+        """
+        collection = self.get_collection()
+        pipeline = [
+            {"$match": {"documents_id": source_id}},
+            {"$unset": "_id"},
+            {"$set": {
+                "documents_id": target_id,
+                "file_name": file_name,
+                # Chunk ids are "<documents_id>-<position>", keep the position
+                "chunk_id": {"$concat": [target_id, "-", {"$arrayElemAt": [{"$split": ["$chunk_id", "-"]}, -1]}]},
+                "created_at": datetime.now(),
+            }},
+            {"$merge": {"into": collection.name, "whenMatched": "fail", "whenNotMatched": "insert"}},
+        ]
+        await collection.aggregate(pipeline).to_list(length=None)
+
+    async def find_chunk_hashes(self, documents_id: str, file_names: List[str] = None) -> List[Dict]:
+        """
+        Lists the chunks of a document without their vectors.
+
+        Args:
+            documents_id (str): The ID of the document.
+            file_names (List[str], optional): Only list the chunks of these files. Defaults to every chunk.
+
+        Returns:
+            List[Dict]: The _id, chunk_id, file_name and content_hash of every chunk.
+        """
+        filter = {"documents_id": documents_id}
+        if file_names is not None:
+            filter["file_name"] = {"$in": file_names}
+        cursor = self.get_collection().find(
+            filter, {"_id": 1, "chunk_id": 1, "file_name": 1, "content_hash": 1})
+        return await cursor.to_list(length=None)
+
+    async def find_last_chunk_position(self, documents_id: str) -> int:
+        """
+        Returns the highest position in the chunk ids of a document, 0 when it has no chunks.
+
+        Args:
+            documents_id (str): The ID of the document.
+        """
+        pipeline = [
+            {"$match": {"documents_id": documents_id}},
+            # Chunk ids are "<documents_id>-<position>"
+            {"$group": {"_id": None, "position": {
+                "$max": {"$toInt": {"$arrayElemAt": [{"$split": ["$chunk_id", "-"]}, -1]}}}}},
+        ]
+        result = await self.get_collection().aggregate(pipeline).to_list(length=None)
+        return (result[0]["position"] or 0) if result else 0
+
+    async def rename_embedded_documents(self, documents_id: str, file_name: str) -> int:
+        """
+        Sets the file name on the chunks of a document that still carry another one.
+
+        Args:
+            documents_id (str): The ID of the document.
+            file_name (str): The file name stored on the chunks.
+
+        Returns:
+            int: The number of chunks updated.
+        """
+        response = await self.get_collection().update_many(
+            {"documents_id": documents_id, "file_name": {"$ne": file_name}},
+            {"$set": {"file_name": file_name}})
+        return response.modified_count
+
+    async def delete_by_ids(self, ids: List[ObjectId]) -> int:
+        """
+        Deletes chunks by _id in a single operation.
+
+        Args:
+            ids (List[ObjectId]): The _ids of the chunks to delete.
+
+        Returns:
+            int: The number of chunks deleted.
+        """
+        if not ids:
+            return 0
+        response = await self.get_collection().delete_many({"_id": {"$in": ids}})
+        return response.deleted_count
+
     async def delete_embedded_documents(self, filter: Mapping[str, str]) -> int:
         collection = self.get_collection()
-        response = collection.delete_many(filter)
+        response = await collection.delete_many(filter)
         if response.deleted_count == 0:
             raise EntityDoesNotExistError(message="Document not found")
         return response.deleted_count
@@ -0,0 +1,227 @@
+import asyncio
+from typing import Any, Dict, Generic, Iterable, List, Optional, TypeVar, Union
+from pydantic import BaseModel
+from pymongo import UpdateOne
+from pymongo.results import DeleteResult, InsertOneResult, UpdateResult
+from motor.motor_asyncio import AsyncIOMotorCollection, AsyncIOMotorDatabase
+
+from config.settings import mongo
+from core.metrics import MONGO_WRITE_SECONDS
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class AsyncAbstractRepository(Generic[T]):
+    """
+    Asynchronous counterpart of pydantic_mongo's AbstractRepository backed by Motor.
+
+    Subclasses declare the model as the generic argument and the collection in an inner Meta class,
+    exactly like pydantic_mongo repositories, and every database call is awaited instead of blocking
+    the event loop.
+
+    Attributes:
+        Meta (class): Inner class containing metadata for the repository.
+            collection_name (str): The name of the MongoDB collection.
+    """
+    class Meta:
+        collection_name: str
+
+    def __init__(self, database: AsyncIOMotorDatabase):
+        """
+        Initializes the repository.
+
+        Args:
+            database (AsyncIOMotorDatabase): The Motor database holding the collection.
+        """
+        self._database = database
+        self._document_class = self.__orig_bases__[0].__args__[0]
+        self._collection_name = self.Meta.collection_name
+        if "id" not in self._document_class.model_fields:
+            raise Exception("Document class should have id field")
+        if not self._collection_name:
+            raise Exception("Meta should contain collection name")
+
+    def get_collection(self) -> AsyncIOMotorCollection:
+        """
+        Returns the Motor collection of the repository.
+        """
+        return self._database[self._collection_name]
+
+    @staticmethod
+    def to_document(model: T) -> dict:
+        """
+        Converts a model to a MongoDB document.
+
+        Args:
+            model (T): The model to convert.
+
+        Returns:
+            dict: The document, with the model id stored as _id.
+        """
+        data = model.model_dump()
+        data.pop("id")
+        if model.id:
+            data["_id"] = model.id
+        return data
+
+    def to_model(self, data: dict) -> T:
+        """
+        Converts a MongoDB document to a model.
+
+        Args:
+            data (dict): The document to convert.
+
+        Returns:
+            T: The model.
+        """
+        data = data.copy()
+        # Models declaring the id with an "_id" alias validate the raw document as is
+        if "_id" in data and self._document_class.model_fields["id"].alias != "_id":
+            data["id"] = data.pop("_id")
+        return self._document_class.model_validate(data)
+
+    async def save(self, model: T) -> Union[InsertOneResult, UpdateResult]:
+        """
+        Saves a model, updating it when it has an id and inserting it otherwise.
+
+        Args:
+            model (T): The model to save.
+
+        Returns:
+            Union[InsertOneResult, UpdateResult]: The result of the write.
+        """
+        document = self.to_document(model)
+        if model.id:
+            mongo_id = document.pop("_id")
+            return await self.get_collection().update_one(
+                {"_id": mongo_id}, {"$set": document}, upsert=True)
+
+        result = await self.get_collection().insert_one(document)
+        model.id = result.inserted_id
+        return result
+
+    async def save_many(self, models: Iterable[T]):
+        """
+        Saves many models with bulk writes of at most MONGO_WRITE_BATCH_SIZE models.
+
+        Every batch is converted to documents just before it is written, and other tasks run between
+        batches, so saving the chunks of a large document does not hold the event loop.
+
+        Args:
+            models (Iterable[T]): The models to save.
+        """
+        models_to_insert = []
+        models_to_update = []
+        for model in models:
+            if model.id:
+                models_to_update.append(model)
+            else:
+                models_to_insert.append(model)
+
+        collection = self.get_collection()
+        batch_size = mongo.write_batch_size
+        for start in range(0, len(models_to_insert), batch_size):
+            batch = models_to_insert[start:start + batch_size]
+            documents = [self.to_document(model) for model in batch]
+            with MONGO_WRITE_SECONDS.time():
+                result = await collection.insert_many(documents)
+            for model, inserted_id in zip(batch, result.inserted_ids):
+                model.id = inserted_id
+            await asyncio.sleep(0)
+
+        for start in range(0, len(models_to_update), batch_size):
+            documents = [self.to_document(model) for model in models_to_update[start:start + batch_size]]
+            with MONGO_WRITE_SECONDS.time():
+                await collection.bulk_write([
+                    UpdateOne({"_id": document.pop("_id")}, {"$set": document}, upsert=True)
+                    for document in documents
+                ], ordered=False)
+            await asyncio.sleep(0)
+
+    async def delete(self, model: T) -> DeleteResult:
+        """
+        Deletes a model.
+
+        Args:
+            model (T): The model to delete.
+
+        Returns:
+            DeleteResult: The result of the delete.
+        """
+        return await self.get_collection().delete_one({"_id": model.id})
+
+    async def delete_by_id(self, _id: Any) -> DeleteResult:
+        """
+        Deletes a model by id.
+
+        Args:
+            _id (Any): The id of the model.
+
+        Returns:
+            DeleteResult: The result of the delete.
+        """
+        return await self.get_collection().delete_one({"_id": _id})
+
+    async def find_one_by_id(self, _id: Any) -> Optional[T]:
+        """
+        Finds a model by id.
+
+        Args:
+            _id (Any): The id of the model, of the same type as the id field, ie. ObjectId.
+
+        Returns:
+            Optional[T]: The model, or None when it does not exist.
+        """
+        return await self.find_one_by({"_id": _id})
+
+    async def find_one_by(self, query: dict) -> Optional[T]:
+        """
+        Finds a model by mongo query.
+
+        Args:
+            query (dict): The mongo query.
+
+        Returns:
+            Optional[T]: The first matching model, or None when nothing matches.
+        """
+        result = await self.get_collection().find_one(self._map_id(query))
+        return self.to_model(result) if result else None
+
+    async def find_by(
+        self,
+        query: dict,
+        skip: Optional[int] = None,
+        limit: Optional[int] = None,
+        sort: Optional[List[tuple]] = None,
+        projection: Optional[Dict[str, int]] = None,
+    ) -> List[T]:
+        """
+        Finds models by mongo query.
+
+        Args:
+            query (dict): The mongo query.
+            skip (Optional[int]): Number of matches to skip.
+            limit (Optional[int]): Maximum number of matches to return.
+            sort (Optional[List[tuple]]): Sort specification as (field, direction) pairs.
+            projection (Optional[Dict[str, int]]): Fields to include or exclude.
+
+        Returns:
+            List[T]: The matching models.
+        """
+        cursor = self.get_collection().find(
+            self._map_id(query), self._map_id(projection) if projection else None)
+        if skip:
+            cursor = cursor.skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+        if sort:
+            cursor = cursor.sort(
+                [("_id" if key == "id" else key, direction) for key, direction in sort])
+        return [self.to_model(document) async for document in cursor]
+
+    @staticmethod
+    def _map_id(data: dict) -> dict:
+        data = data.copy()
+        if "id" in data:
+            data["_id"] = data.pop("id")
+        return data
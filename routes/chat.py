@@ -1,10 +1,12 @@
 from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 
 from core.model import ChatRequest
+from core.profiling import ProfiledRoute
 from services.chat_handler import ChatHandler
 from vendor.chat import get_chat_handler
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 
 @router.post("/chat/", tags=["chat"], summary="Chat with ai and get response")
@@ -14,3 +16,17 @@ async def chat(
 ):
     response = await chat_handler.chat(chatRequest)
     return response
+
+
+@router.post("/chat/stream", tags=["chat"], summary="Chat with ai and stream the response as Server-Sent Events",
+             response_class=StreamingResponse, responses={200: {"content": {"text/event-stream": {}}}})
+async def chat_stream(
+    chatRequest: ChatRequest,
+    chat_handler: ChatHandler = Depends(get_chat_handler)
+):
+    return StreamingResponse(
+        chat_handler.stream(chatRequest),
+        media_type="text/event-stream",
+        # Keep proxies from buffering the events
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,19 +1,59 @@
-from fastapi import APIRouter, Depends
-from typing import List
-from fastapi import File, UploadFile
+from fastapi import APIRouter, Depends, Request
+from typing import Literal
 
+from core.profiling import ProfiledRoute
 from services.document_handler import DocumentHandler
 from vendor.document import get_document_handler
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 
-@router.post("/documents/", tags=["documents"], summary="Upload and process documents")
+# The body is streamed by the handler instead of being parsed into UploadFiles,
+# so the multipart schema is declared by hand for the API docs
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "required": ["files"],
+                    "properties": {
+                        "files": {"type": "array", "items": {"type": "string", "format": "binary"}}
+                    }
+                }
+            }
+        }
+    }
+}
+
+
+@router.post("/documents/", tags=["documents"], summary="Upload documents and queue them for processing", openapi_extra=UPLOAD_REQUEST_BODY)
 async def add_documents(
-    files: List[UploadFile] = File(...),
+    request: Request,
+    dedup: Literal["reuse", "clone", "off"] = "reuse",
+    doc_handler: DocumentHandler = Depends(get_document_handler)
+):
+    response = await doc_handler.process(request, dedup)
+    return response
+
+
+@router.get("/documents/{document_id}", tags=["documents"], summary="Get document processing status by id")
+async def get_document(
+    document_id: str,
+    doc_handler: DocumentHandler = Depends(get_document_handler)
+):
+    response = await doc_handler.get(document_id)
+    return response
+
+
+@router.put("/documents/{document_id}", tags=["documents"], summary="Upload a new version of a document and queue it for re-processing", openapi_extra=UPLOAD_REQUEST_BODY)
+async def update_document(
+    document_id: str,
+    request: Request,
     doc_handler: DocumentHandler = Depends(get_document_handler)
 ):
-    response = await doc_handler.process(files)
+    response = await doc_handler.update(document_id, request)
     return response
 
 
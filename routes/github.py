@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends
 
+from core.profiling import ProfiledRoute
 from services.github_handler import GithubHandler
 from vendor.github import get_github_handler
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 
 @router.post("/github/", tags=["github"], summary="Process github repo to embed")
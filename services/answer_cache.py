@@ -0,0 +1,185 @@
+import json
+from typing import Dict, List, Tuple
+import numpy as np
+from loguru import logger
+
+from core.model import ChatRequest
+from services.openai_client import OpenAIClient
+from services.database import MongoDBAtlasClient
+from models.document import DocumentRepository
+from utils.cache import TTLCache
+from utils.utils import normalize_question
+from core.metrics import ANSWER_CACHE_HITS, ANSWER_CACHE_MISSES
+
+
+class CachedAnswer:
+    """
+    An answer kept by the AnswerCache.
+
+    Attributes:
+        answer (str): The answer, html-escaped lines joined by newlines.
+        sources (List[dict]): The ranked sources the answer was generated from.
+        vector (np.ndarray): The normalized embedding of the question.
+        version: The chunks version of the document when the answer was generated.
+    """
+
+    def __init__(self, answer: str, sources: List[dict], vector: np.ndarray, version):
+        self.answer = answer
+        self.sources = sources
+        self.vector = vector
+        self.version = version
+
+
+class AnswerLookup:
+    """
+    The outcome of an AnswerCache lookup, passed back to `AnswerCache.store` on a miss.
+
+    Attributes:
+        answer (str, optional): The cached answer, None on a miss.
+        sources (List[dict]): The sources of the cached answer.
+        question (str): The question looked up.
+        bucket (tuple): The document id and filters the answer is valid for.
+        key (tuple): The bucket and the normalized question.
+        vector (np.ndarray, optional): The normalized embedding of the question, when it was needed.
+        version: The chunks version of the document read before the lookup.
+    """
+
+    def __init__(self, question: str, bucket: tuple, key: tuple, version):
+        self.answer = None
+        self.sources = []
+        self.question = question
+        self.bucket = bucket
+        self.key = key
+        self.vector = None
+        self.version = version
+
+    @property
+    def hit(self) -> bool:
+        return self.answer is not None
+
+
+class AnswerCache:
+    """
+    Caches chat answers per document and filters, matching new questions by embedding similarity.
+
+    A question hits when it normalizes to a cached question, or when its embedding has a cosine similarity of
+    at least `threshold` with one. Entries expire after `ttl_seconds` and the least recently used are evicted
+    beyond `max_items`.
+
+    Entries remember the chunks version of their document, which changes whenever its chunks are ingested,
+    updated or deleted, in this process or another, but not when its status or lease changes. A lookup
+    reading a different chunks version drops the cached answers of the document. Answers are therefore only
+    valid when generated from the chunks of their document alone, and the ChatHandler scopes retrieval to it.
+    """
+
+    def __init__(self, openai: OpenAIClient, mongo_client: MongoDBAtlasClient, threshold: float = 0.95,
+                 max_items: int = 10000, ttl_seconds: float = 3600):
+        """
+        Initializes the AnswerCache.
+
+        Args:
+            openai (OpenAIClient): OpenAI client for embedding questions.
+            mongo_client (MongoDBAtlasClient): MongoDB client for reading document chunks versions.
+            threshold (float, optional): The cosine similarity from which a question reuses a cached answer. Defaults to 0.95.
+            max_items (int, optional): The number of answers kept. Defaults to 10000.
+            ttl_seconds (float, optional): How long an answer stays valid. Defaults to 3600.
+        """
+        self.openai = openai
+        self.mongo_client = mongo_client
+        self.threshold = threshold
+        self.entries: TTLCache[tuple, CachedAnswer] = TTLCache(max_items, ttl_seconds, on_evict=self._on_evict)
+        self._buckets: Dict[tuple, Dict[tuple, None]] = {}
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    async def lookup(self, chatRequest: ChatRequest) -> AnswerLookup:
+        """
+        Looks up a cached answer for a chat request.
+
+        Args:
+            chatRequest (ChatRequest): Chat request object containing user query.
+
+        Returns:
+            AnswerLookup: The lookup, with the cached answer on a hit.
+        """
+        bucket = (chatRequest.document_id, json.dumps(chatRequest.filters, sort_keys=True, default=str))
+        key = (bucket, normalize_question(chatRequest.question))
+        document_repo = DocumentRepository(database=self.mongo_client.db)
+        lookup = AnswerLookup(chatRequest.question, bucket, key,
+                              await document_repo.get_chunks_version(chatRequest.document_id))
+
+        candidates: List[Tuple[tuple, CachedAnswer]] = []
+        for cached_key in list(self._buckets.get(bucket, ())):
+            entry = self.entries.peek(cached_key)
+            if entry is None:
+                continue
+            if entry.version != lookup.version:
+                self.invalidate(chatRequest.document_id)
+                candidates = []
+                break
+            candidates.append((cached_key, entry))
+
+        entry = self.entries.get(key) if candidates else None
+        if entry is None and candidates:
+            lookup.vector = await self._embed(chatRequest.question)
+            scores = np.stack([candidate.vector for _, candidate in candidates]) @ lookup.vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                entry = self.entries.get(candidates[best][0])
+                self.semantic_hits += 1
+
+        if entry is None:
+            self.misses += 1
+            ANSWER_CACHE_MISSES.inc()
+            return lookup
+        self.hits += 1
+        ANSWER_CACHE_HITS.inc()
+        lookup.answer, lookup.sources = entry.answer, entry.sources
+        return lookup
+
+    async def store(self, lookup: AnswerLookup, answer: str, sources: List[dict]):
+        """
+        Caches the answer generated after a missed lookup.
+
+        Args:
+            lookup (AnswerLookup): The missed lookup.
+            answer (str): The answer, html-escaped lines joined by newlines.
+            sources (List[dict]): The ranked sources the answer was generated from.
+        """
+        if lookup.vector is None:
+            lookup.vector = await self._embed(lookup.question)
+        self.entries.set(lookup.key, CachedAnswer(answer, sources, lookup.vector, lookup.version))
+        self._buckets.setdefault(lookup.bucket, {})[lookup.key] = None
+
+    def invalidate(self, document_id: str) -> int:
+        """
+        Drops the cached answers of a document.
+
+        Args:
+            document_id (str): The ID of the document.
+
+        Returns:
+            int: The number of answers dropped.
+        """
+        keys = [key for bucket, keys in self._buckets.items() if bucket[0] == document_id for key in keys]
+        for key in keys:
+            self.entries.pop(key)
+        if keys:
+            logger.info(f"Dropped {len(keys)} cached answers of document {document_id}")
+        return len(keys)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "semantic_hits": self.semantic_hits, "misses": self.misses,
+                "items": len(self.entries)}
+
+    async def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray((await self.openai.create_embeddings([question]))[0], dtype=np.float32)
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _on_evict(self, key: tuple, entry: CachedAnswer):
+        keys = self._buckets.get(key[0])
+        if keys is not None:
+            keys.pop(key, None)
+            if not keys:
+                del self._buckets[key[0]]
@@ -1,10 +1,15 @@
+import asyncio
 import json
+import time
+from typing import AsyncIterator, Optional
+from loguru import logger
 from fastapi import HTTPException
 
 from services.openai_client import OpenAIClient
 from services.database import MongoDBAtlasClient
 from services.api_response import Response
 from services.vector_retriever import VectorRetriever
+from services.answer_cache import AnswerCache, AnswerLookup
 from core.model import ChatRequest
 from config.settings import mongo
 
@@ -14,7 +19,8 @@ class ChatHandler:
     Handles chat operations by processing user queries and retrieving responses.
     """
 
-    def __init__(self, openai: OpenAIClient, mongo_client: MongoDBAtlasClient, retriever: VectorRetriever):
+    def __init__(self, openai: OpenAIClient, mongo_client: MongoDBAtlasClient, retriever: VectorRetriever,
+                 answer_cache: AnswerCache = None):
         """
         Initializes the ChatHandler.
 
@@ -22,10 +28,14 @@ class ChatHandler:
             openai (OpenAIClient): OpenAI client for generating chat responses.
             mongo_client (MongoDBAtlasClient): MongoDB client for database operations.
             retriever (VectorRetriever): VectorRetriever for retrieving context vectors.
+            answer_cache (AnswerCache, optional): Cache answering repeated questions without retrieval or completion.
+                Cached answers are invalidated by changes to their document only, so with a cache retrieval is
+                limited to the chunks of the requested document. Defaults to none.
         """
         self.openai = openai
         self.mongo_client = mongo_client
         self.retriever = retriever
+        self.answer_cache = answer_cache
 
     async def chat(self, chatRequest: ChatRequest):
         """
@@ -38,12 +48,19 @@ class ChatHandler:
             dict: Response dictionary containing the chat response.
         """
         try:
+            # Answer repeated questions from the cache
+            lookup = await self._lookup(chatRequest)
+            if lookup is not None and lookup.hit:
+                return Response.success(message=lookup.answer.split('\n'))
+
             # Retrieve context vectors based on the chat request
-            context = await self.retriever.invoke(chatRequest, [mongo.embedded_collection])
-            context_data = json.loads(context)[0]
+            context = json.loads(await self.retriever.invoke(self._scoped(chatRequest), [mongo.embedded_collection]))
+            context_data = context[0]
 
             # Fetch chat response using OpenAI
             api_response = await self.openai.fetch_chat_response(chatRequest.question, context_data['text'])
+            if lookup is not None and api_response:
+                await self._store(lookup, '\n'.join(api_response), self._sources(context))
 
             # Return success response
             return Response.success(message=api_response)
@@ -54,3 +71,106 @@ class ChatHandler:
                 status_code=status_code,
                 detail=response.to_dict()
             )
+
+    async def stream(self, chatRequest: ChatRequest) -> AsyncIterator[str]:
+        """
+        Processes a chat request and streams the answer as Server-Sent Events.
+
+        Emits a "retrieval" event once the context is retrieved, a "sources" event with the ranked hits,
+        a "token" event per piece of the answer as the model generates it and a final "done" event.
+        Failures are reported as an "error" event. When the client disconnects the generation is closed,
+        so abandoned answers stop being generated and billed. Cached answers are sent as a single "token" event.
+
+        Args:
+            chatRequest (ChatRequest): Chat request object containing user query.
+
+        Yields:
+            str: The next Server-Sent Event.
+        """
+        started = time.perf_counter()
+        try:
+            lookup = await self._lookup(chatRequest)
+            if lookup is not None and lookup.hit:
+                yield self._event("retrieval", {"hits": len(lookup.sources), "elapsed_ms": self._elapsed_ms(started),
+                                                "cached": True})
+                yield self._event("sources", lookup.sources)
+                yield self._event("token", {"text": lookup.answer})
+                yield self._event("done", {"elapsed_ms": self._elapsed_ms(started)})
+                return
+
+            context = json.loads(await self.retriever.invoke(self._scoped(chatRequest), [mongo.embedded_collection]))
+            yield self._event("retrieval", {"hits": len(context), "elapsed_ms": self._elapsed_ms(started)})
+            yield self._event("sources", self._sources(context))
+
+            tokens = self.openai.stream_chat_response(
+                chatRequest.question, context[0]["text"] if context else "")
+            answer = []
+            try:
+                async for token in tokens:
+                    answer.append(token)
+                    yield self._event("token", {"text": token})
+            except asyncio.CancelledError:
+                logger.info(f"Client disconnected after {self._elapsed_ms(started)} ms, generation stopped")
+                raise
+            finally:
+                await tokens.aclose()
+
+            yield self._event("done", {"elapsed_ms": self._elapsed_ms(started)})
+            if lookup is not None and answer:
+                await self._store(lookup, "".join(answer), self._sources(context))
+        except Exception as e:
+            logger.error(f"Failed to stream chat response: {e}")
+            yield self._event("error", {"message": str(e)})
+
+    async def _lookup(self, chatRequest: ChatRequest) -> Optional[AnswerLookup]:
+        """
+        Looks the request up in the answer cache, a failing cache is treated as a miss.
+
+        Returns:
+            AnswerLookup: The lookup, or None without a cache or when the lookup failed.
+        """
+        if self.answer_cache is None:
+            return None
+        try:
+            return await self.answer_cache.lookup(chatRequest)
+        except Exception as e:
+            logger.error(f"Failed to look up the answer cache: {e}")
+            return None
+
+    async def _store(self, lookup: AnswerLookup, answer: str, sources: list):
+        """
+        Caches a generated answer, the answer is still returned when caching it fails.
+        """
+        try:
+            await self.answer_cache.store(lookup, answer, sources)
+        except Exception as e:
+            logger.error(f"Failed to store the answer in the answer cache: {e}")
+
+    def _scoped(self, chatRequest: ChatRequest) -> ChatRequest:
+        """
+        Limits retrieval to the chunks of the requested document when answers are cached, since the cache only
+        notices changes to that document.
+        """
+        if self.answer_cache is None:
+            return chatRequest
+        scope = {"documents_id": chatRequest.document_id}
+        filters = {"$and": [chatRequest.filters, scope]} if chatRequest.filters else scope
+        return chatRequest.model_copy(update={"filters": filters})
+
+    @staticmethod
+    def _sources(context: list) -> list:
+        """
+        Returns the source and score of the ranked hits.
+        """
+        return [{"source": hit["source"], "score": hit["score"]} for hit in context]
+
+    @staticmethod
+    def _event(event: str, data) -> str:
+        """
+        Formats a Server-Sent Event with a JSON payload.
+        """
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    @staticmethod
+    def _elapsed_ms(started: float) -> int:
+        return round((time.perf_counter() - started) * 1000)
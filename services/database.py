@@ -1,28 +1,29 @@
 from typing import List, Union
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 
 
 class MongoDBAtlasClient:
     """
-    A class for interacting with MongoDB Atlas.
+    A class for interacting with MongoDB Atlas through the asynchronous Motor driver.
 
     Attributes:
         uri (str): The URI for connecting to MongoDB Atlas.
         db_name (str): The name of the MongoDB database.
     """
 
-    def __init__(self, uri: str, db_name: str):
+    def __init__(self, uri: str, db_name: str, **client_options):
         """
         Initialize the MongoDBAtlasClient with URI, database name, and OpenAIEmbeddings instance.
 
         Args:
             uri (str): The URI for connecting to MongoDB Atlas.
             db_name (str): The name of the MongoDB database.
+            **client_options: Connection pool, timeout and read preference options passed to the Motor client.
         """
-        self.client = MongoClient(uri)
+        self.client = AsyncIOMotorClient(uri, **client_options)
         self.db = self.client[db_name]
 
-    def get(self, collection: str, query: dict, projection: dict, return_type: str = 'single'):
+    async def get(self, collection: str, query: dict, projection: dict, return_type: str = 'single'):
         """
         Retrieve data from a MongoDB collection based on provided parameters.
 
@@ -33,7 +34,7 @@ class MongoDBAtlasClient:
             return_type (str, optional): Specifies whether to return a single document ('single') or multiple documents ('multiple'). Defaults to 'single'.
 
         Returns:
-            result: The result of the query. Either a single document or a cursor object depending on return_type.
+            result: The result of the query. Either a single document or a list of documents depending on return_type.
         """
 
         # Select the specified collection
@@ -41,8 +42,14 @@ class MongoDBAtlasClient:
 
         # Perform the query
         if return_type == 'single':
-            result = collection.find_one(query, projection)
+            result = await collection.find_one(query, projection)
         else:
-            result = collection.find(query, projection)
+            result = await collection.find(query, projection).to_list(length=None)
 
         return result
+
+    def close(self):
+        """
+        Closes the connections of the underlying client.
+        """
+        self.client.close()
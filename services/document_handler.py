@@ -1,22 +1,29 @@
-import os
+import asyncio
 import datetime
+import hashlib
+import os
 import shutil
-from fastapi import HTTPException
+from fastapi import HTTPException, Request
 from loguru import logger
 from bson import ObjectId
-from typing import List, Tuple
-from fastapi import UploadFile
+from typing import TYPE_CHECKING, List
 from pymongo.results import InsertOneResult, UpdateResult
-from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import TextLoader, PyPDFLoader, UnstructuredPowerPointLoader, UnstructuredWordDocumentLoader
 
-from utils.utils import get_token_counts
+from utils.chunker import Chunk, TokenChunker
 from services.openai_client import OpenAIClient
 from services.database import MongoDBAtlasClient
+from services.document_parser import DocumentParser
+from services.upload_receiver import UploadReceiver, ReceivedFile
+from services.vector_store import VectorStore
+from services.lexical_index import LexicalIndex
 from services.api_response import Response
 from models.embedded_document import EmbeddedDocumentRepository, EmbeddedDocument as EmbeddedDocumentModel
 from models.document import DocumentRepository, Document as DocumentModel
+from exceptions.exceptions import EntityDoesNotExistError, InvalidOperationError
+from core.metrics import CHUNK_SECONDS, PARSE_SECONDS, UPLOAD_SAVE_SECONDS
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
 
 
 class DocumentHandler:
@@ -24,72 +31,211 @@ class DocumentHandler:
     Handles document processing, including upload, processing, and deletion.
     """
 
-    def __init__(self, openai: OpenAIClient, mongo_client: MongoDBAtlasClient):
+    def __init__(self, openai: OpenAIClient, mongo_client: MongoDBAtlasClient, receiver: UploadReceiver = None, parser: DocumentParser = None,
+                 vector_store: VectorStore = None, lexical_index: LexicalIndex = None, chunker: TokenChunker = None):
         """
         Initializes the DocumentHandler with OpenAI client and MongoDB client.
 
         Args:
             openai (OpenAIClient): OpenAI client for text embedding.
             mongo_client (MongoDBAtlasClient): MongoDB client for database operations.
+            receiver (UploadReceiver, optional): Receiver streaming uploads to the staging directory. Defaults to staging in '/tmp'.
+            parser (DocumentParser, optional): Parser running the document loaders. Defaults to parsing in a thread.
+            vector_store (VectorStore, optional): Vector store kept in sync with the embedded documents. Defaults to none.
+            lexical_index (LexicalIndex, optional): BM25 index kept in sync with the embedded documents. Defaults to none.
+            chunker (TokenChunker, optional): Chunker splitting the parsed documents. Defaults to chunks of 8100 tokens
+                in sections ending at one paragraph in 4.
         """
         self.openai = openai
         self.mongo_client = mongo_client
+        self.receiver = receiver or UploadReceiver()
+        self.parser = parser or DocumentParser()
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index
+        self.chunker = chunker or TokenChunker(anchor_modulus=4)
         self.valid_documents = [
             'txt', 'docx', 'doc', 'pdf', 'ppt']
 
-    async def process(self, files: List[UploadFile]):
+    async def process(self, request: Request, dedup: str = "reuse"):
         """
-        Processes uploaded files, saves them, extracts text, creates embeddings, and stores them.
+        Streams uploaded files to the staging directory and queues them for ingestion by the workers.
+
+        Files identical to an existing document, by content hash, are never parsed or embedded again.
 
         Args:
-            files (List[UploadFile]): List of files to process.
+            request (Request): The multipart/form-data upload request.
+            dedup (str, optional): What to do with an identical upload: "reuse" returns the existing document id,
+                "clone" creates a new document sharing copies of the existing chunks and "off" ingests it again.
+                Defaults to "reuse".
 
         Returns:
-            Response: Response object indicating success or failure of the operation.
+            Response: Response object with the document id to poll for each queued file.
         """
+        # Stream every file part to its own scratch folder, hashing it on the way
+        with UPLOAD_SAVE_SECONDS.time():
+            files = await self.receiver.receive(request, self._check_file_type)
+
         results = []
         for file in files:
             try:
-                # Check file type is valid or throw value error
-                if not self._check_file_type(file.filename):
-                    raise ValueError(f"Invalid file type for {file.filename}")
-
-                # Save the file to a temp location
-                folder_path, full_file_path, file_extension, file_name = await self._save_file_temp_loc(file)
-
-                # Save document for processing
-                document_id = self._create_document(file_extension, file_name)
+                # Files with an invalid type were not written
+                if file.error:
+                    raise ValueError(file.error)
+
+                file_extension = file.file_name.rsplit('.', 1)[1].lower()
+
+                # Identical uploads are answered from the existing document before any parsing
+                if dedup != "off" and file.content_hash is not None:
+                    result = await self._deduplicate(file, file_extension, dedup)
+                    if result is not None:
+                        file.cleanup()
+                        results.append(result)
+                        continue
+
+                # Queue the document, a worker picks it up and moves it through processing
+                document_id = await self._create_document(file_extension, file)
                 if document_id is None:
                     raise ValueError("Document not saved successfully")
 
-                # Parse text from the uploaded document and loads as documents
-                documents = await self._load_document(full_file_path, file_extension)
+                results.append(
+                    {"file_name": file.file_name, "document_id": document_id, "status": "pending",
+                     "size": file.size, "content_hash": file.content_hash,
+                     "message": "Document queued for processing"})
+            except Exception as e:
+                # A failed file gets its own error entry and its staged copy removed, the others carry on
+                file.cleanup()
+                results.append({"file_name": file.file_name, "error": str(e)})
 
-                # Create embedding records for all documents given
-                vectors = await self._create_vectors(documents, document_id, file_name)
+        return Response.success(data=results)
 
-                # Store the embedded vectors in MongoDB Atlas
-                embedded_doc_repo = EmbeddedDocumentRepository(
-                    database=self.mongo_client.db)
-                embedded_doc_repo.save_many(vectors)
+    async def get(self, document_id: str):
+        """
+        Returns the processing status of a document.
 
-                document_repo = DocumentRepository(
-                    database=self.mongo_client.db)
-                document_repo.update_document(
-                    {"_id": ObjectId(document_id)}, {"status": "completed"})
+        Args:
+            document_id (str): ID of the document.
 
-                # Delete temp folder after it's usage
-                try:
-                    shutil.rmtree(folder_path)
-                except OSError as e:
-                    print("Error: %s - %s." % (e.filename, e.strerror))
+        Returns:
+            Response: Response object with the document status.
+        """
+        document_repo = DocumentRepository(database=self.mongo_client.db)
+        document = await document_repo.get_document(document_id)
+        return Response.success(data={
+            "document_id": str(document["_id"]),
+            "name": document["name"],
+            "type": document["type"],
+            "status": document["status"],
+            "attempts": document.get("attempts", 0),
+            "error": document.get("error"),
+            "created_at": document.get("created_at"),
+            "updated_at": document.get("updated_at"),
+        })
+
+    async def update(self, document_id: str, request: Request):
+        """
+        Streams a new version of a document to the staging directory and queues it for re-ingestion.
 
-                results.append(
-                    {"file_name": file_name, "message": "Document uploaded successfully"})
-            except ValueError as e:
-                results.append({"file_name": file_name, "error": str(e)})
+        The worker re-chunks the new version and only embeds the chunks that are not stored yet.
 
-        return Response.success(data=results)
+        Args:
+            document_id (str): ID of the document to update.
+            request (Request): The multipart/form-data upload request with a single file.
+
+        Returns:
+            Response: Response object with the document id to poll.
+
+        Raises:
+            EntityDoesNotExistError: If the document does not exist.
+            InvalidOperationError: If the upload is not a single valid file or the document is being processed.
+        """
+        document_repo = DocumentRepository(database=self.mongo_client.db)
+        document = await document_repo.get_document(document_id)
+        if document["type"] == "github":
+            raise InvalidOperationError(message="GitHub documents can't be updated by upload")
+
+        with UPLOAD_SAVE_SECONDS.time():
+            files = await self.receiver.receive(request, self._check_file_type)
+        if len(files) != 1 or files[0].error:
+            for file in files:
+                file.cleanup()
+            raise InvalidOperationError(
+                message=files[0].error if len(files) == 1 else "Exactly one file is expected")
+        file = files[0]
+
+        if file.content_hash == document.get("content_hash") and document["status"] == "completed":
+            file.cleanup()
+            return Response.success(data={
+                "file_name": file.file_name, "document_id": document_id, "status": "completed",
+                "size": file.size, "content_hash": file.content_hash, "message": "Document unchanged"})
+
+        queued = await document_repo.requeue_document(document_id, {
+            "name": file.file_name,
+            "type": file.file_name.rsplit('.', 1)[1].lower(),
+            "path": file.path,
+            "content_hash": file.content_hash,
+            "size": file.size,
+        })
+        if not queued:
+            file.cleanup()
+            raise InvalidOperationError(message="Document is being processed, retry once it finishes")
+
+        # A version still waiting in the queue is replaced, its staged file is not needed anymore
+        if document["status"] == "pending" and document.get("path"):
+            shutil.rmtree(os.path.dirname(document["path"]), ignore_errors=True)
+
+        return Response.success(data={
+            "file_name": file.file_name, "document_id": document_id, "status": "pending",
+            "size": file.size, "content_hash": file.content_hash, "message": "Document update queued for processing"})
+
+    async def ingest(self, document: DocumentModel):
+        """
+        Parses, embeds and stores a queued document. Called by the ingestion workers.
+
+        The chunks are compared by content hash with the chunks already stored for the document, from an
+        earlier version or an interrupted attempt. Only new chunks are embedded and only stale ones deleted.
+
+        Args:
+            document (DocumentModel): The claimed document, with the path of its staged file.
+        """
+        document_id = str(document.id)
+        file_name = document.name.replace(' ', '_')
+
+        # Parse text from the uploaded document and loads as documents
+        documents = await self._load_document(document.path, document.type)
+        chunks = await self._chunk_documents(documents)
+
+        # Match the new chunks against the stored ones, one stored row per identical chunk
+        embedded_doc_repo = EmbeddedDocumentRepository(
+            database=self.mongo_client.db)
+        stored = {}
+        last_position = 0
+        for row in await embedded_doc_repo.find_chunk_hashes(document_id):
+            stored.setdefault(row.get("content_hash"), []).append(row["_id"])
+            last_position = max(last_position, self._get_chunk_position(row["chunk_id"]))
+
+        new_chunks = []
+        for chunk in chunks:
+            rows = stored.get(self._get_chunk_hash(chunk.text))
+            if rows:
+                rows.pop()
+            else:
+                new_chunks.append(chunk)
+        stale_ids = [_id for rows in stored.values() for _id in rows]
+
+        # Create embedding records for the new chunks only, numbered after the stored ones
+        vectors = await self._create_vectors(new_chunks, document_id, file_name, start=last_position + 1)
+
+        # Store the new vectors in MongoDB Atlas before dropping the stale ones
+        await embedded_doc_repo.save_many(vectors)
+        deleted_count = await embedded_doc_repo.delete_by_ids(stale_ids)
+        renamed_count = await embedded_doc_repo.rename_embedded_documents(document_id, file_name)
+        if vectors or deleted_count or renamed_count:
+            document_repo = DocumentRepository(database=self.mongo_client.db)
+            await document_repo.bump_chunks_version(document_id)
+        await self._sync_indexes(document_id)
+        logger.info(
+            f"Document {document_id}: {len(chunks) - len(new_chunks)} chunks unchanged, "
+            f"{len(new_chunks)} embedded, {deleted_count} deleted")
 
     async def delete(self, document_id: str):
         """
@@ -119,6 +265,7 @@ class DocumentHandler:
                 {'documents_id': document_id})
             logger.info(
                 f"{e_doc_deleted_count} embedded documents deleted successfully")
+            await self._sync_indexes(document_id)
 
             return Response.success(
                 message=f"{doc_deleted_count} documents and {e_doc_deleted_count} embedded documents deleted successfully"
@@ -130,7 +277,7 @@ class DocumentHandler:
                 detail=response.to_dict()
             )
 
-    async def _load_document(self, file: str, file_extension: str) -> List[Document]:
+    async def _load_document(self, file: str, file_extension: str) -> List["Document"]:
         """
         Loads a document from the specified file based on its extension.
 
@@ -144,115 +291,140 @@ class DocumentHandler:
         Raises:
             ValueError: If the file format is not supported.
         """
-        if file_extension == "pdf":
-            loader = PyPDFLoader(file)
-        elif file_extension in ["docx", "doc"]:
-            loader = UnstructuredWordDocumentLoader(file)
-        elif file_extension == "pptx":
-            loader = UnstructuredPowerPointLoader(file)
-        elif file_extension == "txt":
-            loader = TextLoader(file)
-        else:
-            # Handle unsupported file formats
-            raise ValueError("Unsupported file format")
-
-        documents = loader.load()
+        with PARSE_SECONDS.time():
+            documents = await self.parser.load(file, file_extension)
         return documents
 
-    async def _split_text_into_chunks(self, text: str, chunk_size: int) -> List[str]:
+    async def _deduplicate(self, file: ReceivedFile, ext: str, dedup: str):
         """
-        Splits the input text into chunks of specified size.
+        Resolves an upload against an existing document with the same content hash.
 
         Args:
-            text (str): The input text to be split into chunks.
-            chunk_size (int): The size of each chunk.
+            file (ReceivedFile): The staged upload.
+            ext (str): Extension of the document.
+            dedup (str): "reuse" to return the existing document, "clone" to copy its chunks to a new document.
 
         Returns:
-            List[str]: A list of text chunks.
+            dict: The result entry for the upload, or None when no identical document exists.
         """
-        splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-            encoding_name="cl100k_base", chunk_size=chunk_size, chunk_overlap=0
+        document_repo = DocumentRepository(database=self.mongo_client.db)
+        if dedup == "clone":
+            # Only finished documents have every chunk to copy
+            existing = await document_repo.find_by_content_hash(file.content_hash, ["completed"])
+        else:
+            existing = await document_repo.find_by_content_hash(
+                file.content_hash, ["pending", "processing", "completed"])
+        if existing is None:
+            return None
+
+        existing_id = str(existing.id)
+        if dedup == "reuse":
+            logger.info(f"{file.file_name} is identical to document {existing_id}, reusing it")
+            return {"file_name": file.file_name, "document_id": existing_id, "status": existing.status,
+                    "size": file.size, "content_hash": file.content_hash, "duplicate_of": existing_id,
+                    "message": "Identical document already exists"}
+
+        # The clone stays "processing" until every chunk is copied
+        document = DocumentModel(
+            id=ObjectId(),
+            name=file.file_name,
+            type=ext,
+            status="processing",
+            content_hash=file.content_hash,
+            size=file.size
         )
-        chunks = splitter.split_text("\n".join(text))
-        return chunks
+        document_id = self._get_document_id(await document_repo.save(document))
+        if document_id is None:
+            raise ValueError("Document not saved successfully")
 
-    async def _save_file_temp_loc(self, file: UploadFile) -> Tuple[str, str, str, str]:
+        logger.info(f"{file.file_name} is identical to document {existing_id}, cloning its chunks")
+        embedded_doc_repo = EmbeddedDocumentRepository(
+            database=self.mongo_client.db)
+        try:
+            await embedded_doc_repo.clone_embedded_documents(
+                existing_id, document_id, file.file_name.replace(' ', '_'))
+        except Exception as e:
+            logger.error(f"Failed to clone the chunks of document {existing_id}: {str(e)}")
+            # Drop the chunks copied before the failure, the document keeps the error
+            try:
+                await embedded_doc_repo.delete_embedded_documents({"documents_id": document_id})
+            except EntityDoesNotExistError:
+                pass
+            await document_repo.update_document(
+                {"_id": ObjectId(document_id)}, {"status": "failed", "error": str(e)})
+            raise ValueError(f"Failed to clone document {existing_id}") from e
+
+        await document_repo.update_document({"_id": ObjectId(document_id)}, {"status": "completed"})
+        await document_repo.bump_chunks_version(document_id)
+        await self._sync_indexes(document_id)
+        return {"file_name": file.file_name, "document_id": document_id, "status": "completed",
+                "size": file.size, "content_hash": file.content_hash, "duplicate_of": existing_id,
+                "message": "Document cloned from an identical document"}
+
+    async def _chunk_documents(self, documents: List["Document"]) -> List[Chunk]:
         """
-        Saves the uploaded file to a temporary location and returns the path and file extension.
+        Splits the given documents into chunks, tokenizing their text once in a thread.
+
+        Documents larger than a chunk are first cut into sections at content-defined paragraph breaks, so an
+        edit only changes the chunks of its own section instead of shifting every chunk boundary after it.
 
         Args:
-            file (UploadFile): The uploaded file.
+            documents (List[Document]): List of documents.
 
         Returns:
-            Tuple[str, str]: The path to the saved file and the file extension.
+            List[Chunk]: The text chunks with their token counts.
         """
-        file_name = file.filename
-        temp_folder_path = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-        mounted_path = '/tmp'
-        folder_path = os.path.join(mounted_path, temp_folder_path)
-        if not os.path.exists(folder_path):
-            os.makedirs(folder_path)
-        full_file_path = os.path.join(folder_path, file_name)
-
-        # Save the uploaded file to a temporary location
-        with open(full_file_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
-
-        file_extension = file_name.rsplit('.', 1)[1].lower()
+        text = "\n".join(d.page_content for d in documents)
+        with CHUNK_SECONDS.time():
+            return await asyncio.to_thread(self.chunker.split, text)
 
-        return folder_path, full_file_path, file_extension, file_name
-
-    async def _create_vectors(self, documents: List[Document], document_id: str, file_name: str) -> List[EmbeddedDocumentModel]:
+    async def _create_vectors(self, chunks: List[Chunk], document_id: str, file_name: str, start: int = 1) -> List[EmbeddedDocumentModel]:
         """
-        Create embedding vectors for the given documents.
+        Create embedding vectors for the given chunks.
 
         Args:
-            documents (List[Document]): List of documents.
+            chunks (List[Chunk]): List of text chunks with their token counts.
             document_id (str): ID of the document.
             file_name (str): Name of the file.
+            start (int, optional): Position of the first chunk in its chunk id. Defaults to 1.
 
         Returns:
             List[EmbeddedDocumentModel]: List of embedded document models.
         """
-        texts = [d.page_content for d in documents]
-        tokens = sum([get_token_counts(d) for d in texts])
-        # model limit is 8192
-        chunk_size = tokens if tokens < 8100 else 8100
-        chunks = await self._split_text_into_chunks(texts, chunk_size)
-
         created_at = datetime.datetime.now()
         expires_at = created_at + datetime.timedelta(days=1)
         vectors = []
-        doc_id = 1
 
-        for chunk in chunks:
+        # Embed all chunks in batched requests, results come back in chunk order
+        embeddings = await self.openai.create_embeddings(
+            [chunk.text for chunk in chunks], [chunk.token_count for chunk in chunks])
+
+        for doc_id, ((chunk, token_count), vector_text) in enumerate(zip(chunks, embeddings), start=start):
             unique_id = document_id + '-' + str(doc_id)
-            token_count = get_token_counts(chunk)
-            vector_text = await self.openai.create_embedding(chunk)
             vectors.append(
                 EmbeddedDocumentModel(
                     id=ObjectId(),
                     chunk_id=unique_id,
                     documents_id=document_id,
-                    file_name=file_name.replace(' ', '_'),
+                    file_name=file_name,
                     raw_chunk=chunk,
-                    vector_chunk=vector_text[0],
+                    content_hash=self._get_chunk_hash(chunk),
+                    vector_chunk=vector_text,
                     token_count=token_count,
                     created_at=created_at,
                     expires_at=expires_at
                 )
             )
-            doc_id += 1
 
         return vectors
 
-    def _create_document(self, ext: str, file_name: str):
+    async def _create_document(self, ext: str, file: ReceivedFile):
         """
         Saves the document in the DocumentRepository and returns its ID.
 
         Args:
             ext (str): Extension of the document.
-            file_name (str): Name of the file.
+            file (ReceivedFile): The staged upload to ingest.
 
         Returns:
             str: ID of the saved document.
@@ -262,13 +434,16 @@ class DocumentHandler:
 
         document = DocumentModel(
             id=ObjectId(),
-            name=file_name,
+            name=file.file_name,
             type=ext,
-            status="pending"
+            status="pending",
+            path=file.path,
+            content_hash=file.content_hash,
+            size=file.size
         )
         document_repo = DocumentRepository(
             database=self.mongo_client.db)
-        response = document_repo.save(document)
+        response = await document_repo.save(document)
 
         return self._get_document_id(response)
 
@@ -294,6 +469,31 @@ class DocumentHandler:
         else:
             return None
 
+    async def _sync_indexes(self, document_id: str):
+        """
+        Brings the chunks of a document up to date in the vector store and the lexical index, when attached.
+
+        Args:
+            document_id (str): ID of the document.
+        """
+        if self.vector_store is not None:
+            await self.vector_store.sync_document(document_id)
+        if self.lexical_index is not None:
+            await self.lexical_index.sync_document(document_id)
+
+    def _get_chunk_hash(self, chunk: str) -> str:
+        """
+        Returns the sha256 hex digest identifying the content of a chunk.
+        """
+        return hashlib.sha256(chunk.encode()).hexdigest()
+
+    def _get_chunk_position(self, chunk_id: str) -> int:
+        """
+        Returns the position from a "<documents_id>-<position>" chunk id.
+        """
+        position = chunk_id.rsplit('-', 1)[-1]
+        return int(position) if position.isdigit() else 0
+
     def _check_file_type(self, filename: str) -> bool:
         """
         Checks if the given filename has a valid extension.
@@ -0,0 +1,146 @@
+import asyncio
+import importlib
+from concurrent.futures import Executor
+from functools import lru_cache
+from typing import TYPE_CHECKING, List
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# Loader of every supported extension as "module:class", imported the first time a file of that type is loaded
+LOADERS = {
+    "pdf": "langchain_community.document_loaders.pdf:PyPDFLoader",
+    "docx": "langchain_community.document_loaders.word_document:UnstructuredWordDocumentLoader",
+    "doc": "langchain_community.document_loaders.word_document:UnstructuredWordDocumentLoader",
+    "pptx": "langchain_community.document_loaders.powerpoint:UnstructuredPowerPointLoader",
+    "ppt": "langchain_community.document_loaders.powerpoint:UnstructuredPowerPointLoader",
+    "txt": "langchain_community.document_loaders.text:TextLoader",
+}
+
+
+@lru_cache(maxsize=None)
+def get_loader_class(file_extension: str) -> type:
+    """
+    Imports the loader class of an extension, only on the first call for that loader.
+
+    Args:
+        file_extension (str): The extension of the file.
+
+    Returns:
+        type: The langchain loader class.
+
+    Raises:
+        ValueError: If the file format is not supported.
+    """
+    if file_extension not in LOADERS:
+        raise ValueError("Unsupported file format")
+    module, name = LOADERS[file_extension].split(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def load_file(file: str, file_extension: str) -> List["Document"]:
+    """
+    Loads a whole file with the loader matching its extension. Runs inside the parser pool.
+
+    Args:
+        file (str): The path to the file to be loaded.
+        file_extension (str): The extension of the file.
+
+    Returns:
+        List[Document]: A list of Document objects containing the loaded content.
+
+    Raises:
+        ValueError: If the file format is not supported.
+    """
+    loader = get_loader_class(file_extension)(file)
+    return loader.load()
+
+
+def count_pdf_pages(file: str) -> int:
+    """
+    Counts the pages of a PDF. Runs inside the parser pool.
+
+    Args:
+        file (str): The path to the PDF.
+
+    Returns:
+        int: The number of pages.
+    """
+    import pypdf
+
+    return len(pypdf.PdfReader(file).pages)
+
+
+def load_pdf_pages(file: str, start: int, end: int) -> List["Document"]:
+    """
+    Loads a range of PDF pages the same way PyPDFLoader loads a whole file. Runs inside the parser pool.
+
+    Args:
+        file (str): The path to the PDF.
+        start (int): Index of the first page to load.
+        end (int): Index after the last page to load.
+
+    Returns:
+        List[Document]: One Document per page, with the source and page number as metadata.
+    """
+    import pypdf
+    from langchain_core.documents import Document
+
+    reader = pypdf.PdfReader(file)
+    return [
+        Document(
+            page_content=reader.pages[page_number].extract_text(),
+            metadata={"source": file, "page": page_number},
+        )
+        for page_number in range(start, min(end, len(reader.pages)))
+    ]
+
+
+class DocumentParser:
+    """
+    Parses uploaded files off the event loop.
+
+    Loaders run in the given executor, normally a process pool, since PDF, Word and PowerPoint parsing is
+    CPU bound. PDFs with more than `pdf_pages_per_task` pages are split into page ranges parsed in parallel.
+
+    Attributes:
+        executor (Executor): The executor loaders run in, the default thread pool when not set.
+        pdf_pages_per_task (int): Number of PDF pages parsed by a single task.
+    """
+
+    def __init__(self, executor: Executor = None, pdf_pages_per_task: int = 50):
+        """
+        Initializes the DocumentParser.
+
+        Args:
+            executor (Executor, optional): The executor loaders run in. Defaults to the event loop's default executor.
+            pdf_pages_per_task (int, optional): Number of PDF pages parsed by a single task. Defaults to 50.
+        """
+        self.executor = executor
+        self.pdf_pages_per_task = pdf_pages_per_task
+
+    async def load(self, file: str, file_extension: str) -> List["Document"]:
+        """
+        Loads a document from the specified file based on its extension.
+
+        Args:
+            file (str): The path to the file to be loaded.
+            file_extension (str): The extension of the file.
+
+        Returns:
+            List[Document]: A list of Document objects containing the loaded content, in page order.
+        """
+        loop = asyncio.get_running_loop()
+        if file_extension != "pdf":
+            return await loop.run_in_executor(self.executor, load_file, file, file_extension)
+
+        pages = await loop.run_in_executor(self.executor, count_pdf_pages, file)
+        if pages <= self.pdf_pages_per_task:
+            return await loop.run_in_executor(self.executor, load_file, file, file_extension)
+
+        # gather keeps the order of the ranges, so pages come back in document order
+        ranges = await asyncio.gather(*(
+            loop.run_in_executor(self.executor, load_pdf_pages, file, start, start + self.pdf_pages_per_task)
+            for start in range(0, pages, self.pdf_pages_per_task)
+        ))
+        return [document for documents in ranges for document in documents]
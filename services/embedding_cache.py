@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List
+
+
+class EmbeddingCache:
+    """
+    A content-addressed cache for embeddings.
+
+    Entries are keyed by a hash of the embedding model, its dimensions and the input text. Lookups go
+    through an in-process LRU tier first and then through an optional persistent sqlite tier, which is
+    evicted by least recent access once it grows beyond `max_bytes`.
+
+    Attributes:
+        memory_items (int): Maximum number of embeddings kept in the in-process tier.
+        max_bytes (int): Maximum size of the vectors stored in the persistent tier.
+        hits (int): Number of lookups answered by either tier.
+        misses (int): Number of lookups answered by neither tier.
+        memory_hits (int): Number of lookups answered by the in-process tier.
+        persistent_hits (int): Number of lookups answered by the persistent tier.
+    """
+
+    def __init__(self, path: str = None, memory_items: int = 10000, max_bytes: int = 1024 ** 3):
+        """
+        Initializes the EmbeddingCache.
+
+        Args:
+            path (str, optional): Path of the sqlite file backing the persistent tier. Disabled when not provided.
+            memory_items (int, optional): Maximum number of embeddings kept in memory. Defaults to 10000.
+            max_bytes (int, optional): Maximum size of the persistent tier in bytes. Defaults to 1 GiB.
+        """
+        self.memory_items = memory_items
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.persistent_hits = 0
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._stored_bytes = 0
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, accessed_at REAL NOT NULL)")
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_accessed_at ON embeddings (accessed_at)")
+            self._stored_bytes = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def key(model: str, dimensions: int, text: str) -> str:
+        """
+        Builds the cache key of an embedding.
+
+        Args:
+            model (str): The embedding model name.
+            dimensions (int): The embedding dimensions.
+            text (str): The embedded text.
+
+        Returns:
+            str: The hex digest identifying the embedding.
+        """
+        return hashlib.sha256(f"{model}\0{dimensions}\0{text}".encode()).hexdigest()
+
+    async def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """
+        Looks up embeddings by key.
+
+        Args:
+            keys (Iterable[str]): The keys to look up.
+
+        Returns:
+            Dict[str, List[float]]: The cached embeddings, keys that are not cached are left out.
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+            self.memory_hits += len(found)
+
+        remaining = [key for key in keys if key not in found]
+        if remaining and self._db is not None:
+            stored = await asyncio.to_thread(self._read, remaining)
+            self.persistent_hits += len(stored)
+            self._remember(stored)
+            found.update(stored)
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    async def set_many(self, vectors: Dict[str, List[float]]):
+        """
+        Stores embeddings in both tiers.
+
+        Args:
+            vectors (Dict[str, List[float]]): The embeddings to store, by key.
+        """
+        if not vectors:
+            return
+        self._remember(vectors)
+        if self._db is not None:
+            await asyncio.to_thread(self._write, vectors)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns the hit and miss counters of the cache.
+
+        Returns:
+            Dict[str, int]: The cache counters and current sizes.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "persistent_hits": self.persistent_hits,
+            "memory_items": len(self._memory),
+            "persistent_bytes": self._stored_bytes,
+        }
+
+    def close(self):
+        """
+        Closes the persistent tier.
+        """
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+    def _remember(self, vectors: Dict[str, List[float]]):
+        with self._lock:
+            for key, vector in vectors.items():
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def _read(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        with self._lock:
+            # Stay below sqlite's bound parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch)
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE embeddings SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+                self._db.commit()
+        return found
+
+    def _write(self, vectors: Dict[str, List[float]]):
+        now = time.time()
+        with self._lock:
+            for key, vector in vectors.items():
+                blob = array("f", vector).tobytes()
+                # Keys are content addressed, an existing row already holds the same vector
+                cursor = self._db.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, vector, size, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), now))
+                if cursor.rowcount:
+                    self._stored_bytes += len(blob)
+            if self._stored_bytes > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        # Drop the least recently used rows until the tier is back under 90% of its budget
+        target = int(self.max_bytes * 0.9)
+        rows = self._db.execute(
+            "SELECT key, size FROM embeddings ORDER BY accessed_at")
+        evicted = []
+        for key, size in rows:
+            if self._stored_bytes <= target:
+                break
+            evicted.append((key,))
+            self._stored_bytes -= size
+        self._db.executemany("DELETE FROM embeddings WHERE key = ?", evicted)
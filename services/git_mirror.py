@@ -0,0 +1,189 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+from typing import Dict, List, Optional
+from loguru import logger
+
+from exceptions.exceptions import ServiceError
+from core.metrics import GIT_CHECKOUT_SECONDS, GIT_CLONE_SECONDS, GIT_FETCH_SECONDS
+
+
+class GitCheckout:
+    """
+    A working tree checked out by GitMirror.
+
+    Attributes:
+        path (str): The directory of the working tree.
+        commit (str): The SHA of the checked out commit.
+        mirror (str): The bare mirror the working tree was checked out from.
+        fetched (bool): True when an existing mirror was updated, False when it was cloned.
+        mirror_seconds (float): Time spent cloning or fetching the mirror.
+        checkout_seconds (float): Time spent checking out the working tree.
+    """
+
+    def __init__(self, path: str, commit: str, mirror: str, fetched: bool, mirror_seconds: float,
+                 checkout_seconds: float):
+        self.path = path
+        self.commit = commit
+        self.mirror = mirror
+        self.fetched = fetched
+        self.mirror_seconds = mirror_seconds
+        self.checkout_seconds = checkout_seconds
+
+    def timings(self) -> dict:
+        return {"fetch_seconds" if self.fetched else "clone_seconds": round(self.mirror_seconds, 3),
+                "checkout_seconds": round(self.checkout_seconds, 3)}
+
+
+class GitMirror:
+    """
+    Checks out repositories from a persistent cache of bare mirrors, one per repository URL.
+
+    The first checkout of a URL clones a bare mirror of its default branch, shallow by default. Later
+    checkouts only fetch the new commits into the mirror. Working trees are cloned from the mirror with
+    --shared, borrowing its objects, except from shallow mirrors, whose checked out commit git copies
+    locally. Git runs in subprocesses awaited off the event loop.
+    """
+
+    def __init__(self, cache_dir: str = "/tmp/documentsrag-git", depth: Optional[int] = 1,
+                 timeout_seconds: float = 600):
+        """
+        Initializes the GitMirror.
+
+        Args:
+            cache_dir (str, optional): The directory of the bare mirrors. Defaults to "/tmp/documentsrag-git".
+            depth (int, optional): The number of commits fetched, None for the full history. Defaults to 1.
+            timeout_seconds (float, optional): How long a git command may run. Defaults to 600.
+        """
+        self.cache_dir = cache_dir
+        self.depth = depth
+        self.timeout_seconds = timeout_seconds
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def mirror_path(self, url: str) -> str:
+        """
+        Returns the directory of the bare mirror of a repository URL.
+        """
+        name = url.rstrip("/").rsplit("/", 1)[-1].removesuffix(".git")
+        return os.path.join(self.cache_dir, f"{name}-{hashlib.sha1(url.encode()).hexdigest()[:16]}.git")
+
+    async def checkout(self, url: str, path: str) -> GitCheckout:
+        """
+        Updates the mirror of a repository and checks out its default branch.
+
+        Args:
+            url (str): The repository URL, https:// or file://.
+            path (str): The directory receiving the working tree, which must not exist or be empty.
+
+        Returns:
+            GitCheckout: The working tree, its commit and the time spent.
+
+        Raises:
+            ServiceError: If a git command fails or times out.
+        """
+        mirror = self.mirror_path(url)
+        lock = self._locks.setdefault(mirror, asyncio.Lock())
+        async with lock:
+            started = time.perf_counter()
+            fetched = os.path.isdir(mirror)
+            if fetched:
+                await self._fetch(mirror)
+            else:
+                await self._clone_mirror(url, mirror)
+            mirror_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            await self.run(["clone", "--quiet", "--shared", mirror, path])
+            commit = (await self.run(["rev-parse", "HEAD"], cwd=path)).strip()
+            checkout_seconds = time.perf_counter() - started
+
+        checkout = GitCheckout(path, commit, mirror, fetched, mirror_seconds, checkout_seconds)
+        (GIT_FETCH_SECONDS if fetched else GIT_CLONE_SECONDS).observe(mirror_seconds)
+        GIT_CHECKOUT_SECONDS.observe(checkout_seconds)
+        logger.info(f"Checked out {url} at {commit[:12]}: {checkout.timings()}")
+        return checkout
+
+    async def changed_files(self, checkout: GitCheckout, base_commit: str) -> Optional[Dict[str, str]]:
+        """
+        Lists the files changed between an earlier commit and a checkout, with `git diff --name-status`.
+
+        Renames are reported as the deletion of the old path and the addition of the new one. Runs in the
+        mirror, which keeps the earlier commits fetched even when the working tree is shallow.
+
+        Args:
+            checkout (GitCheckout): The checked out working tree.
+            base_commit (str): The SHA of the earlier commit.
+
+        Returns:
+            Optional[Dict[str, str]]: The status letter (A, M, D or T) by path, None when the earlier commit
+                is no longer in the mirror.
+        """
+        try:
+            await self.run(["cat-file", "-e", f"{base_commit}^{{commit}}"], cwd=checkout.mirror)
+        except ServiceError:
+            return None
+        output = await self.run(
+            ["diff", "--name-status", "--no-renames", "-z", base_commit, checkout.commit], cwd=checkout.mirror)
+        fields = output.split("\0")
+        return {path: status[0] for status, path in zip(fields[0::2], fields[1::2]) if path}
+
+    async def run(self, args: List[str], cwd: str = None) -> str:
+        """
+        Runs a git command without blocking the event loop.
+
+        Args:
+            args (List[str]): The git arguments.
+            cwd (str, optional): The directory the command runs in.
+
+        Returns:
+            str: The standard output of the command.
+
+        Raises:
+            ServiceError: If the command fails or times out.
+        """
+        # Fail instead of prompting for credentials of missing or private repositories
+        env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+        process = await asyncio.create_subprocess_exec(
+            "git", *args, cwd=cwd, env=env, stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout_seconds)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise ServiceError(message=f"git {args[0]} timed out after {self.timeout_seconds}s")
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode != 0:
+            raise ServiceError(message=f"git {args[0]} failed: {stderr.decode(errors='replace').strip()}")
+        return stdout.decode(errors="replace")
+
+    async def _clone_mirror(self, url: str, mirror: str):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Clone next to the final path so a failed clone never leaves a broken mirror behind
+        temporary = f"{mirror}.tmp-{os.getpid()}"
+        shutil.rmtree(temporary, ignore_errors=True)
+        try:
+            await self.run(["clone", "--quiet", "--bare", "--single-branch", *self._depth_args(), url, temporary])
+            try:
+                os.replace(temporary, mirror)
+            except OSError:
+                # Another process, e.g. a worker next to the API, cloned the same URL first: keep its mirror
+                if not os.path.isdir(mirror):
+                    raise
+                logger.info(f"Mirror {mirror} was cloned by another process, keeping it")
+        finally:
+            shutil.rmtree(temporary, ignore_errors=True)
+
+    async def _fetch(self, mirror: str):
+        # Bare clones have no fetch refspec, fetch the default branch onto itself
+        branch = (await self.run(["symbolic-ref", "HEAD"], cwd=mirror)).strip()
+        await self.run(["fetch", "--quiet", "--prune", *self._depth_args(), "origin", f"+{branch}:{branch}"],
+                       cwd=mirror)
+
+    def _depth_args(self) -> List[str]:
+        return ["--depth", str(self.depth)] if self.depth else []
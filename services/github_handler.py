@@ -1,140 +1,174 @@
+import asyncio
+import hashlib
 import os
 import datetime
 import shutil
-import requests
 import re
-import subprocess
-import uuid
+from collections import Counter
 from fastapi import HTTPException
 from loguru import logger
 from bson import ObjectId
-from typing import List, Tuple
+from typing import Dict, List, Tuple
 from fastapi import UploadFile
 from pymongo.results import InsertOneResult, UpdateResult
-from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import NotebookLoader, DirectoryLoader
 
-from utils.utils import get_token_counts
+from utils.chunker import Chunk, TokenChunker
 from services.openai_client import OpenAIClient
 from services.database import MongoDBAtlasClient
 from services.api_response import Response
+from services.repo_walker import RepoWalker
+from services.git_mirror import GitMirror, GitCheckout
+from services.vector_store import VectorStore
+from services.lexical_index import LexicalIndex
 from models.embedded_document import EmbeddedDocumentRepository, EmbeddedDocument as EmbeddedDocumentModel
 from models.document import DocumentRepository, Document as DocumentModel
+from exceptions.exceptions import ServiceError
+from core.metrics import CHUNK_SECONDS
 
 
 class GithubHandler:
     """
-    Handles document processing, including upload, processing, and deletion.
+    Handles the ingestion of GitHub repositories as a single document of type 'github'.
     """
 
-    def __init__(self, openai: OpenAIClient, mongo_client: MongoDBAtlasClient):
+    def __init__(self, openai: OpenAIClient, mongo_client: MongoDBAtlasClient, walker: RepoWalker = None,
+                 vector_store: VectorStore = None, lexical_index: LexicalIndex = None, chunker: TokenChunker = None,
+                 embed_batch_chunks: int = 256, git: GitMirror = None, allow_file_urls: bool = False):
         """
         Initializes the GithubHandler with OpenAI client and MongoDB client.
 
         Args:
             openai (OpenAIClient): OpenAI client for text embedding.
             mongo_client (MongoDBAtlasClient): MongoDB client for database operations.
+            walker (RepoWalker, optional): Walker loading the files of the clones. Defaults to the RepoWalker defaults.
+            vector_store (VectorStore, optional): Vector store kept in sync with the embedded documents. Defaults to none.
+            lexical_index (LexicalIndex, optional): BM25 index kept in sync with the embedded documents. Defaults to none.
+            chunker (TokenChunker, optional): Chunker splitting the files. Defaults to chunks of 1000 tokens.
+            embed_batch_chunks (int, optional): The number of chunks embedded and stored together. Defaults to 256.
+            git (GitMirror, optional): Mirror cache the repositories are checked out from. Defaults to the GitMirror defaults.
+            allow_file_urls (bool, optional): Whether file:// repository URLs are accepted, e.g. for tests. Defaults to False.
         """
         self.openai = openai
         self.mongo_client = mongo_client
+        self.walker = walker or RepoWalker()
+        self.vector_store = vector_store
+        self.lexical_index = lexical_index
+        self.chunker = chunker or TokenChunker(chunk_size=1000)
+        self.embed_batch_chunks = embed_batch_chunks
+        self.git = git or GitMirror()
+        self.allow_file_urls = allow_file_urls
 
     async def process(self, repo_url: str):
         """
-        Processes uploaded files, saves them, extracts text, creates embeddings, and stores them.
+        Clones a GitHub repository, loads its text files, creates embeddings, and stores them.
+
+        Files are streamed from a single walk over the clone and embedded in batches as they are read.
+        A repository ingested before is updated in place: only the files changed since its last indexed
+        commit are loaded, and only their new chunks are embedded.
 
         Args:
-            files (List[UploadFile]): List of files to process.
+            repo_url (str): URL of the GitHub repository.
 
         Returns:
-            Response: Response object indicating success or failure of the operation.
+            Response: Response object with the document id and the number of chunks and files processed.
         """
+        folder_path = None
         try:
             # Check url is valid or not
             if not self.is_valid_github_repo_url(repo_url):
                 raise ValueError(f"Invalid url {repo_url}")
 
-            repo_name = repo_url.split("/")[-1]
-            temp_folder_path = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+            repo_name = repo_url.rstrip("/").split("/")[-1].removesuffix(".git")
+            temp_folder_path = datetime.datetime.now().strftime('%Y%m%d%H%M%S%f')
             mounted_path = '/tmp'
             folder_path = os.path.join(mounted_path, temp_folder_path)
             if not os.path.exists(folder_path):
                 os.makedirs(folder_path)
                 os.chmod(folder_path, 0o755)
-            cloned_repo = await self._clone_github_repo(repo_url, folder_path)
-
-            if cloned_repo:
-                documents = await self._load_document(folder_path)
-                print(documents)
-
-                # # Save document for processing
-                # document_id = self._create_document(
-                #     'github', repo_name, repo_url)
-                # if document_id is None:
-                #     raise ValueError("Not able to process github repo")
-
-                # # Update the documet status to completed
-                # document_repo = DocumentRepository(
-                #     database=self.mongo_client.db)
-                # document_repo.update_document(
-                #     {"_id": ObjectId(document_id)}, {"status": "completed"})
-
-            # # Save the file to a temp location
-            # folder_path, full_file_path, file_extension, file_name = await self._save_file_temp_loc(file)
-
-            # # Parse text from the uploaded document and loads as documents
-            # documents = await self._load_document(full_file_path, file_extension)
-
-            # # Create embedding records for all documents given
-            # vectors = await self._create_vectors(documents, document_id, file_name)
-
-            # # Store the embedded vectors in MongoDB Atlas
-            # embedded_doc_repo = EmbeddedDocumentRepository(
-            #     database=self.mongo_client.db)
-            # embedded_doc_repo.save_many(vectors)
-
-            # document_repo = DocumentRepository(
-            #     database=self.mongo_client.db)
-            # document_repo.update_document(
-            #     {"_id": ObjectId(document_id)}, {"status": "completed"})
+            checkout = await self._clone_github_repo(repo_url, folder_path)
+
+            document_repo = DocumentRepository(
+                database=self.mongo_client.db)
+            existing = await document_repo.find_by_url(repo_url)
+            if existing is not None and existing.status == "completed" and existing.commit_sha == checkout.commit:
+                return Response.success(data={
+                    "repo_url": repo_url, "document_id": str(existing.id), "status": "completed",
+                    "commit": checkout.commit, "mode": "unchanged", "git": checkout.timings(),
+                    "message": "Repository unchanged since it was indexed"})
+
+            # Diff against the last indexed commit, re-reading every file when it can't be diffed
+            changes = None
+            if existing is not None and existing.status == "completed" and existing.commit_sha:
+                changes = await self.git.changed_files(checkout, existing.commit_sha)
+
+            if existing is not None:
+                document_id = str(existing.id)
+            else:
+                # Save document for processing
+                document_id = await self._create_document(
+                    'github', repo_name, repo_url)
+                if document_id is None:
+                    raise ValueError("Not able to process github repo")
 
+            stats = Counter()
+            try:
+                counts = await self._ingest(document_id, folder_path, stats, changes)
+            except Exception as e:
+                await document_repo.update_document(
+                    {"_id": ObjectId(document_id)}, {"status": "failed", "error": str(e), "updated_at": datetime.datetime.now()})
+                # Batches stored before the failure are searchable
+                await document_repo.bump_chunks_version(document_id)
+                raise
+
+            # Update the documet status to completed
+            await document_repo.update_document(
+                {"_id": ObjectId(document_id)},
+                {"status": "completed", "commit_sha": checkout.commit, "error": None, "updated_at": datetime.datetime.now()})
+            if counts["embedded"] or counts["deleted"]:
+                await document_repo.bump_chunks_version(document_id)
+            await self._sync_indexes(document_id)
+            mode = "full" if changes is None else "incremental"
+            logger.info(f"Github repo {repo_url} at {checkout.commit[:12]} ({mode}): chunks {counts}, files {dict(stats)}")
+
+            return Response.success(data={
+                "repo_url": repo_url, "document_id": document_id, "status": "completed",
+                "commit": checkout.commit, "mode": mode, "chunks": counts, "files": dict(stats),
+                "changed_files": None if changes is None else len(changes), "git": checkout.timings()})
+        except ValueError as e:
+            return Response.success(data={"repo_url": repo_url, "error": str(e)})
+        finally:
             # Delete temp folder after it's usage
-            # try:
-            #     shutil.rmtree(folder_path)
-            # except OSError as e:
-            #     print("Error: %s - %s." % (e.filename, e.strerror))
+            if folder_path is not None:
+                shutil.rmtree(folder_path, ignore_errors=True)
 
-            # results.append(
-            #     {"file_name": file_name, "message": "Document uploaded successfully"})
-        except ValueError as e:
-            # results.append({"file_name": file_name, "error": str(e)})
-            pass
+    def is_valid_github_repo_url(self, url):
+        # Regular expression pattern for GitHub repository URL, missing repositories fail to clone
+        pattern = r'^https?://github\.com/[a-zA-Z0-9\-_]+/[a-zA-Z0-9\-_.]+?(\.git)?/?$'
+        if re.match(pattern, url):
+            return True
+        return self.allow_file_urls and url.startswith("file:///")
 
-        return Response.success(data={})
+    async def _clone_github_repo(self, repo_url: str, folder_path: str) -> GitCheckout:
+        """
+        Checks out the default branch of a repository through the mirror cache.
 
-    def is_valid_github_repo_url(self, url):
-        # Regular expression pattern for GitHub repository URL
-        pattern = r'^https?://github\.com/[a-zA-Z0-9\-_]+/[a-zA-Z0-9\-_]+$'
+        Args:
+            repo_url (str): URL of the repository.
+            folder_path (str): The empty directory receiving the working tree.
 
-        # Check if the URL matches the pattern
-        if re.match(pattern, url):
-            # Make an HTTP GET request to the URL
-            response = requests.get(url)
-            # Check if the response status is OK (200)
-            if response.status_code == 200:
-                return True
-        return False
-
-    async def _clone_github_repo(self, repo_url: str, folder_path: str):
+        Returns:
+            GitCheckout: The working tree, its commit and the clone or fetch time.
+
+        Raises:
+            ValueError: If the repository can't be cloned or fetched.
+        """
         try:
-            subprocess.run(
-                ['git', 'clone', repo_url, folder_path], check=True)
-            return True
-        except subprocess.CalledProcessError as e:
-            print(f"Failed to clone repository: {e}")
-            return False
+            return await self.git.checkout(repo_url, folder_path)
+        except ServiceError as e:
+            logger.error(f"Failed to clone repository: {e.message}")
+            raise ValueError(f"Not able to clone github repo: {e.message}")
 
-    def _create_document(self, type: str, name: str, url: str):
+    async def _create_document(self, type: str, name: str, url: str):
         """
         Saves the document in the DocumentRepository and returns its ID.
 
@@ -154,7 +188,7 @@ class GithubHandler:
         )
         document_repo = DocumentRepository(
             database=self.mongo_client.db)
-        response = document_repo.save(document)
+        response = await document_repo.save(document)
 
         return self._get_document_id(response)
 
@@ -180,90 +214,102 @@ class GithubHandler:
         else:
             return None
 
-    async def _load_document(self, repo_path: str) -> List[Document]:
+    async def _ingest(self, document_id: str, repo_path: str, stats: Counter, changes: Dict[str, str] = None) -> dict:
         """
-        Loads a document from the specified file based on its extension.
+        Chunks the files of a cloned repository as they are read and stores their embeddings in batches.
+
+        The chunks are compared by file and content hash with the chunks already stored for the document,
+        so only new chunks are embedded. Stored chunks no longer found are deleted in one operation after
+        the new ones are saved.
 
         Args:
-            file (str): The path to the file to be loaded.
-            file_extension (str): The extension of the file.
+            document_id (str): ID of the github document.
+            repo_path (str): The path of the clone.
+            stats (Counter): Receives the number of files loaded and skipped by reason.
+            changes (Dict[str, str], optional): The git status of the files changed since the stored chunks
+                were indexed, only those files are loaded and compared. Defaults to every file.
 
         Returns:
-            List[Document]: A list of Document objects containing the loaded content.
-
-        Raises:
-            ValueError: If the file format is not supported.
+            dict: The number of chunks embedded, unchanged and deleted.
         """
-        extensions = ['txt', 'md', 'markdown', 'rst', 'py', 'js', 'ts', 'java', 'c', 'cpp', 'cs', 'go', 'rb', 'php', 'scala', 'html', 'htm', 'xml', 'json',
-                      'yaml', 'yml', 'ini', 'toml', 'cfg', 'conf', 'sh', 'bash', 'css', 'scss', 'sql', 'gitignore', 'dockerignore', 'editorconfig', 'ipynb']
-
-        for ext in extensions:
-            glob_pattern = f'**/*.{ext}'
-            try:
-                loader = None
-                if ext == 'ipynb':
-                    loader = NotebookLoader(
-                        str(repo_path), include_outputs=True, max_output_length=20, remove_newline=True)
+        embedded_doc_repo = EmbeddedDocumentRepository(
+            database=self.mongo_client.db)
+        changed_paths = None if changes is None else list(changes)
+        stored = {}
+        for row in await embedded_doc_repo.find_chunk_hashes(document_id, changed_paths):
+            stored.setdefault((row.get("file_name"), row.get("content_hash")), []).append(row["_id"])
+        position = await embedded_doc_repo.find_last_chunk_position(document_id) + 1
+
+        paths = None if changes is None else {path for path, status in changes.items() if status != "D"}
+        batch = []
+        embedded = unchanged = 0
+        async for document in self.walker.load(repo_path, stats, paths):
+            source = document.metadata["source"]
+            with CHUNK_SECONDS.time():
+                chunks = await asyncio.to_thread(self.chunker.split, document.page_content)
+            for chunk in chunks:
+                rows = stored.get((source, hashlib.sha256(chunk.text.encode()).hexdigest()))
+                if rows:
+                    rows.pop()
+                    unchanged += 1
                 else:
-                    loader = DirectoryLoader(repo_path, glob=glob_pattern)
-
-                documents = loader.load() if callable(loader.load) else []
-                print(documents)
-            except Exception as e:
-                print(
-                    f"Error loading files with pattern '{glob_pattern}': {e}")
-                continue
-
-        return documents
+                    batch.append((source, chunk))
+            if len(batch) >= self.embed_batch_chunks:
+                await embedded_doc_repo.save_many(await self._create_vectors(batch, document_id, position))
+                position += len(batch)
+                embedded += len(batch)
+                batch = []
+        if batch:
+            await embedded_doc_repo.save_many(await self._create_vectors(batch, document_id, position))
+            embedded += len(batch)
+
+        # Chunks of deleted, renamed or edited files, and of files now skipped
+        stale_ids = [_id for rows in stored.values() for _id in rows]
+        deleted = await embedded_doc_repo.delete_by_ids(stale_ids)
+        return {"embedded": embedded, "unchanged": unchanged, "deleted": deleted}
+
+    async def _create_vectors(self, chunks: List[Tuple[str, Chunk]], document_id: str, start: int = 1) -> List[EmbeddedDocumentModel]:
+        """
+        Create embedding vectors for the given chunks of files, in one batched embedding call.
 
-    async def _load_and_index_files(self, repo_path):
-        extensions = ['txt', 'md', 'markdown', 'rst', 'py', 'js', 'ts', 'java', 'c', 'cpp', 'cs', 'go', 'rb', 'php', 'scala', 'html', 'htm', 'xml', 'json',
-                      'yaml', 'yml', 'ini', 'toml', 'cfg', 'conf', 'sh', 'bash', 'css', 'scss', 'sql', 'gitignore', 'dockerignore', 'editorconfig', 'ipynb']
+        Args:
+            chunks (List[Tuple[str, Chunk]]): The path of the file and the chunk, with its token count, of every chunk.
+            document_id (str): ID of the github document.
+            start (int, optional): Position of the first chunk in its chunk id. Defaults to 1.
 
-        file_type_counts = {}
-        documents_dict = {}
+        Returns:
+            List[EmbeddedDocumentModel]: List of embedded document models, named after their file.
+        """
+        created_at = datetime.datetime.now()
+        expires_at = created_at + datetime.timedelta(days=1)
+        embeddings = await self.openai.create_embeddings(
+            [chunk.text for _, chunk in chunks], [chunk.token_count for _, chunk in chunks])
+
+        return [
+            EmbeddedDocumentModel(
+                id=ObjectId(),
+                chunk_id=document_id + '-' + str(position),
+                documents_id=document_id,
+                file_name=file_name,
+                raw_chunk=chunk,
+                content_hash=hashlib.sha256(chunk.encode()).hexdigest(),
+                vector_chunk=vector_text,
+                token_count=token_count,
+                created_at=created_at,
+                expires_at=expires_at
+            )
+            for position, ((file_name, (chunk, token_count)), vector_text)
+            in enumerate(zip(chunks, embeddings), start=start)
+        ]
+
+    async def _sync_indexes(self, document_id: str):
+        """
+        Brings the chunks of a document up to date in the vector store and the lexical index, when attached.
 
-        for ext in extensions:
-            glob_pattern = f'**/*.{ext}'
-            try:
-                loader = None
-                if ext == 'ipynb':
-                    loader = NotebookLoader(
-                        str(repo_path), include_outputs=True, max_output_length=20, remove_newline=True)
-                else:
-                    loader = DirectoryLoader(repo_path, glob=glob_pattern)
-
-                loaded_documents = loader.load() if callable(loader.load) else []
-                if loaded_documents:
-                    file_type_counts[ext] = len(loaded_documents)
-                    for doc in loaded_documents:
-                        file_path = doc.metadata['source']
-                        relative_path = os.path.relpath(file_path, repo_path)
-                        file_id = str(uuid.uuid4())
-                        doc.metadata['source'] = relative_path
-                        doc.metadata['file_id'] = file_id
-
-                        documents_dict[file_id] = doc
-            except Exception as e:
-                print(
-                    f"Error loading files with pattern '{glob_pattern}': {e}")
-                continue
-
-        # text_splitter = RecursiveCharacterTextSplitter(
-        #     chunk_size=3000, chunk_overlap=200)
-
-        # split_documents = []
-        # for file_id, original_doc in documents_dict.items():
-        #     split_docs = text_splitter.split_documents([original_doc])
-        #     for split_doc in split_docs:
-        #         split_doc.metadata['file_id'] = original_doc.metadata['file_id']
-        #         split_doc.metadata['source'] = original_doc.metadata['source']
-
-        #     split_documents.extend(split_docs)
-
-        # index = None
-        # if split_documents:
-        #     tokenized_documents = [clean_and_tokenize(
-        #         doc.page_content) for doc in split_documents]
-        #     index = BM25Okapi(tokenized_documents)
-        # return index, split_documents, file_type_counts, [doc.metadata['source'] for doc in split_documents]
+        Args:
+            document_id (str): ID of the document.
+        """
+        if self.vector_store is not None:
+            await self.vector_store.sync_document(document_id)
+        if self.lexical_index is not None:
+            await self.lexical_index.sync_document(document_id)
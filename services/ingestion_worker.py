@@ -0,0 +1,132 @@
+import asyncio
+import os
+import shutil
+import socket
+import uuid
+from loguru import logger
+
+from services.document_handler import DocumentHandler
+from models.document import DocumentRepository, Document as DocumentModel
+
+
+class IngestionWorker:
+    """
+    Claims queued documents from the documents collection and ingests them.
+
+    Any number of workers, in any number of processes or nodes, can share the queue. A worker claims
+    a document with a lease, renews it with heartbeats while ingesting and releases it with the final
+    status. Documents whose lease expires, because their worker died, are claimed again by others.
+
+    Attributes:
+        document_handler (DocumentHandler): Handler used to ingest claimed documents.
+        owner (str): Identifier of the worker stored on the documents it leases.
+    """
+
+    def __init__(self, document_handler: DocumentHandler, lease_seconds: int = 300, heartbeat_seconds: int = 30,
+                 poll_interval: float = 1.0, max_attempts: int = 3, owner: str = None):
+        """
+        Initializes the IngestionWorker.
+
+        Args:
+            document_handler (DocumentHandler): Handler used to ingest claimed documents.
+            lease_seconds (int, optional): How long a claim holds without a heartbeat. Defaults to 300.
+            heartbeat_seconds (int, optional): Interval at which the lease is renewed. Defaults to 30.
+            poll_interval (float, optional): Seconds to wait before polling an empty queue again. Defaults to 1.
+            max_attempts (int, optional): Number of claims before a document is marked as failed. Defaults to 3.
+            owner (str, optional): Identifier of the worker. Defaults to the host name, pid and a random suffix.
+        """
+        self.document_handler = document_handler
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.document_repo = DocumentRepository(
+            database=document_handler.mongo_client.db)
+
+    async def run(self, stop: asyncio.Event):
+        """
+        Processes queued documents until `stop` is set.
+
+        Args:
+            stop (asyncio.Event): Event signalling the worker to shut down.
+        """
+        logger.info(f"Ingestion worker {self.owner} started")
+        while not stop.is_set():
+            try:
+                await self.document_repo.fail_expired_documents(self.max_attempts)
+                if await self.process_next():
+                    continue
+            except Exception as e:
+                logger.error(f"Ingestion worker {self.owner} failed to poll the queue: {e}")
+
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+        logger.info(f"Ingestion worker {self.owner} stopped")
+
+    async def process_next(self) -> bool:
+        """
+        Claims and ingests a single queued document.
+
+        Returns:
+            bool: True when a document was claimed, False when the queue was empty.
+        """
+        document = await self.document_repo.claim_document(
+            self.owner, self.lease_seconds, self.max_attempts)
+        if document is None:
+            return False
+
+        logger.info(
+            f"Ingesting document {document.id} (attempt {document.attempts})")
+        ingestion = asyncio.create_task(self.document_handler.ingest(document))
+        heartbeat = asyncio.create_task(self._heartbeat(document, ingestion))
+        try:
+            await ingestion
+        except asyncio.CancelledError:
+            if heartbeat.done() and not heartbeat.cancelled():
+                # The lease was lost and another worker owns the document now
+                return True
+            # Shutting down, hand the document back to the queue straight away
+            await self.document_repo.release_document(
+                document.id, self.owner, {"status": "pending", "attempts": document.attempts - 1})
+            raise
+        except Exception as e:
+            logger.error(f"Failed to ingest document {document.id}: {e}")
+            final = document.attempts >= self.max_attempts
+            await self.document_repo.release_document(
+                document.id, self.owner, {"status": "failed" if final else "pending", "error": str(e)})
+            if final:
+                self._remove_staged_file(document)
+            return True
+        finally:
+            heartbeat.cancel()
+
+        if await self.document_repo.release_document(document.id, self.owner, {"status": "completed", "error": None}):
+            self._remove_staged_file(document)
+            logger.info(f"Document {document.id} ingested")
+        return True
+
+    async def _heartbeat(self, document: DocumentModel, ingestion: asyncio.Task):
+        """
+        Renews the lease on a document while it is ingested, and cancels the ingestion if the lease is lost.
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                renewed = await self.document_repo.renew_lease(
+                    document.id, self.owner, self.lease_seconds)
+            except Exception as e:
+                logger.warning(f"Failed to renew lease on document {document.id}: {e}")
+                continue
+            if not renewed:
+                logger.warning(f"Lost lease on document {document.id}, abandoning it")
+                ingestion.cancel()
+                return
+
+    def _remove_staged_file(self, document: DocumentModel):
+        try:
+            shutil.rmtree(os.path.dirname(document.path))
+        except OSError as e:
+            print("Error: %s - %s." % (e.filename, e.strerror))
@@ -0,0 +1,419 @@
+import asyncio
+import fcntl
+import json
+import math
+import os
+import re
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional
+import numpy as np
+from loguru import logger
+
+from services.database import MongoDBAtlasClient
+from services.synced_index import SyncedIndex, match_filters
+
+WORD = re.compile(r"[A-Za-z0-9_]+")
+# Splits identifiers into their words: "getHTTPResponse" -> "get", "HTTP", "Response"
+IDENTIFIER_PART = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+STOPWORDS = {"a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is", "it", "its", "of",
+             "on", "or", "that", "the", "this", "to", "was", "were", "will", "with"}
+MAX_TERM_LENGTH = 64
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase terms for the lexical index.
+
+    Identifiers are kept whole and also split into their words, so "get_token_counts" and "getTokenCounts"
+    both match "token".
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        List[str]: The terms, in order, with repetitions.
+    """
+    terms = []
+    for word in WORD.findall(text):
+        lower = word.lower()
+        if 1 < len(lower) <= MAX_TERM_LENGTH and lower not in STOPWORDS:
+            terms.append(lower)
+        parts = [part.lower() for piece in word.split("_") for part in IDENTIFIER_PART.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(part for part in parts
+                         if 1 < len(part) <= MAX_TERM_LENGTH and part not in STOPWORDS and part != lower)
+    return terms
+
+
+class _Segment:
+    """
+    An immutable block of the inverted index, holding the chunks synced together.
+
+    Postings are stored in compressed sparse row form: the postings of `terms[i]` are
+    `rows[offsets[i]:offsets[i + 1]]` with their term frequencies in `tfs`. Removed chunks are only
+    marked as dead in `alive` until segments are merged.
+
+    Attributes:
+        name (str): The file name of the segment.
+        terms (np.ndarray): The sorted terms.
+        offsets (np.ndarray): The start of the postings of every term, int64.
+        rows (np.ndarray): The row of every posting, int32.
+        tfs (np.ndarray): The term frequency of every posting, uint16.
+        columns (Dict[str, np.ndarray]): The chunk_id, documents_id and file_name of every row.
+        lengths (np.ndarray): The number of terms of every row, int32.
+        alive (np.ndarray): Whether every row is still part of the index.
+    """
+
+    FIELDS = ("chunk_id", "documents_id", "file_name")
+
+    def __init__(self, name: str, terms: np.ndarray, offsets: np.ndarray, rows: np.ndarray, tfs: np.ndarray,
+                 columns: Dict[str, np.ndarray], lengths: np.ndarray, alive: np.ndarray):
+        self.name = name
+        self.terms = terms
+        self.offsets = offsets
+        self.rows = rows
+        self.tfs = tfs
+        self.columns = columns
+        self.lengths = lengths
+        self.alive = alive
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    @classmethod
+    def build(cls, name: str, chunks: List[dict]) -> "_Segment":
+        """
+        Indexes chunks read from the embedded documents collection.
+        """
+        terms, rows, tfs, lengths = [], [], [], []
+        for row, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk.get("raw_chunk") or ""))
+            lengths.append(sum(counts.values()))
+            terms.extend(counts.keys())
+            rows.extend([row] * len(counts))
+            tfs.extend(min(count, 65535) for count in counts.values())
+        columns = {field: np.array([chunk.get(field) or "" for chunk in chunks], dtype=str) for field in cls.FIELDS}
+        return cls._from_postings(name, np.array(terms, dtype=str), np.array(rows, dtype=np.int32),
+                                  np.array(tfs, dtype=np.uint16), columns, np.array(lengths, dtype=np.int32))
+
+    @classmethod
+    def merge(cls, name: str, segments: List["_Segment"]) -> "_Segment":
+        """
+        Merges segments into one, dropping their dead rows.
+        """
+        terms, rows, tfs, lengths = [], [], [], []
+        columns = {field: [] for field in cls.FIELDS}
+        base = 0
+        for segment in segments:
+            # New row numbers of the live rows, after the rows of the previous segments
+            renumbered = np.cumsum(segment.alive, dtype=np.int64) - 1 + base
+            live_postings = segment.alive[segment.rows]
+            terms.append(np.repeat(segment.terms, np.diff(segment.offsets))[live_postings])
+            rows.append(renumbered[segment.rows[live_postings]].astype(np.int32))
+            tfs.append(segment.tfs[live_postings])
+            lengths.append(segment.lengths[segment.alive])
+            for field in cls.FIELDS:
+                columns[field].append(segment.columns[field][segment.alive])
+            base += int(segment.alive.sum())
+        return cls._from_postings(
+            name, np.concatenate(terms) if terms else np.array([], dtype=str),
+            np.concatenate(rows) if rows else np.array([], dtype=np.int32),
+            np.concatenate(tfs) if tfs else np.array([], dtype=np.uint16),
+            {field: np.concatenate(values) if values else np.array([], dtype=str) for field, values in columns.items()},
+            np.concatenate(lengths) if lengths else np.array([], dtype=np.int32))
+
+    @classmethod
+    def _from_postings(cls, name: str, terms: np.ndarray, rows: np.ndarray, tfs: np.ndarray,
+                       columns: Dict[str, np.ndarray], lengths: np.ndarray) -> "_Segment":
+        order = np.lexsort((rows, terms))
+        terms, rows, tfs = terms[order], rows[order], tfs[order]
+        unique_terms, starts = np.unique(terms, return_index=True)
+        offsets = np.append(starts, len(terms)).astype(np.int64)
+        return cls(name, unique_terms, offsets, rows, tfs, columns, lengths, np.ones(len(lengths), dtype=bool))
+
+    def postings(self, term: str) -> tuple:
+        """
+        Returns the rows and term frequencies of a term.
+        """
+        i = int(np.searchsorted(self.terms, term))
+        if i == len(self.terms) or self.terms[i] != term:
+            return None, None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.rows[start:end], self.tfs[start:end]
+
+    def without(self, documents_ids: List[str]) -> Optional["_Segment"]:
+        """
+        Returns a copy with the rows of the documents marked as dead, or None when it holds none of them.
+        """
+        dead = self.alive & np.isin(self.columns["documents_id"], documents_ids)
+        if not dead.any():
+            return None
+        return _Segment(self.name, self.terms, self.offsets, self.rows, self.tfs, self.columns, self.lengths,
+                        self.alive & ~dead)
+
+    def save(self, path: str):
+        np.savez(os.path.join(path, f"{self.name}.npz"), terms=self.terms, offsets=self.offsets, rows=self.rows,
+                 tfs=self.tfs, lengths=self.lengths, **self.columns)
+        self.save_alive(path)
+
+    def save_alive(self, path: str):
+        np.save(os.path.join(path, f"{self.name}.alive.npy"), self.alive)
+
+    @classmethod
+    def load(cls, path: str, name: str) -> "_Segment":
+        with np.load(os.path.join(path, f"{name}.npz")) as data:
+            return cls(name, data["terms"], data["offsets"], data["rows"], data["tfs"],
+                       {field: data[field] for field in cls.FIELDS}, data["lengths"],
+                       np.load(os.path.join(path, f"{name}.alive.npy")))
+
+
+class LexicalIndex(SyncedIndex):
+    """
+    BM25 search over the raw text of the embedded chunks, held in process memory.
+
+    The inverted index is made of segments: syncing a document marks its old rows as dead and indexes its
+    current chunks as a new segment, and segments are merged once there are more than `max_segments`.
+    With a `path` the segments are persisted as numpy arrays, so a restart only indexes the documents
+    changed since. The process persisting the index holds a lock on the directory, other processes sharing
+    the path, like the workers of an API server, keep their index in memory only.
+    """
+
+    def __init__(self, mongo_client: MongoDBAtlasClient, collection: str, documents_collection: str = "documents",
+                 path: str = None, k1: float = 1.2, b: float = 0.75, max_segments: int = 8):
+        """
+        Initializes the LexicalIndex.
+
+        Args:
+            mongo_client (MongoDBAtlasClient): MongoDB client for database operations.
+            collection (str): The collection of embedded chunks held by the index.
+            documents_collection (str, optional): The collection of documents, polled on refresh. Defaults to "documents".
+            path (str, optional): The directory the index is persisted in. Defaults to memory only.
+            k1 (float, optional): The BM25 term frequency saturation. Defaults to 1.2.
+            b (float, optional): The BM25 length normalization. Defaults to 0.75.
+            max_segments (int, optional): The number of segments above which they are merged. Defaults to 8.
+        """
+        super().__init__(mongo_client, documents_collection)
+        self.collection = collection
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_segments = max_segments
+        self.segments: List[_Segment] = []
+        self._next_segment = 0
+        self._written: set = set()
+        self._path_lock = None
+
+    async def load(self):
+        """
+        Loads the persisted index and indexes the documents changed since, or indexes the whole collection.
+        """
+        if self.path and not await asyncio.to_thread(self._lock_path):
+            logger.info(f"Lexical index in {self.path} is persisted by another process, keeping it in memory")
+            self.path = None
+        manifest = await asyncio.to_thread(self._read_manifest)
+        if manifest is not None:
+            async with self._lock:
+                self.segments = await asyncio.to_thread(
+                    lambda: [_Segment.load(self.path, name) for name in manifest["segments"]])
+                self._written = set(manifest["segments"])
+                self._next_segment = manifest["next_segment"]
+                self._versions = dict(manifest["versions"])
+            await self.refresh()
+        else:
+            async with self._lock:
+                versions = await self._fetch_versions()
+                chunks = await self.mongo_client.db[self.collection].find({}, self._projection()).to_list(length=None)
+                segment = await asyncio.to_thread(_Segment.build, self._new_segment_name(), chunks)
+                self.segments = [segment] if len(segment) else []
+                self._versions = versions
+                await self._after_sync()
+        logger.info(f"Loaded lexical index of {sum(int(s.alive.sum()) for s in self.segments)} chunks "
+                    f"in {len(self.segments)} segments")
+
+    async def search(self, query: str, filters: dict = None, limit: int = 10) -> List[dict]:
+        """
+        Finds the chunks best matching a query by BM25.
+
+        Args:
+            query (str): The query text.
+            filters (dict, optional): Filter on chunk_id, documents_id and file_name.
+            limit (int, optional): The number of hits to return. Defaults to 10.
+
+        Returns:
+            List[dict]: The hits, each with chunk_id, score, text and source, best first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        hits = await asyncio.to_thread(self._search, self.segments, terms, filters, limit)
+        if not hits:
+            return []
+
+        # Read the text of the hits only
+        chunks = await self.mongo_client.db[self.collection].find(
+            {"chunk_id": {"$in": [chunk_id for chunk_id, _ in hits]}},
+            {"_id": 0, "chunk_id": 1, "raw_chunk": 1, "file_name": 1}).to_list(length=None)
+        chunks = {chunk["chunk_id"]: chunk for chunk in chunks}
+        return [
+            {"chunk_id": chunk_id, "text": chunks[chunk_id].get("raw_chunk"),
+             "source": chunks[chunk_id].get("file_name"), "score": score}
+            for chunk_id, score in hits if chunk_id in chunks
+        ]
+
+    async def _after_sync(self):
+        """
+        Merges the segments when there are too many and persists the index. Called with the lock held.
+        """
+        if len(self.segments) > self.max_segments:
+            self.segments = [await asyncio.to_thread(_Segment.merge, self._new_segment_name(), self.segments)]
+        if self.path:
+            await asyncio.to_thread(self._write, list(self.segments), dict(self._versions))
+
+    async def _sync(self, documents_ids: List[str]):
+        segments = []
+        for segment in self.segments:
+            segments.append(segment.without(documents_ids) or segment)
+        # The chunks of every synced document go to a single new segment
+        chunks = await self.mongo_client.db[self.collection].find(
+            {"documents_id": {"$in": documents_ids}}, self._projection()).to_list(length=None)
+        if chunks:
+            segments.append(await asyncio.to_thread(_Segment.build, self._new_segment_name(), chunks))
+        self.segments = [segment for segment in segments if segment.alive.any()]
+
+    def contains(self, terms: List[str], filters: dict = None) -> bool:
+        """
+        Tells whether a chunk holds every one of the terms, each as a whole term of the index.
+
+        Args:
+            terms (List[str]): The lowercase terms, e.g. the whole words of an identifier.
+            filters (dict, optional): Filter on chunk_id, documents_id and file_name.
+
+        Returns:
+            bool: True when a live chunk matching the filters holds all the terms.
+        """
+        if not terms:
+            return False
+        for segment in self.segments:
+            mask = segment.alive.copy()
+            for term in terms:
+                rows, _ = segment.postings(term)
+                if rows is None:
+                    break
+                found = np.zeros(len(segment), dtype=bool)
+                found[rows] = True
+                mask &= found
+            else:
+                if filters:
+                    mask &= match_filters(filters, segment.columns)
+                if mask.any():
+                    return True
+        return False
+
+    def _projection(self) -> dict:
+        return {"_id": 0, "raw_chunk": 1, **{field: 1 for field in _Segment.FIELDS}}
+
+    def _new_segment_name(self) -> str:
+        # Unique across processes, should two of them ever write to the same directory
+        self._next_segment += 1
+        return f"segment-{self._next_segment:08d}-{uuid.uuid4().hex[:12]}"
+
+    def _search(self, segments: List[_Segment], terms: List[str], filters: dict, limit: int) -> List[tuple]:
+        """
+        Scores the chunks containing any of the terms. Runs in a thread.
+
+        Returns:
+            List[tuple]: The (chunk_id, score) of the best chunks.
+        """
+        live = sum(int(segment.alive.sum()) for segment in segments)
+        if not live:
+            return []
+        average_length = max(sum(int(segment.lengths[segment.alive].sum()) for segment in segments) / live, 1.0)
+
+        postings = [[segment.postings(term) for term in terms] for segment in segments]
+        document_frequencies = [0] * len(terms)
+        for segment, segment_postings in zip(segments, postings):
+            for i, (rows, _) in enumerate(segment_postings):
+                if rows is not None:
+                    document_frequencies[i] += int(segment.alive[rows].sum())
+
+        hits = []
+        for segment, segment_postings in zip(segments, postings):
+            scores = np.zeros(len(segment), dtype=np.float32)
+            norms = self.k1 * (1 - self.b + self.b * segment.lengths / average_length)
+            for (rows, tfs), frequency in zip(segment_postings, document_frequencies):
+                if rows is None or not frequency:
+                    continue
+                idf = math.log(1 + (live - frequency + 0.5) / (frequency + 0.5))
+                tf = tfs.astype(np.float32)
+                scores[rows] += idf * tf * (self.k1 + 1) / (tf + norms[rows])
+
+            mask = segment.alive & (scores > 0)
+            if filters:
+                mask &= match_filters(filters, segment.columns)
+            rows = np.flatnonzero(mask)
+            if len(rows) > limit:
+                rows = rows[np.argpartition(-scores[rows], limit - 1)[:limit]]
+            hits.extend((str(segment.columns["chunk_id"][row]), float(scores[row])) for row in rows)
+
+        hits.sort(key=lambda hit: hit[1], reverse=True)
+        return hits[:limit]
+
+    def _lock_path(self) -> bool:
+        """
+        Takes an exclusive lock on the index directory, held until the process exits.
+
+        Returns:
+            bool: False when another process holds the lock.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        lock_file = open(os.path.join(self.path, "lock"), "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._path_lock = lock_file
+        return True
+
+    def _read_manifest(self) -> Optional[dict]:
+        if not self.path:
+            return None
+        try:
+            with open(os.path.join(self.path, "manifest.json")) as manifest:
+                return json.load(manifest)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable lexical index in {self.path}: {e}")
+            return None
+
+    def _write(self, segments: List[_Segment], versions: Dict[str, object]):
+        """
+        Persists new segments, the live rows of every segment and the manifest, then removes merged segments.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        for segment in segments:
+            if segment.name in self._written:
+                segment.save_alive(self.path)
+            else:
+                segment.save(self.path)
+
+        manifest = {
+            "segments": [segment.name for segment in segments],
+            "next_segment": self._next_segment,
+            "versions": versions,
+        }
+        temporary = os.path.join(self.path, "manifest.json.tmp")
+        with open(temporary, "w") as file:
+            json.dump(manifest, file)
+        os.replace(temporary, os.path.join(self.path, "manifest.json"))
+
+        names = {segment.name for segment in segments}
+        for name in self._written - names:
+            for suffix in (".npz", ".alive.npy"):
+                try:
+                    os.remove(os.path.join(self.path, name + suffix))
+                except FileNotFoundError:
+                    pass
+        self._written = names
@@ -1,50 +1,134 @@
-from langchain_openai import OpenAIEmbeddings
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from typing import List
+from functools import cached_property
+from typing import TYPE_CHECKING, AsyncIterator, List, Tuple
+import asyncio
 import html
-from langchain_core.output_parsers import StrOutputParser
+import time
+import httpx
 
+from core.metrics import (EMBED_BATCH_SECONDS, EMBEDDED_TOKENS, EMBEDDING_CACHE_HITS, EMBEDDING_CACHE_MISSES,
+                          GENERATED_TOKENS, LLM_COMPLETION_SECONDS)
 from core.prompts import ALTERNATE_QUESTION_PROMPT, DOCUMENT_CHAT_PROMPT
+from services.embedding_cache import EmbeddingCache
+from utils.utils import get_encoding, get_token_counts
+
+if TYPE_CHECKING:
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_core.prompts import ChatPromptTemplate
+    from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 
 
 class OpenAIClient:
     """
     A client class for interacting with OpenAI services.
 
+    The langchain clients are imported and built on first use, or ahead of the first request by warm_up().
+
     Attributes:
         embeddings (OpenAIEmbeddings): An instance of OpenAIEmbeddings for creating embeddings.
         llm (ChatOpenAI): An instance of ChatOpenAI for chat interactions.
+        cache (EmbeddingCache): Optional cache consulted before any embedding request.
 
     Methods:
         create_embedding(text: str) -> List[List[float]]: 
             Creates embeddings for the input text.
+        create_embeddings(texts: List[str], token_counts: List[int]) -> List[List[float]]: 
+            Creates embeddings for many texts using batched, concurrency-bounded requests.
         chat(prompt_template: ChatPromptTemplate, payload) -> str: 
             Initiates a chat using the provided prompt template and payload.
         fetch_alternate_questions(que: str, no_of_questions: int) -> str: 
             Fetches alternate questions based on the input query.
         fetch_chat_response(que: str, context: str) -> str: 
             Fetches chat response as per document context
+        warm_up():
+            Builds the langchain clients and loads the tokenizer.
+        close(): 
+            Closes the pooled HTTP clients.
     """
 
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, base_url: str = None, batch_size: int = 256, batch_tokens: int = 100000, concurrency: int = 4, cache: EmbeddingCache = None,
+                 timeout: float = None, max_retries: int = 2, http_client: httpx.Client = None, http_async_client: httpx.AsyncClient = None):
         """
         Initializes the OpenAIClient with the provided API key.
 
         Args:
             api_key (str): The API key for accessing OpenAI services.
+            base_url (str, optional): Base URL of an OpenAI compatible API. Defaults to the public OpenAI API.
+            batch_size (int, optional): Maximum number of texts per embedding request. Defaults to 256.
+            batch_tokens (int, optional): Maximum number of tokens per embedding request. Defaults to 100000.
+            concurrency (int, optional): Maximum number of embedding requests in flight at once. Defaults to 4.
+            cache (EmbeddingCache, optional): Cache of previously created embeddings. Defaults to no caching.
+            timeout (float, optional): Timeout of a single request in seconds. Defaults to the OpenAI client default.
+            max_retries (int, optional): Number of retries of a failed request. Defaults to 2.
+            http_client (httpx.Client, optional): Pooled HTTP client used for synchronous requests.
+            http_async_client (httpx.AsyncClient, optional): Pooled HTTP client used for asynchronous requests.
         """
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-3-large",
-            dimensions=1536,
-            openai_api_key=api_key
+        self.embedding_model = "text-embedding-3-large"
+        self.embedding_dimensions = 1536
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.http_client = http_client
+        self.http_async_client = http_async_client
+        self.batch_size = batch_size
+        self.batch_tokens = batch_tokens
+        self.concurrency = concurrency
+        self.cache = cache
+
+    @cached_property
+    def embeddings(self) -> "OpenAIEmbeddings":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(
+            model=self.embedding_model,
+            dimensions=self.embedding_dimensions,
+            openai_api_key=self.api_key,
+            openai_api_base=self.base_url,
+            request_timeout=self.timeout,
+            max_retries=self.max_retries,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client
         )
-        self.llm = ChatOpenAI(
+
+    @cached_property
+    def llm(self) -> "ChatOpenAI":
+        from langchain_openai import ChatOpenAI
+
+        return ChatOpenAI(
             model="gpt-3.5-turbo-0125",
             temperature=0,
-            api_key=api_key
+            api_key=self.api_key,
+            base_url=self.base_url,
+            timeout=self.timeout,
+            max_retries=self.max_retries,
+            http_client=self.http_client,
+            http_async_client=self.http_async_client
         )
-        self.output_parser = StrOutputParser()
+
+    @cached_property
+    def output_parser(self) -> "StrOutputParser":
+        from langchain_core.output_parsers import StrOutputParser
+
+        return StrOutputParser()
+
+    def warm_up(self):
+        """
+        Builds the langchain clients and loads the tokenizer, so the first request does not pay for them.
+
+        Blocking, meant to run in a thread.
+        """
+        # Reading the cached properties builds them
+        self.embeddings, self.llm, self.output_parser
+        get_encoding()
+
+    async def close(self):
+        """
+        Closes the pooled HTTP clients passed to the OpenAIClient.
+        """
+        if self.http_client is not None:
+            self.http_client.close()
+        if self.http_async_client is not None:
+            await self.http_async_client.aclose()
 
     async def create_embedding(self, text: str) -> List[List[float]]:
         """
@@ -56,10 +140,109 @@ class OpenAIClient:
         Returns:
             List[List[float]]: A list of embeddings for the input text.
         """
-        vector_text = self.embeddings.embed_documents([text])
+        vector_text = await self.create_embeddings([text])
         return vector_text
 
-    async def _chat(self, prompt_template: ChatPromptTemplate, payload):
+    async def create_embeddings(self, texts: List[str], token_counts: List[int] = None) -> List[List[float]]:
+        """
+        Creates embeddings for many texts at once.
+
+        Cached embeddings are returned without any request. The remaining texts are grouped into
+        requests bounded by item count and token budget, and at most `concurrency` requests are in
+        flight at the same time.
+
+        Args:
+            texts (List[str]): The input texts to create embeddings for.
+            token_counts (List[int], optional): Token count of each text. Computed when not provided.
+
+        Returns:
+            List[List[float]]: One embedding per input text, in the same order as `texts`.
+        """
+        if not texts:
+            return []
+        if self.cache is None:
+            return await self._embed(texts, token_counts)
+
+        keys = [EmbeddingCache.key(self.embedding_model, self.embedding_dimensions, text)
+                for text in texts]
+        vectors = await self.cache.get_many(keys)
+
+        # Embed every missing text once, even when it appears several times
+        missing = {}
+        misses = 0
+        for index, key in enumerate(keys):
+            if key not in vectors:
+                missing.setdefault(key, index)
+                misses += 1
+        EMBEDDING_CACHE_HITS.inc(len(keys) - misses)
+        EMBEDDING_CACHE_MISSES.inc(misses)
+        if missing:
+            indexes = list(missing.values())
+            created = await self._embed(
+                [texts[i] for i in indexes],
+                [token_counts[i] for i in indexes] if token_counts is not None else None
+            )
+            created = dict(zip(missing.keys(), created))
+            await self.cache.set_many(created)
+            vectors.update(created)
+
+        return [vectors[key] for key in keys]
+
+    async def _embed(self, texts: List[str], token_counts: List[int] = None) -> List[List[float]]:
+        """
+        Sends batched, concurrency-bounded embedding requests for the given texts.
+
+        Args:
+            texts (List[str]): The input texts to create embeddings for.
+            token_counts (List[int], optional): Token count of each text. Computed when not provided.
+
+        Returns:
+            List[List[float]]: One embedding per input text, in the same order as `texts`.
+        """
+        if token_counts is None:
+            token_counts = [get_token_counts(text) for text in texts]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def embed_batch(start: int, end: int) -> List[List[float]]:
+            async with semaphore:
+                # Chunks are already split below the model context length, so the raw texts
+                # are sent in one request instead of being re-tokenized by langchain
+                with EMBED_BATCH_SECONDS.time():
+                    response = await self.embeddings.async_client.create(
+                        input=texts[start:end],
+                        model=self.embedding_model,
+                        dimensions=self.embedding_dimensions
+                    )
+                EMBEDDED_TOKENS.inc(sum(token_counts[start:end]))
+                return [item.embedding for item in response.data]
+
+        batches = await asyncio.gather(
+            *(embed_batch(start, end) for start, end in self._batch_ranges(token_counts)))
+        return [vector for batch in batches for vector in batch]
+
+    def _batch_ranges(self, token_counts: List[int]) -> List[Tuple[int, int]]:
+        """
+        Groups consecutive texts into request sized batches.
+
+        Args:
+            token_counts (List[int]): Token count of each text.
+
+        Returns:
+            List[Tuple[int, int]]: The (start, end) index range of every batch.
+        """
+        ranges = []
+        start, tokens = 0, 0
+        for index, count in enumerate(token_counts):
+            items = index - start
+            if items and (items >= self.batch_size or tokens + count > self.batch_tokens):
+                ranges.append((start, index))
+                start, tokens = index, 0
+            tokens += count
+        ranges.append((start, len(token_counts)))
+        return ranges
+
+    async def _chat(self, prompt_template: "ChatPromptTemplate", payload):
         """
         Initiates a chat using the provided prompt template and payload.
 
@@ -70,9 +253,35 @@ class OpenAIClient:
         Returns:
             str: The response from the chat.
         """
+        # Generating with the model directly keeps the usage OpenAI returns, the generated tokens are not re-counted
+        result = await self.llm.agenerate([prompt_template.format_messages(**payload)])
+        usage = (result.llm_output or {}).get("token_usage") or {}
+        GENERATED_TOKENS.inc(usage.get("completion_tokens", 0))
+        return result.generations[0][0].text
+
+    async def _chat_stream(self, prompt_template: "ChatPromptTemplate", payload) -> AsyncIterator[str]:
+        """
+        Initiates a chat using the provided prompt template and payload, yielding the response as it is generated.
+
+        Closing the iterator closes the underlying request, which stops the generation.
+
+        Args:
+            prompt_template (ChatPromptTemplate): The prompt template for initiating the chat.
+            payload: The payload to be used in the chat.
+
+        Yields:
+            str: The next piece of the response.
+        """
         chain = prompt_template | self.llm | self.output_parser
-        response = chain.invoke(payload)
-        return response
+        # OpenAI streams one token per content delta, and this langchain-openai drops the streamed usage
+        generated = 0
+        try:
+            async for token in chain.astream(payload):
+                if token:
+                    generated += 1
+                yield token
+        finally:
+            GENERATED_TOKENS.inc(generated)
 
     async def fetch_chat_response(self, que: str, context: str):
         """
@@ -85,6 +294,8 @@ class OpenAIClient:
         Returns:
             str: The response containing alternate questions.
         """
+        from langchain_core.prompts import ChatPromptTemplate
+
         try:
             prompt = ChatPromptTemplate.from_messages(
                 [
@@ -95,10 +306,11 @@ class OpenAIClient:
                     ("human", "{que}"),
                 ]
             )
-            response = await self._chat(prompt, {
-                "context": context,
-                "que": que
-            })
+            with LLM_COMPLETION_SECONDS.time():
+                response = await self._chat(prompt, {
+                    "context": context,
+                    "que": que
+                })
 
             if response:
                 return [html.escape(response) for response in response.split('\n')]
@@ -107,6 +319,49 @@ class OpenAIClient:
         except Exception as e:
             print(e)
 
+    async def stream_chat_response(self, que: str, context: str) -> AsyncIterator[str]:
+        """
+        Streams the answer to the input query based on the context, token by token.
+
+        Args:
+            que (str): The input query.
+            context (str): The context string to provide additional information.
+
+        Yields:
+            str: The next html-escaped piece of the answer.
+        """
+        from langchain_core.prompts import ChatPromptTemplate
+
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                (
+                    "system",
+                    DOCUMENT_CHAT_PROMPT,
+                ),
+                ("human", "{que}"),
+            ]
+        )
+        tokens = self._chat_stream(prompt, {
+            "context": context,
+            "que": que
+        })
+        # Only the time waiting on OpenAI is recorded, not the time the client takes to read the tokens
+        upstream_seconds = 0.0
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    token = await tokens.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    upstream_seconds += time.perf_counter() - started
+                if token:
+                    yield html.escape(token)
+        finally:
+            LLM_COMPLETION_SECONDS.observe(upstream_seconds)
+            await tokens.aclose()
+
     async def fetch_alternate_questions(self, que: str, no_of_questions: int) -> str:
         """
         Fetches alternate questions based on the input query.
@@ -118,6 +373,8 @@ class OpenAIClient:
         Returns:
             str: The response containing alternate questions.
         """
+        from langchain_core.prompts import ChatPromptTemplate
+
         try:
             prompt = ChatPromptTemplate.from_messages(
                 [
@@ -0,0 +1,278 @@
+import asyncio
+import os
+import re
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, AsyncIterator, Iterable, Iterator, List, Optional, Set, Tuple
+from loguru import logger
+
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+
+# Extensions of the files ingested from a repository, files named ".gitignore" etc. count as their extension
+EXTENSIONS = {'txt', 'md', 'markdown', 'rst', 'py', 'js', 'ts', 'java', 'c', 'cpp', 'cs', 'go', 'rb', 'php', 'scala',
+              'html', 'htm', 'xml', 'json', 'yaml', 'yml', 'ini', 'toml', 'cfg', 'conf', 'sh', 'bash', 'css', 'scss',
+              'sql', 'gitignore', 'dockerignore', 'editorconfig', 'ipynb'}
+# Directories never walked into, even when not .gitignored: other directories, like vendor/ or build/, may
+# hold real source and are only skipped when the repository ignores them
+SKIPPED_DIRS = ('.git', 'node_modules', '__pycache__')
+# Generated files that match an ingested extension
+GENERATED_FILES = {'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'poetry.lock', 'composer.lock', 'Pipfile.lock'}
+MINIFIED_SUFFIXES = ('.min.js', '.min.css', '.bundle.js')
+# Code files whose lines average more than this many characters are minified or generated
+MAX_AVERAGE_LINE_LENGTH = 300
+# Prose may hold a whole paragraph per line
+PROSE_EXTENSIONS = {'txt', 'md', 'markdown', 'rst'}
+BINARY_SNIFF_BYTES = 8192
+
+
+class GitIgnore:
+    """
+    Matches repository paths against the .gitignore files met while walking the tree.
+
+    Supports the gitignore pattern syntax: `*`, `?`, `[...]`, `**`, anchoring with a leading or inner `/`,
+    directory-only patterns with a trailing `/` and negation with `!`. Like git, the last matching pattern
+    wins and the patterns of a .gitignore only apply below its directory.
+    """
+
+    def __init__(self, rules: Tuple[tuple, ...] = ()):
+        self.rules = rules
+
+    def extend(self, base: str, lines: List[str]) -> "GitIgnore":
+        """
+        Returns a matcher also applying the patterns of a .gitignore.
+
+        Args:
+            base (str): The directory of the .gitignore relative to the repository root, "" for the root.
+            lines (List[str]): The lines of the .gitignore.
+
+        Returns:
+            GitIgnore: A new matcher, this one is left unchanged.
+        """
+        prefix = f"{base}/" if base else ""
+        rules = []
+        for line in lines:
+            rule = self._parse(line)
+            if rule is not None:
+                rules.append((prefix, *rule))
+        return GitIgnore(self.rules + tuple(rules)) if rules else self
+
+    def ignored(self, path: str, is_dir: bool) -> bool:
+        """
+        Tells whether a path relative to the repository root is ignored.
+        """
+        ignored = False
+        for prefix, pattern, negate, dir_only in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if path.startswith(prefix) and pattern.fullmatch(path[len(prefix):]):
+                ignored = not negate
+        return ignored
+
+    @staticmethod
+    def _parse(line: str) -> Optional[tuple]:
+        line = line.rstrip("\n").rstrip()
+        if not line or line.startswith("#"):
+            return None
+        negate = line.startswith("!")
+        if negate:
+            line = line[1:]
+        elif line.startswith("\\"):
+            line = line[1:]
+        dir_only = line.endswith("/")
+        line = line.rstrip("/")
+        if not line:
+            return None
+
+        # Patterns without an inner slash match at any depth
+        anchored = "/" in line
+        line = line.lstrip("/")
+        regex = "" if anchored else "(?:.*/)?"
+        i = 0
+        while i < len(line):
+            if line.startswith("**/", i):
+                regex += "(?:.*/)?"
+                i += 3
+            elif line.startswith("**", i):
+                regex += ".*"
+                i += 2
+            elif line[i] == "*":
+                regex += "[^/]*"
+                i += 1
+            elif line[i] == "?":
+                regex += "[^/]"
+                i += 1
+            elif line[i] == "[" and "]" in line[i + 2:]:
+                end = line.index("]", i + 2)
+                body = line[i + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                regex += f"[{body.replace(chr(92), chr(92) * 2)}]"
+                i = end + 1
+            else:
+                regex += re.escape(line[i])
+                i += 1
+        return re.compile(regex), negate, dir_only
+
+
+class RepoWalker:
+    """
+    Loads the text files of a cloned repository in a single walk over the tree.
+
+    Directories are walked once with os.scandir, skipping .gitignored paths, the `skip_dirs` directories,
+    unsupported extensions and files over `max_file_bytes`. The remaining files are read by a pool of
+    threads and streamed as one Document per file, skipping binary and minified content.
+    """
+
+    def __init__(self, max_file_bytes: int = 1000000, workers: int = 8, skip_dirs: Iterable[str] = SKIPPED_DIRS):
+        """
+        Initializes the RepoWalker.
+
+        Args:
+            max_file_bytes (int, optional): Files larger than this are skipped. Defaults to 1000000.
+            workers (int, optional): The number of threads reading files. Defaults to 8.
+            skip_dirs (Iterable[str], optional): Names of the directories never walked into, at any depth.
+                Defaults to .git, node_modules and __pycache__.
+        """
+        self.max_file_bytes = max_file_bytes
+        self.workers = workers
+        self.skip_dirs = frozenset(skip_dirs)
+
+    def walk(self, root: str, stats: Counter = None, paths: Set[str] = None) -> Iterator[Tuple[str, str, str]]:
+        """
+        Walks the repository tree once, yielding the files to load.
+
+        Args:
+            root (str): The repository root.
+            stats (Counter, optional): Receives the number of files skipped by reason.
+            paths (Set[str], optional): Only walk to these files, relative to the root. Defaults to every file.
+
+        Returns:
+            Iterator[Tuple[str, str, str]]: The absolute path, path relative to the root and extension of every file.
+        """
+        stats = stats if stats is not None else Counter()
+        # The directories leading to the requested files, the others are not walked into
+        parents = {path.rsplit("/", 1)[0] for path in paths or () if "/" in path}
+        for parent in list(parents):
+            while "/" in parent:
+                parent = parent.rsplit("/", 1)[0]
+                parents.add(parent)
+        exclude = self._read_ignore_file(GitIgnore(), os.path.join(root, ".git", "info", "exclude"), "")
+        directories = [(root, "", self._read_ignore_file(exclude, os.path.join(root, ".gitignore"), ""))]
+        while directories:
+            path, relative, gitignore = directories.pop()
+            try:
+                entries = sorted(os.scandir(path), key=lambda entry: entry.name)
+            except OSError:
+                stats["unreadable"] += 1
+                continue
+            for entry in entries:
+                entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+                if paths is not None and entry_relative not in paths and entry_relative not in parents:
+                    continue
+                # Symlinks may point outside the repository or loop
+                if entry.is_symlink():
+                    stats["symlink"] += 1
+                    continue
+                if entry.is_dir():
+                    if entry.name in self.skip_dirs:
+                        stats["skipped_dir"] += 1
+                    elif gitignore.ignored(entry_relative, True):
+                        stats["ignored"] += 1
+                    else:
+                        directories.append(
+                            (entry.path, entry_relative,
+                             self._read_ignore_file(gitignore, os.path.join(entry.path, ".gitignore"), entry_relative)))
+                    continue
+
+                extension = entry.name.rsplit(".", 1)[-1].lower() if "." in entry.name else ""
+                if extension not in EXTENSIONS:
+                    stats["unsupported"] += 1
+                elif entry.name in GENERATED_FILES or entry.name.endswith(MINIFIED_SUFFIXES):
+                    stats["minified"] += 1
+                elif gitignore.ignored(entry_relative, False):
+                    stats["ignored"] += 1
+                elif entry.stat().st_size > self.max_file_bytes:
+                    stats["too_large"] += 1
+                else:
+                    yield entry.path, entry_relative, extension
+
+    async def load(self, root: str, stats: Counter = None, paths: Set[str] = None) -> AsyncIterator["Document"]:
+        """
+        Streams the text files of a repository as Documents, in the order they are read.
+
+        Args:
+            root (str): The repository root.
+            stats (Counter, optional): Receives the number of files loaded and skipped by reason.
+            paths (Set[str], optional): Only load these files, relative to the root. Defaults to every file.
+
+        Returns:
+            AsyncIterator[Document]: One Document per file, with its path relative to the root as source.
+        """
+        stats = stats if stats is not None else Counter()
+        files = await asyncio.to_thread(lambda: list(self.walk(root, stats, paths)))
+
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(self.workers, thread_name_prefix="repo-reader")
+        pending = set()
+        queued = iter(files)
+        try:
+            while True:
+                # Keep a bounded number of reads in flight so documents are consumed as they are read
+                for path, relative, extension in queued:
+                    pending.add(loop.run_in_executor(executor, self._read, path, relative, extension))
+                    if len(pending) >= self.workers * 2:
+                        break
+                if not pending:
+                    break
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    document, reason = future.result()
+                    stats[reason] += 1
+                    if document is not None:
+                        yield document
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _read(self, path: str, relative: str, extension: str) -> Tuple[Optional["Document"], str]:
+        """
+        Reads a file with the reader of its extension. Runs in the reader threads.
+
+        Returns:
+            Tuple[Optional[Document], str]: The Document, None when skipped, and "loaded" or the reason it was skipped.
+        """
+        from langchain_core.documents import Document
+
+        try:
+            if extension == "ipynb":
+                from langchain_community.document_loaders.notebook import NotebookLoader
+
+                documents = NotebookLoader(
+                    path, include_outputs=True, max_output_length=20, remove_newline=True).load()
+                text = "\n".join(document.page_content for document in documents)
+            else:
+                with open(path, "rb") as file:
+                    data = file.read()
+                if b"\0" in data[:BINARY_SNIFF_BYTES]:
+                    return None, "binary"
+                text = data.decode("utf-8", errors="replace")
+                if extension not in PROSE_EXTENSIONS and len(text) > MAX_AVERAGE_LINE_LENGTH and \
+                        len(text) / (text.count("\n") + 1) > MAX_AVERAGE_LINE_LENGTH:
+                    return None, "minified"
+        except Exception as e:
+            logger.error(f"Error loading file '{relative}': {e}")
+            return None, "unreadable"
+
+        if not text.strip():
+            return None, "empty"
+        return Document(page_content=text, metadata={"source": relative, "extension": extension}), "loaded"
+
+    @staticmethod
+    def _read_ignore_file(gitignore: GitIgnore, path: str, relative: str) -> GitIgnore:
+        try:
+            with open(path, encoding="utf-8", errors="replace") as file:
+                return gitignore.extend(relative, file.readlines())
+        except OSError:
+            return gitignore
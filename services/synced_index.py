@@ -0,0 +1,163 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+import numpy as np
+from bson import ObjectId
+from loguru import logger
+
+from services.database import MongoDBAtlasClient
+
+
+class SyncedIndex(ABC):
+    """
+    Base class of the in-process indexes over the embedded chunks, kept in sync with the documents collection.
+
+    Documents are synced in this process right after they change, and in other processes by `refresh`, which
+    compares the chunks version of every document with the one seen at its last sync and syncs every changed
+    document in a single pass.
+    """
+
+    def __init__(self, mongo_client: MongoDBAtlasClient, documents_collection: str = "documents"):
+        """
+        Initializes the SyncedIndex.
+
+        Args:
+            mongo_client (MongoDBAtlasClient): MongoDB client for database operations.
+            documents_collection (str, optional): The collection of documents, polled on refresh. Defaults to "documents".
+        """
+        self.mongo_client = mongo_client
+        self.documents_collection = documents_collection
+        self._versions: Dict[str, object] = {}
+        self._lock = asyncio.Lock()
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    async def sync_document(self, documents_id: str):
+        """
+        Brings the chunks of a document up to date after it was ingested, updated or deleted.
+
+        Args:
+            documents_id (str): The ID of the document.
+        """
+        async with self._lock:
+            # Read before the chunks, so a change made meanwhile is synced again by the next refresh
+            version = await self._fetch_version(documents_id)
+            await self._sync([documents_id])
+            if version is None:
+                self._versions.pop(documents_id, None)
+            else:
+                self._versions[documents_id] = version
+            await self._after_sync()
+
+    async def refresh(self):
+        """
+        Picks up documents changed by other processes since the last refresh.
+        """
+        async with self._lock:
+            versions = await self._fetch_versions()
+            changed = [documents_id for documents_id, version in versions.items()
+                       if self._versions.get(documents_id) != version]
+            removed = [documents_id for documents_id in self._versions if documents_id not in versions]
+            if changed or removed:
+                await self._sync(changed + removed)
+            self._versions = versions
+            await self._after_sync()
+        if changed or removed:
+            logger.info(f"Refreshed {len(changed)} changed and {len(removed)} removed documents in {self.name}")
+
+    async def watch(self, stop: asyncio.Event, interval: float):
+        """
+        Refreshes the index every `interval` seconds until `stop` is set.
+
+        Args:
+            stop (asyncio.Event): Event signalling the application shut down.
+            interval (float): Seconds between refreshes.
+        """
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            if stop.is_set():
+                break
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Failed to refresh {self.name}: {e}")
+
+    async def _fetch_versions(self) -> Dict[str, object]:
+        """
+        Returns the chunks version of every document.
+
+        Only the chunks version is compared, so status changes and lease renewals do not sync a document.
+        """
+        documents = await self.mongo_client.db[self.documents_collection].find(
+            {}, {"_id": 1, "chunks_version": 1}).to_list(length=None)
+        return {str(document["_id"]): document.get("chunks_version", 0) for document in documents}
+
+    async def _fetch_version(self, documents_id: str) -> Optional[object]:
+        """
+        Returns the chunks version of a document, None when it was deleted.
+        """
+        document = await self.mongo_client.db[self.documents_collection].find_one(
+            {"_id": ObjectId(documents_id)}, {"_id": 1, "chunks_version": 1})
+        return document.get("chunks_version", 0) if document is not None else None
+
+    async def _after_sync(self):
+        """
+        Called with the lock held once documents were synced, e.g. to persist the index.
+        """
+
+    @abstractmethod
+    async def _sync(self, documents_ids: List[str]):
+        """
+        Replaces the rows of the documents with the chunks stored for them. Called with the lock held.
+        """
+
+
+def match_filters(filters: dict, columns: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Evaluates a $vectorSearch style filter on in-memory columns.
+
+    Supports equality, $eq, $ne, $in, $nin, $and and $or.
+
+    Args:
+        filters (dict): The filter.
+        columns (Dict[str, np.ndarray]): The values of every row by field.
+
+    Returns:
+        np.ndarray: A boolean mask of the matching rows.
+
+    Raises:
+        ValueError: If the filter uses another field or operator.
+    """
+    size = len(next(iter(columns.values())))
+    mask = np.ones(size, dtype=bool)
+    for field, condition in filters.items():
+        if field in ("$and", "$or"):
+            masks = [match_filters(clause, columns) for clause in condition]
+            if field == "$and":
+                mask &= np.logical_and.reduce(masks) if masks else True
+            else:
+                mask &= np.logical_or.reduce(masks) if masks else False
+            continue
+        if field not in columns:
+            raise ValueError(f"Unsupported filter field: {field}")
+
+        values = columns[field]
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, operand in condition.items():
+            if operator == "$eq":
+                mask &= values == operand
+            elif operator == "$ne":
+                mask &= values != operand
+            elif operator in ("$in", "$nin"):
+                operand = set(operand)
+                found = np.fromiter((value in operand for value in values), dtype=bool, count=size)
+                mask &= found if operator == "$in" else ~found
+            else:
+                raise ValueError(f"Unsupported filter operator: {operator}")
+    return mask
@@ -0,0 +1,215 @@
+import asyncio
+import datetime
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import BinaryIO, Callable, List, Optional
+import multipart
+from multipart.multipart import MultipartState, parse_options_header
+from fastapi import HTTPException, Request
+
+from services.api_response import Response
+
+
+class ReceivedFile:
+    """
+    Represents a file streamed from a multipart upload into the staging directory.
+
+    Attributes:
+        file_name (str): The name of the uploaded file.
+        folder_path (str): The scratch folder created for this upload.
+        path (str): The path the file was written to, None when the file was rejected.
+        size (int): The number of bytes received.
+        content_hash (str): The sha256 hex digest of the file content.
+        error (str, optional): Why the file was rejected, if it was.
+    """
+
+    def __init__(self, file_name: str, folder_path: str = None, path: str = None, error: str = None):
+        self.file_name = file_name
+        self.folder_path = folder_path
+        self.path = path
+        self.error = error
+        self.size = 0
+        self.content_hash = None
+        self._hasher = hashlib.sha256()
+        self._file: Optional[BinaryIO] = None
+        self._buffer = bytearray()
+
+    def cleanup(self):
+        """
+        Deletes the scratch folder of the upload.
+        """
+        if self.folder_path:
+            shutil.rmtree(self.folder_path, ignore_errors=True)
+
+
+class UploadReceiver:
+    """
+    Streams multipart file uploads straight from the request body to the staging directory.
+
+    Unlike FastAPI's UploadFile, which spools the whole body to a temporary file before the route runs,
+    each file is written once, in large chunks off the event loop, while its sha256 and size are computed.
+    Size limits are enforced as soon as they are exceeded, and the declared Content-Length is checked
+    before anything is read.
+
+    Attributes:
+        staging_dir (str): Directory the per-upload scratch folders are created in.
+        max_file_bytes (int): Maximum size of a single file.
+        max_request_bytes (int): Maximum size of a whole upload request.
+        chunk_size (int): Number of bytes buffered before they are written to disk.
+    """
+
+    def __init__(self, staging_dir: str = '/tmp', max_file_bytes: int = 512 * 1024 ** 2,
+                 max_request_bytes: int = 2 * 1024 ** 3, chunk_size: int = 1024 ** 2):
+        """
+        Initializes the UploadReceiver.
+
+        Args:
+            staging_dir (str, optional): Directory the per-upload scratch folders are created in. Defaults to '/tmp'.
+            max_file_bytes (int, optional): Maximum size of a single file. Defaults to 512 MiB.
+            max_request_bytes (int, optional): Maximum size of a whole upload request. Defaults to 2 GiB.
+            chunk_size (int, optional): Number of bytes buffered before they are written to disk. Defaults to 1 MiB.
+        """
+        self.staging_dir = staging_dir
+        self.max_file_bytes = max_file_bytes
+        self.max_request_bytes = max_request_bytes
+        self.chunk_size = chunk_size
+
+    async def receive(self, request: Request, accept: Callable[[str], bool] = None) -> List[ReceivedFile]:
+        """
+        Receives every file part of a multipart request.
+
+        Args:
+            request (Request): The incoming multipart/form-data request.
+            accept (Callable[[str], bool], optional): Predicate on the file name, rejected files are not written.
+
+        Returns:
+            List[ReceivedFile]: The received files, in upload order.
+
+        Raises:
+            HTTPException: With status 413 when a size limit is exceeded, or 400 for a malformed body.
+        """
+        content_type, params = parse_options_header(
+            request.headers.get("Content-Type", ""))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            self._fail("Expected a multipart/form-data upload", 400)
+
+        content_length = request.headers.get("Content-Length")
+        if content_length and int(content_length) > self.max_request_bytes:
+            self._fail(f"Upload exceeds the limit of {self.max_request_bytes} bytes", 413)
+
+        files: List[ReceivedFile] = []
+        events = []
+        state = {"headers": {}, "field": b"", "value": b"", "part": None}
+
+        def on_header_field(data: bytes, start: int, end: int):
+            state["field"] += data[start:end]
+
+        def on_header_value(data: bytes, start: int, end: int):
+            state["value"] += data[start:end]
+
+        def on_header_end():
+            state["headers"][state["field"].lower()] = state["value"]
+            state["field"], state["value"] = b"", b""
+
+        def on_headers_finished():
+            _, options = parse_options_header(
+                state["headers"].get(b"content-disposition", b""))
+            state["headers"] = {}
+            state["part"] = None
+            # Form fields and empty file inputs carry no file name and are skipped
+            if options.get(b"filename"):
+                state["part"] = ReceivedFile(
+                    os.path.basename(options[b"filename"].decode("utf-8", "replace")))
+                events.append(("begin", state["part"]))
+
+        def on_part_data(data: bytes, start: int, end: int):
+            if state["part"] is not None:
+                events.append(("data", state["part"], data[start:end]))
+
+        def on_part_end():
+            if state["part"] is not None:
+                events.append(("end", state["part"]))
+
+        parser = multipart.MultipartParser(params[b"boundary"], {
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        })
+
+        received = 0
+        try:
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > self.max_request_bytes:
+                    self._fail(f"Upload exceeds the limit of {self.max_request_bytes} bytes", 413)
+                parser.write(chunk)
+                for event in events:
+                    await self._handle(event, files, accept)
+                events.clear()
+            parser.finalize()
+            # finalize() does not check the closing boundary, a truncated body leaves its last part open
+            if parser.state != MultipartState.END or \
+                    any(file.error is None and file.content_hash is None for file in files):
+                self._fail("Malformed multipart upload: the body ends before its closing boundary", 400)
+        except BaseException as e:
+            for file in files:
+                if file._file is not None:
+                    await asyncio.to_thread(file._file.close)
+                file.cleanup()
+            if isinstance(e, multipart.multipart.MultipartParseError):
+                self._fail(f"Malformed multipart upload: {e}", 400)
+            raise
+
+        return files
+
+    async def _handle(self, event: tuple, files: List[ReceivedFile], accept: Callable[[str], bool]):
+        kind, file = event[0], event[1]
+        if kind == "begin":
+            files.append(file)
+            if accept is not None and not accept(file.file_name):
+                file.error = f"Invalid file type for {file.file_name}"
+                return
+            file.folder_path, file.path, file._file = await asyncio.to_thread(self._open, file.file_name)
+        elif file.error is None:
+            if kind == "data":
+                file.size += len(event[2])
+                if file.size > self.max_file_bytes:
+                    self._fail(f"{file.file_name} exceeds the limit of {self.max_file_bytes} bytes", 413)
+                file._buffer += event[2]
+                if len(file._buffer) >= self.chunk_size:
+                    await asyncio.to_thread(self._flush, file)
+            else:
+                await asyncio.to_thread(self._flush, file, True)
+                file.content_hash = file._hasher.hexdigest()
+
+    def _open(self, file_name: str):
+        os.makedirs(self.staging_dir, exist_ok=True)
+        # Every upload gets its own folder, workers delete it once the document is ingested
+        folder_path = tempfile.mkdtemp(
+            prefix=datetime.datetime.now().strftime('%Y%m%d%H%M%S-'), dir=self.staging_dir)
+        path = os.path.join(folder_path, file_name)
+        return folder_path, path, open(path, "wb")
+
+    @staticmethod
+    def _flush(file: ReceivedFile, close: bool = False):
+        data = bytes(file._buffer)
+        file._buffer.clear()
+        # hashlib releases the GIL on large buffers, so hashing overlaps with the event loop
+        file._hasher.update(data)
+        file._file.write(data)
+        if close:
+            file._file.close()
+            file._file = None
+
+    @staticmethod
+    def _fail(message: str, status_code: int):
+        response, status_code = Response.failure(message, status_code=status_code)
+        raise HTTPException(
+            status_code=status_code,
+            detail=response.to_dict()
+        )
@@ -1,8 +1,27 @@
+import asyncio
 import json
+import re
 from typing import List
+from loguru import logger
 from core.model import ChatRequest
 from services.openai_client import OpenAIClient
 from services.database import MongoDBAtlasClient
+from services.vector_store import VectorStore, AtlasVectorStore
+from services.lexical_index import WORD, LexicalIndex
+from utils.cache import TTLCache
+from utils.utils import normalize_question
+from core.metrics import EXPANSION_CACHE_HITS, EXPANSION_CACHE_MISSES, EXPANSION_SECONDS, VECTOR_SEARCH_SECONDS
+
+# Words marking a natural language question, which benefits from expansion even when short
+QUESTION_WORDS = {"what", "why", "how", "when", "where", "which", "who", "whom", "whose", "is", "are", "does", "do",
+                  "can", "could", "should", "would", "explain", "describe", "compare", "difference"}
+
+# Code identifiers: dotted or :: paths, snake_case, camelCase and PascalCase names, optionally called
+IDENTIFIER = re.compile(
+    r"(?:[A-Za-z_][A-Za-z0-9_]*(?:(?:\.|::)[A-Za-z_][A-Za-z0-9_]*)+"
+    r"|[A-Za-z0-9]*_[A-Za-z0-9_]+"
+    r"|[a-z][a-z0-9]*[A-Z][A-Za-z0-9]*"
+    r"|[A-Z][a-z0-9]+[A-Z][A-Za-z0-9]*)(?:\(\))?")
 
 
 class VectorRetriever:
@@ -12,24 +31,63 @@ class VectorRetriever:
     Attributes:
         openai (OpenAIClient): An instance of OpenAIClient for fetching alternate questions and creating embeddings.
         mongo_client (MongoDBAtlasClient): An instance of MongoDBAtlasClient for database operations.
+        vector_store (VectorStore): The vector search backend.
+        expansion_mode (str): Default expansion mode, "off", "cached" or "on".
+        expansion_cache (TTLCache): Cache of the alternate questions by normalized question.
+        lexical_index (LexicalIndex): BM25 index whose hits are fused with the vector hits.
 
     Methods:
         invoke(chatRequest: ChatRequest, collections: List[str], filters: dict) -> dict: 
             Invokes OpenAI to fetch alternate questions based on the input chat request.
-        _vector_search(collections: List[str], source: List[str], pre_filters: dict) -> str: 
-            Performs vector search on the specified collections and returns results.
+        _expand(question: str, mode: str) -> List[str]: 
+            Returns the questions to search for, expanding the question unless the mode or the question says otherwise.
+        _vector_search(collections: List[str], source: List[str], pre_filters: dict) -> List[dict]: 
+            Performs vector search on the specified collections and returns ranked hits.
+        _lexical_search(collections: List[str], question: str, filters: dict) -> List[dict]: 
+            Performs BM25 search on the lexical index and returns ranked hits.
+        _fuse(rankings: List[List[dict]]) -> List[dict]: 
+            Merges rankings by reciprocal rank fusion.
+        _has_identifier(collections: List[str], question: str, filters: dict) -> bool: 
+            Tells whether the lexical index holds the identifiers of the question as whole terms.
+        _search(col: str, query_vector: List[float], filters: dict) -> List[dict]: 
+            Runs a single vector search on one collection.
     """
 
-    def __init__(self, openai: OpenAIClient, mongo_client: MongoDBAtlasClient):
+    def __init__(self, openai: OpenAIClient, mongo_client: MongoDBAtlasClient, vector_store: VectorStore = None,
+                 expansion_mode: str = "on", expansion_questions: int = 5, expansion_cache: TTLCache = None,
+                 skip_keyword_queries: bool = False, keyword_max_words: int = 4, lexical_index: LexicalIndex = None,
+                 lexical_limit: int = 10, rrf_k: int = 60, identifier_shortcut: bool = True):
         """
         Initializes VectorRetriever with OpenAIClient and MongoDBAtlasClient instances.
 
         Args:
             openai (OpenAIClient): An instance of OpenAIClient.
             mongo_client (MongoDBAtlasClient): An instance of MongoDBAtlasClient.
+            vector_store (VectorStore, optional): The vector search backend. Defaults to Atlas $vectorSearch.
+            expansion_mode (str, optional): "off" searches the question only, "cached" reuses the alternate questions of
+                identical questions, "on" always asks for new ones. Defaults to "on".
+            expansion_questions (int, optional): The number of alternate questions requested. Defaults to 5.
+            expansion_cache (TTLCache, optional): Cache used by the "cached" mode. Without it "cached" behaves as "on".
+            skip_keyword_queries (bool, optional): Whether short, keyword-like questions skip expansion. Defaults to False.
+            keyword_max_words (int, optional): The most words of a keyword-like question. Defaults to 4.
+            lexical_index (LexicalIndex, optional): BM25 index fused with the vector search. Defaults to vector search only.
+            lexical_limit (int, optional): The number of BM25 hits fused. Defaults to 10.
+            rrf_k (int, optional): The rank offset of reciprocal rank fusion. Defaults to 60.
+            identifier_shortcut (bool, optional): Whether questions naming a code identifier are answered from the
+                BM25 hits alone, without expansion or embedding, when a chunk holds the whole identifier. Defaults to True.
         """
         self.openai = openai
         self.mongo_client = mongo_client
+        self.vector_store = vector_store or AtlasVectorStore(mongo_client)
+        self.expansion_mode = expansion_mode
+        self.expansion_questions = expansion_questions
+        self.expansion_cache = expansion_cache
+        self.skip_keyword_queries = skip_keyword_queries
+        self.keyword_max_words = keyword_max_words
+        self.lexical_index = lexical_index
+        self.lexical_limit = lexical_limit
+        self.rrf_k = rrf_k
+        self.identifier_shortcut = identifier_shortcut
 
     async def invoke(self, chatRequest: ChatRequest, collections=List[str]):
         """
@@ -42,67 +100,180 @@ class VectorRetriever:
         Returns:
             str: A dictionary containing alternate questions fetched from OpenAI.
         """
-        question, filters = chatRequest
-        varients = await self.openai.fetch_alternate_questions(question, 5)
-        response = await self._vector_search(collections, varients, filters)
-        return response
+        question, filters = chatRequest.question, chatRequest.filters
+
+        # Identifiers are found by exact terms, skip the expansion and embedding when the index holds the
+        # whole identifier, not only some of its words
+        if self.identifier_shortcut and self.lexical_index is not None and self._is_identifier_query(question) \
+                and self._has_identifier(collections, question, filters):
+            lexical_hits = await self._lexical_search(collections, question, filters)
+            if lexical_hits:
+                return self._to_json(lexical_hits)
+
+        async def vector_hits():
+            varients = await self._expand(question, chatRequest.expansion or self.expansion_mode)
+            return await self._vector_search(collections, varients or [question], filters)
+
+        vector_ranking, lexical_ranking = await asyncio.gather(
+            vector_hits(), self._lexical_search(collections, question, filters))
+        ranked = self._fuse([vector_ranking, lexical_ranking]) if lexical_ranking else vector_ranking
+        return self._to_json(ranked)
+
+    async def _expand(self, question: str, mode: str) -> List[str]:
+        """
+        Returns the questions to search for, expanding the question unless the mode or the question says otherwise.
+
+        Args:
+            question (str): The user's question.
+            mode (str): "off", "cached" or "on".
+
+        Returns:
+            List[str]: The alternate questions, or the question itself when it is not expanded.
+        """
+        if mode == "off" or (self.skip_keyword_queries and self._is_keyword_query(question)):
+            return [question]
+
+        cache = self.expansion_cache if mode == "cached" else None
+        key = (normalize_question(question), self.expansion_questions)
+        if cache is not None:
+            varients = cache.get(key)
+            if varients is not None:
+                EXPANSION_CACHE_HITS.inc()
+                return varients
+            EXPANSION_CACHE_MISSES.inc()
+
+        with EXPANSION_SECONDS.time():
+            varients = [varient for varient in await self.openai.fetch_alternate_questions(question, self.expansion_questions) or []
+                        if varient.strip()]
+        if cache is not None and varients:
+            cache.set(key, varients)
+        return varients or [question]
 
-    async def _vector_search(self, collections: List[str], source: List[str], filters: dict):
+    def _is_keyword_query(self, question: str) -> bool:
+        """
+        Tells whether a question is a few keywords, which expansion would not improve, rather than a sentence.
+        """
+        words = question.split()
+        if not words or len(words) > self.keyword_max_words or "?" in question:
+            return False
+        return not any(word.lower().strip(",.;:!") in QUESTION_WORDS for word in words)
+
+    async def _vector_search(self, collections: List[str], source: List[str], filters: dict) -> List[dict]:
         """
         Performs vector search on the specified collections and returns results.
 
+        All query variants are embedded in a single batch and every (collection, variant) search runs
+        concurrently. Hits are merged and deduplicated by chunk_id, keeping the best score.
+
         Args:
             collections (List[str]): A list of MongoDB collections to search.
             source (List[str]): A list of strings representing vectors to search for.
             filters (dict): Filters to apply before performing the search.
 
         Returns:
-            str: A JSON string containing the search results.
-        """
-        query_vectors = []
-        for query in source:
-            try:
-                embedding = await self.openai.create_embedding(query)
-                query_vectors.append(embedding)
-            except Exception as e:
-                print(f"Error creating embedding for query '{query}': {e}")
-
-        for col in collections:
-            results = []
-            try:
-                collection = self.mongo_client.db[col]
-                for query_vector in query_vectors:
-                    try:
-                        params = {
-                            "queryVector": query_vector[0],
-                            "path": "vector_chunk",
-                            "numCandidates": 100,
-                            "limit": 1,
-                            "index": "rag_doc_index",
-                        }
-
-                        if filters:
-                            params["filter"] = filters
-
-                        query = {"$vectorSearch": params}
-
-                        pipeline = [
-                            query,
-                            {"$set": {"score": {"$meta": "vectorSearchScore"}}}
-                        ]
-
-                        response = collection.aggregate(pipeline=pipeline)
-                        for res in response:
-                            try:
-                                chunk_res = self.mongo_client.get(col, {"chunk_id": res['chunk_id']}, {
-                                    "raw_chunk": 1, "_id": 0}, 'single')
-                                results.append({'score': res['score'], 'text': chunk_res['raw_chunk'],
-                                                'source':  'demo.docx'})
-                            except Exception as e:
-                                print(f"Error processing result: {e}")
-                    except Exception as e:
-                        print(f"Error querying collection '{col}': {e}")
-            except Exception as e:
-                print(f"Error accessing collection '{col}': {e}")
-
-        return json.dumps(results)
+            List[dict]: The hits, best first.
+        """
+        source = [query for query in source if query.strip()]
+        try:
+            query_vectors = await self.openai.create_embeddings(source)
+        except Exception as e:
+            print(f"Error creating embeddings for queries {source}: {e}")
+            query_vectors = []
+
+        searches = [
+            self._search(col, query_vector, filters)
+            for col in collections
+            for query_vector in query_vectors
+        ]
+
+        results = {}
+        for hits in await asyncio.gather(*searches):
+            for hit in hits:
+                best = results.get(hit['chunk_id'])
+                if best is None or hit['score'] > best['score']:
+                    results[hit['chunk_id']] = hit
+
+        return sorted(results.values(), key=lambda hit: hit['score'], reverse=True)
+
+    async def _lexical_search(self, collections: List[str], question: str, filters: dict) -> List[dict]:
+        """
+        Performs BM25 search on the lexical index, when it holds one of the collections.
+
+        Args:
+            collections (List[str]): A list of MongoDB collections to search.
+            question (str): The user's question.
+            filters (dict): Filters to apply before performing the search.
+
+        Returns:
+            List[dict]: The hits, best first.
+        """
+        if self.lexical_index is None or self.lexical_index.collection not in collections:
+            return []
+        try:
+            return await self.lexical_index.search(question, filters, limit=self.lexical_limit)
+        except Exception as e:
+            logger.error(f"Error querying the lexical index: {e}")
+            return []
+
+    def _fuse(self, rankings: List[List[dict]]) -> List[dict]:
+        """
+        Merges rankings by reciprocal rank fusion, each hit scoring the sum of 1 / (rrf_k + rank) over the rankings.
+
+        Args:
+            rankings (List[List[dict]]): The rankings, best first.
+
+        Returns:
+            List[dict]: The hits with their fused score, best first.
+        """
+        hits, scores = {}, {}
+        for ranking in rankings:
+            for rank, hit in enumerate(ranking, start=1):
+                hits.setdefault(hit['chunk_id'], hit)
+                scores[hit['chunk_id']] = scores.get(hit['chunk_id'], 0.0) + 1.0 / (self.rrf_k + rank)
+        return [{**hits[chunk_id], 'score': score}
+                for chunk_id, score in sorted(scores.items(), key=lambda item: item[1], reverse=True)]
+
+    def _is_identifier_query(self, question: str) -> bool:
+        """
+        Tells whether a question is a few words naming a code identifier, e.g. "get_token_counts" or "DocumentHandler.ingest".
+        """
+        words = question.split()
+        return 0 < len(words) <= 3 and any(IDENTIFIER.fullmatch(word.strip("`'\",;:?")) for word in words)
+
+    def _has_identifier(self, collections: List[str], question: str, filters: dict) -> bool:
+        """
+        Tells whether a chunk of the lexical index holds the identifiers of the question as whole terms, e.g.
+        "gettokencounts" for "getTokenCounts()".
+        """
+        if self.lexical_index.collection not in collections:
+            return False
+        words = (word.strip("`'\",;:?") for word in question.split())
+        terms = [term.lower() for word in words if IDENTIFIER.fullmatch(word) for term in WORD.findall(word)]
+        try:
+            return self.lexical_index.contains(terms, filters)
+        except Exception as e:
+            logger.error(f"Error querying the lexical index: {e}")
+            return False
+
+    @staticmethod
+    def _to_json(hits: List[dict]) -> str:
+        return json.dumps([{'score': hit['score'], 'text': hit.get('text'), 'source': hit.get('source')} for hit in hits])
+
+    async def _search(self, col: str, query_vector: List[float], filters: dict) -> List[dict]:
+        """
+        Runs a single search on the vector store.
+
+        Args:
+            col (str): The MongoDB collection to search.
+            query_vector (List[float]): The embedding of the query.
+            filters (dict): Filters to apply before performing the search.
+
+        Returns:
+            List[dict]: The hits, each with chunk_id, score, text and source.
+        """
+        try:
+            with VECTOR_SEARCH_SECONDS.time():
+                return await self.vector_store.search(col, query_vector, filters, limit=1)
+        except Exception as e:
+            print(f"Error querying collection '{col}': {e}")
+            return []
@@ -0,0 +1,324 @@
+import asyncio
+import math
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+import numpy as np
+from loguru import logger
+
+from services.database import MongoDBAtlasClient
+from services.synced_index import SyncedIndex, match_filters
+from utils.vectors import decode_vector, vector_dimensions
+
+
+class VectorStore(ABC):
+    """
+    Nearest neighbour search over the embedded chunks.
+
+    Hits are dictionaries with the chunk_id, score, text and source of a chunk. Scores follow the
+    Atlas cosine similarity score, (1 + cosine) / 2.
+    """
+
+    async def load(self):
+        """
+        Loads the stored vectors, for backends searching a copy of them.
+        """
+
+    async def sync_document(self, documents_id: str):
+        """
+        Brings the chunks of a document up to date after it was ingested, updated or deleted.
+
+        Args:
+            documents_id (str): The ID of the document.
+        """
+
+    async def refresh(self):
+        """
+        Picks up documents changed by other processes since the last refresh.
+        """
+
+    @abstractmethod
+    async def search(self, collection: str, query_vector: List[float], filters: dict = None, limit: int = 1) -> List[dict]:
+        """
+        Finds the chunks closest to a query vector.
+
+        Args:
+            collection (str): The collection holding the chunks.
+            query_vector (List[float]): The embedding of the query.
+            filters (dict, optional): Filter on the chunk fields applied before the search.
+            limit (int, optional): The number of hits to return. Defaults to 1.
+
+        Returns:
+            List[dict]: The hits, best first.
+        """
+
+
+class AtlasVectorStore(VectorStore):
+    """
+    Searches with the Atlas $vectorSearch stage, the index is maintained by Atlas.
+    """
+
+    def __init__(self, mongo_client: MongoDBAtlasClient, index: str = "rag_doc_index", num_candidates: int = 100):
+        """
+        Initializes the AtlasVectorStore.
+
+        Args:
+            mongo_client (MongoDBAtlasClient): MongoDB client for database operations.
+            index (str, optional): The Atlas vector search index. Defaults to "rag_doc_index".
+            num_candidates (int, optional): The number of candidates the index considers. Defaults to 100.
+        """
+        self.mongo_client = mongo_client
+        self.index = index
+        self.num_candidates = num_candidates
+
+    async def search(self, collection: str, query_vector: List[float], filters: dict = None, limit: int = 1) -> List[dict]:
+        params = {
+            "queryVector": query_vector,
+            "path": "vector_chunk",
+            "numCandidates": max(self.num_candidates, limit),
+            "limit": limit,
+            "index": self.index,
+        }
+
+        if filters:
+            params["filter"] = filters
+
+        # Project only what the caller needs, which keeps vector_chunk off the wire and
+        # avoids a follow-up lookup per hit
+        pipeline = [
+            {"$vectorSearch": params},
+            {"$project": {
+                "_id": 0,
+                "chunk_id": 1,
+                "text": "$raw_chunk",
+                "source": "$file_name",
+                "score": {"$meta": "vectorSearchScore"}
+            }}
+        ]
+        return await self.mongo_client.db[collection].aggregate(pipeline=pipeline).to_list(length=None)
+
+
+class _VectorIndex:
+    """
+    Immutable snapshot of the in-process index. Changes build a new snapshot, so searches running in
+    threads never see a half-applied change.
+
+    Attributes:
+        matrix (np.ndarray): The normalized vectors, one float32 row per chunk.
+        columns (Dict[str, np.ndarray]): The chunk_id, documents_id and file_name of each row.
+        centroids (np.ndarray, optional): The normalized IVF list centroids, None for exact search.
+        assignments (np.ndarray, optional): The IVF list of each row.
+        trained_rows (int): The number of rows the centroids were trained on.
+    """
+
+    def __init__(self, matrix: np.ndarray, columns: Dict[str, np.ndarray], centroids: np.ndarray = None,
+                 assignments: np.ndarray = None, trained_rows: int = 0):
+        self.matrix = matrix
+        self.columns = columns
+        self.centroids = centroids
+        self.assignments = assignments
+        self.trained_rows = trained_rows
+        self._lists = None
+
+    @classmethod
+    def empty(cls, dimensions: int = 0) -> "_VectorIndex":
+        return cls(np.zeros((0, dimensions), dtype=np.float32),
+                   {name: np.array([], dtype=object) for name in NumpyVectorStore.COLUMNS})
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @property
+    def lists(self) -> List[np.ndarray]:
+        """
+        The row numbers of every IVF list, built on first use.
+        """
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind="stable")
+            bounds = np.searchsorted(self.assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists = [order[bounds[i]:bounds[i + 1]] for i in range(len(self.centroids))]
+        return self._lists
+
+
+class NumpyVectorStore(SyncedIndex, VectorStore):
+    """
+    Searches a copy of the embedded chunks held in process memory as a contiguous float32 matrix.
+
+    In "exact" mode every query is scored against every row. In "ivf" mode, once the collection holds
+    `ivf_min_rows` rows, the rows are clustered with k-means into inverted lists and a query only scores
+    the rows of its `ivf_probes` closest lists.
+
+    Only the vectors and the fields usable in filters are held in memory, the text of the hits is read
+    from the collection.
+    """
+
+    COLUMNS = ("chunk_id", "documents_id", "file_name")
+
+    def __init__(self, mongo_client: MongoDBAtlasClient, collection: str, documents_collection: str = "documents",
+                 mode: str = "exact", ivf_lists: Optional[int] = None, ivf_probes: int = 8, ivf_min_rows: int = 10000):
+        """
+        Initializes the NumpyVectorStore.
+
+        Args:
+            mongo_client (MongoDBAtlasClient): MongoDB client for database operations.
+            collection (str): The collection of embedded chunks held by the store.
+            documents_collection (str, optional): The collection of documents, polled on refresh. Defaults to "documents".
+            mode (str, optional): "exact" or "ivf". Defaults to "exact".
+            ivf_lists (int, optional): The number of inverted lists. Defaults to the square root of the number of rows.
+            ivf_probes (int, optional): The number of lists searched per query. Defaults to 8.
+            ivf_min_rows (int, optional): Below this many rows "ivf" mode searches exactly. Defaults to 10000.
+        """
+        if mode not in ("exact", "ivf"):
+            raise ValueError(f"Invalid vector store mode: {mode}")
+        super().__init__(mongo_client, documents_collection)
+        self.collection = collection
+        self.mode = mode
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = ivf_probes
+        self.ivf_min_rows = ivf_min_rows
+        self.index = _VectorIndex.empty()
+
+    async def load(self):
+        async with self._lock:
+            versions = await self._fetch_versions()
+            rows = await self.mongo_client.db[self.collection].find(
+                {}, self._projection()).to_list(length=None)
+            self.index = await asyncio.to_thread(self._build, _VectorIndex.empty(), None, rows)
+            self._versions = versions
+        logger.info(f"Loaded {len(self.index)} vectors from '{self.collection}'")
+
+    async def search(self, collection: str, query_vector: List[float], filters: dict = None, limit: int = 1) -> List[dict]:
+        if collection != self.collection:
+            raise ValueError(f"Collection '{collection}' is not held by the vector store")
+
+        index = self.index
+        hits = await asyncio.to_thread(self._search, index, query_vector, filters, limit)
+        if not hits:
+            return []
+
+        # Read the text of the hits only
+        chunks = await self.mongo_client.db[collection].find(
+            {"chunk_id": {"$in": [chunk_id for chunk_id, _ in hits]}},
+            {"_id": 0, "chunk_id": 1, "raw_chunk": 1, "file_name": 1}).to_list(length=None)
+        chunks = {chunk["chunk_id"]: chunk for chunk in chunks}
+        return [
+            {"chunk_id": chunk_id, "text": chunks[chunk_id].get("raw_chunk"),
+             "source": chunks[chunk_id].get("file_name"), "score": score}
+            for chunk_id, score in hits if chunk_id in chunks
+        ]
+
+    def _projection(self) -> dict:
+        """
+        Returns the projection reading the vectors and in-memory fields of the chunks.
+        """
+        return {"_id": 0, "vector_chunk": 1, "vector_format": 1, "vector_scale": 1, **{name: 1 for name in self.COLUMNS}}
+
+    async def _sync(self, documents_ids: List[str]):
+        """
+        Replaces the rows of the documents with the chunks stored for them, in a single new snapshot. Called
+        with the lock held.
+        """
+        rows = await self.mongo_client.db[self.collection].find(
+            {"documents_id": {"$in": documents_ids}},
+            self._projection()).to_list(length=None)
+        self.index = await asyncio.to_thread(self._build, self.index, documents_ids, rows)
+
+    def _build(self, index: _VectorIndex, documents_ids: Optional[List[str]], rows: List[dict]) -> _VectorIndex:
+        """
+        Builds a snapshot from `index` with the rows of `documents_ids` replaced by `rows`.
+        """
+        rows = [row for row in rows if row.get("vector_chunk")]
+        keep = None
+        if documents_ids and len(index):
+            keep = ~np.isin(index.columns["documents_id"], documents_ids)
+
+        dimensions = index.matrix.shape[1]
+        if rows:
+            dimensions = vector_dimensions(rows[0]["vector_chunk"], rows[0].get("vector_format"))
+            if len(index) and dimensions != index.matrix.shape[1]:
+                raise ValueError(f"Expected vectors of {index.matrix.shape[1]} dimensions, got {dimensions}")
+
+        # Stored vectors, packed or not, are decoded straight into their matrix row
+        vectors = np.empty((len(rows), dimensions), dtype=np.float32)
+        for vector, row in zip(vectors, rows):
+            decode_vector(row["vector_chunk"], row.get("vector_format"), row.get("vector_scale"), out=vector)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        old_matrix = index.matrix if keep is None else index.matrix[keep]
+        matrix = np.ascontiguousarray(np.concatenate([old_matrix, vectors]) if len(old_matrix) else vectors)
+        columns = {}
+        for name in self.COLUMNS:
+            old = index.columns[name] if keep is None else index.columns[name][keep]
+            new = np.empty(len(rows), dtype=object)
+            new[:] = [row.get(name) for row in rows]
+            columns[name] = np.concatenate([old, new])
+
+        if self.mode != "ivf" or len(matrix) < self.ivf_min_rows:
+            return _VectorIndex(matrix, columns)
+
+        # Assign new rows to the trained lists, and train again once the index doubled
+        if index.centroids is not None and len(matrix) < 2 * index.trained_rows:
+            old_assignments = index.assignments if keep is None else index.assignments[keep]
+            assignments = np.concatenate([old_assignments, self._assign(index.centroids, vectors)])
+            return _VectorIndex(matrix, columns, index.centroids, assignments, index.trained_rows)
+
+        centroids = self._train(matrix)
+        return _VectorIndex(matrix, columns, centroids, self._assign(centroids, matrix), len(matrix))
+
+    def _train(self, matrix: np.ndarray, iterations: int = 10) -> np.ndarray:
+        """
+        Clusters the rows with spherical k-means on a sample, returns the normalized centroids.
+        """
+        n_lists = min(self.ivf_lists or int(math.sqrt(len(matrix))), len(matrix))
+        rng = np.random.default_rng(0)
+        sample = matrix[rng.choice(len(matrix), size=min(len(matrix), n_lists * 256), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = self._assign(centroids, sample)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Lists that lost every row keep their centroid
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+        return centroids
+
+    def _assign(self, centroids: np.ndarray, vectors: np.ndarray, block: int = 65536) -> np.ndarray:
+        """
+        Returns the closest centroid of every vector, in blocks to bound the score matrix.
+        """
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block):
+            assignments[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+        return assignments
+
+    def _search(self, index: _VectorIndex, query_vector: List[float], filters: dict, limit: int) -> List[tuple]:
+        """
+        Scores the query against the candidate rows of the snapshot. Runs in a thread.
+
+        Returns:
+            List[tuple]: The (chunk_id, score) of the best rows.
+        """
+        if not len(index) or limit <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+
+        candidates = None
+        if index.centroids is not None:
+            probes = np.argsort(index.centroids @ query)[::-1][:self.ivf_probes]
+            candidates = np.concatenate([index.lists[probe] for probe in probes])
+        if filters:
+            mask = match_filters(filters, index.columns)
+            candidates = np.flatnonzero(mask) if candidates is None else candidates[mask[candidates]]
+
+        if candidates is None:
+            scores = index.matrix @ query
+            rows = np.arange(len(scores))
+        else:
+            scores = index.matrix[candidates] @ query
+            rows = candidates
+        if not len(scores):
+            return []
+
+        top = np.argpartition(-scores, limit - 1)[:limit] if len(scores) > limit else np.arange(len(scores))
+        top = top[np.argsort(-scores[top])]
+        return [(index.columns["chunk_id"][rows[i]], (1 + float(scores[i])) / 2) for i in top]
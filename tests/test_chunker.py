@@ -0,0 +1,92 @@
+from typing import List
+import pytest
+
+from utils.chunker import Chunk, TokenChunker
+
+PROSE = " ".join(f"Sentence {i} tells how the worker number {i * 7} retries request {i}." for i in range(300))
+# Accented letters, CJK and emoji span several bytes and often several tokens per character
+MULTIBYTE = "Ünïcödé naïve café 日本語のテキストを分割する 😀🎉👩‍💻 " * 120
+PARAGRAPHS = [f"Paragraph {i} explains how the service number {i * 7} handles request {i} and retries twice."
+              for i in range(120)]
+
+
+def common_ends(old: List[Chunk], new: List[Chunk]) -> tuple:
+    """
+    Returns the number of leading and trailing chunks two splits share.
+    """
+    prefix = 0
+    while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(len(old), len(new)) - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    return prefix, suffix
+
+
+@pytest.mark.parametrize("text", ["", "   ", "\n\n\t\n"])
+def test_split_empty_text(text):
+    assert TokenChunker().split(text) == []
+
+
+@pytest.mark.parametrize("text", [PROSE, MULTIBYTE, "\n\n".join(PARAGRAPHS)])
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(16, 0), (64, 0), (64, 16), (17, 5)])
+def test_chunks_fit_in_chunk_size_without_broken_characters(text, chunk_size, chunk_overlap):
+    chunker = TokenChunker(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    chunks = chunker.split(text)
+
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert chunk.text and chunk.text == chunk.text.strip()
+        assert "�" not in chunk.text
+        # The chunk is sent on its own, its tokens are counted as the embedding model counts them
+        assert chunk.token_count == len(chunker.encoding.encode(chunk.text)) <= chunk_size
+
+
+@pytest.mark.parametrize("text", [PROSE, MULTIBYTE])
+def test_chunks_without_overlap_cover_the_text_once(text):
+    chunks = TokenChunker(chunk_size=32).split(text)
+
+    assert "".join("".join(chunk.text.split()) for chunk in chunks) == "".join(text.split())
+
+
+def test_consecutive_chunks_share_the_overlap():
+    chunker = TokenChunker(chunk_size=40, chunk_overlap=10)
+
+    chunks = chunker.split(PROSE)
+
+    for previous, chunk in zip(chunks, chunks[1:]):
+        shared = chunker.encoding.decode(chunker.encoding.encode(chunk.text)[:8]).strip()
+        assert previous.text.endswith(shared) or shared in previous.text[-len(shared) - 80:]
+    # The overlap repeats text, so the chunks hold more than the text itself
+    assert sum(chunk.token_count for chunk in chunks) > len(chunker.encoding.encode(PROSE)) + 5 * (len(chunks) - 1)
+
+
+def test_chunks_end_at_paragraphs_first():
+    chunks = TokenChunker(chunk_size=64).split("\n\n".join(PARAGRAPHS))
+
+    assert all(chunk.text.endswith("retries twice.") for chunk in chunks)
+
+
+def test_invalid_overlap_is_rejected():
+    with pytest.raises(ValueError):
+        TokenChunker(chunk_size=10, chunk_overlap=10)
+
+
+def test_edit_only_changes_the_chunks_of_its_section():
+    chunker = TokenChunker(chunk_size=64, anchor_modulus=4)
+    edited = list(PARAGRAPHS)
+    edited[60] = ("Paragraph sixty was rewritten with a much longer explanation of the retry policy, its backoff, "
+                  "its jitter and its limits.")
+
+    old = chunker.split("\n\n".join(PARAGRAPHS))
+    new = chunker.split("\n\n".join(edited))
+
+    prefix, suffix = common_ends(old, new)
+    changed = new[prefix:len(new) - suffix]
+    # The chunks before and after the section of the edited paragraph are the same
+    assert prefix > 0 and suffix > 0
+    assert 0 < len(changed) <= 2
+    assert any(edited[60] in chunk.text for chunk in changed)
+    # Sections only apply to text longer than a chunk
+    assert [chunk.text for chunk in chunker.split(PARAGRAPHS[0])] == [PARAGRAPHS[0]]
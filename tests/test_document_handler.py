@@ -0,0 +1,151 @@
+import asyncio
+from types import SimpleNamespace
+from typing import List
+from bson import ObjectId
+from langchain_core.documents import Document
+from mongomock_motor import AsyncMongoMockClient
+
+from utils.chunker import Chunk
+from models.document import Document as DocumentModel, DocumentRepository
+from models.embedded_document import EmbeddedDocumentRepository
+from services.document_handler import DocumentHandler
+
+
+class LineParser:
+    """
+    Loads the text set for the next ingestion instead of reading the staged file.
+    """
+
+    def __init__(self):
+        self.text = ""
+
+    async def load(self, file: str, file_extension: str) -> List[Document]:
+        return [Document(page_content=self.text)]
+
+
+class LineChunker:
+    """
+    Cuts one chunk per line, so a test picks the chunks of every version of a document.
+    """
+
+    def split(self, text: str) -> List[Chunk]:
+        return [Chunk(line, 1) for line in text.split("\n") if line]
+
+
+class RecordingOpenAI:
+    """
+    Returns a fixed vector per chunk and records every chunk it was asked to embed.
+    """
+
+    def __init__(self):
+        self.embedded = []
+
+    async def create_embeddings(self, texts: List[str], token_counts: List[int]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[1.0, 0.0] for _ in texts]
+
+
+def make_handler():
+    database = AsyncMongoMockClient()["test"]
+    openai = RecordingOpenAI()
+    handler = DocumentHandler(openai, SimpleNamespace(db=database), parser=LineParser(), chunker=LineChunker())
+    return handler, openai, database
+
+
+async def ingest(handler: DocumentHandler, document: DocumentModel, text: str, name: str = None) -> List[dict]:
+    """
+    Ingests a version of the document and returns its stored chunks, in chunk id order.
+    """
+    handler.parser.text = text
+    if name is not None:
+        document.name = name
+    await handler.ingest(document)
+    collection = handler.mongo_client.db[EmbeddedDocumentRepository.Meta.collection_name]
+    rows = await collection.find({"documents_id": str(document.id)}).to_list(length=None)
+    return sorted(rows, key=lambda row: row["chunk_id"])
+
+
+async def new_document(handler: DocumentHandler) -> DocumentModel:
+    document = DocumentModel(id=ObjectId(), name="notes.txt", type="txt", status="processing", path="/tmp/notes.txt")
+    await DocumentRepository(database=handler.mongo_client.db).save(document)
+    return document
+
+
+def test_ingest_embeds_only_changed_chunks():
+    async def run():
+        handler, openai, _ = make_handler()
+        document = await new_document(handler)
+        first = await ingest(handler, document, "alpha\nbeta\ngamma")
+        openai.embedded.clear()
+        second = await ingest(handler, document, "alpha\nbeta changed\ngamma")
+        return first, second, openai.embedded
+
+    first, second, embedded = asyncio.run(run())
+
+    assert embedded == ["beta changed"]
+    # Unchanged chunks keep their stored rows and the new one is numbered after them
+    kept = {row["_id"] for row in first if row["raw_chunk"] != "beta"}
+    assert kept <= {row["_id"] for row in second}
+    assert [row["raw_chunk"] for row in second] == ["alpha", "gamma", "beta changed"]
+    assert second[-1]["chunk_id"].endswith("-4")
+
+
+def test_ingest_deletes_stale_chunks():
+    async def run():
+        handler, openai, database = make_handler()
+        document = await new_document(handler)
+        await ingest(handler, document, "alpha\nbeta\ngamma")
+        openai.embedded.clear()
+        rows = await ingest(handler, document, "alpha")
+        stored = await DocumentRepository(database=database).get_chunks_version(str(document.id))
+        return rows, openai.embedded, stored
+
+    rows, embedded, version = asyncio.run(run())
+
+    assert embedded == []
+    assert [row["raw_chunk"] for row in rows] == ["alpha"]
+    assert version == 2
+
+
+def test_ingest_renames_stored_chunks():
+    async def run():
+        handler, openai, database = make_handler()
+        document = await new_document(handler)
+        await ingest(handler, document, "alpha\nbeta")
+        openai.embedded.clear()
+        rows = await ingest(handler, document, "alpha\nbeta", name="meeting notes.txt")
+        renamed = await DocumentRepository(database=database).get_chunks_version(str(document.id))
+        await ingest(handler, document, "alpha\nbeta")
+        unchanged = await DocumentRepository(database=database).get_chunks_version(str(document.id))
+        return rows, openai.embedded, renamed, unchanged
+
+    rows, embedded, renamed, unchanged = asyncio.run(run())
+
+    assert embedded == []
+    assert {row["file_name"] for row in rows} == {"meeting_notes.txt"}
+    # A rename changes the chunks, ingesting the same version again does not
+    assert renamed == 2
+    assert unchanged == 2
+
+
+def test_ingest_matches_duplicate_chunks_once_per_stored_row():
+    async def run():
+        handler, openai, _ = make_handler()
+        document = await new_document(handler)
+        first = await ingest(handler, document, "same\nsame\nother")
+        openai.embedded.clear()
+        grown = await ingest(handler, document, "same\nsame\nsame\nother")
+        grown_embedded = list(openai.embedded)
+        openai.embedded.clear()
+        shrunk = await ingest(handler, document, "same\nother")
+        return first, grown, grown_embedded, shrunk, openai.embedded
+
+    first, grown, grown_embedded, shrunk, shrunk_embedded = asyncio.run(run())
+
+    # Two stored rows cover two of the three identical chunks, the third one is embedded
+    assert grown_embedded == ["same"]
+    assert [row["raw_chunk"] for row in grown].count("same") == 3
+    assert {row["_id"] for row in first} <= {row["_id"] for row in grown}
+    # One stored row covers the remaining chunk, the two others are deleted
+    assert shrunk_embedded == []
+    assert sorted(row["raw_chunk"] for row in shrunk) == ["other", "same"]
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import math
+from types import SimpleNamespace
+from typing import List
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from core.model import ChatRequest
+from services.lexical_index import LexicalIndex, _Segment, tokenize
+from services.vector_retriever import VectorRetriever
+
+FIRST, SECOND = str(ObjectId()), str(ObjectId())
+
+
+def make_chunk(documents_id: str, position: int, text: str) -> dict:
+    return {"chunk_id": f"{documents_id}-{position}", "documents_id": documents_id, "file_name": "notes.txt",
+            "raw_chunk": text}
+
+
+async def make_database(chunks: List[dict]):
+    """
+    Stores the chunks and one document per documents_id.
+    """
+    database = AsyncMongoMockClient()["test"]
+    if chunks:
+        await database["embedded_documents"].insert_many([dict(chunk) for chunk in chunks])
+    for documents_id in sorted({chunk["documents_id"] for chunk in chunks}):
+        await database["documents"].insert_one({"_id": ObjectId(documents_id), "chunks_version": 1})
+    return database
+
+
+async def replace_chunks(database, documents_id: str, chunks: List[dict]):
+    """
+    Replaces the chunks of a document the way an ingestion does, bumping its chunks version.
+    """
+    await database["embedded_documents"].delete_many({"documents_id": documents_id})
+    if chunks:
+        await database["embedded_documents"].insert_many([dict(chunk) for chunk in chunks])
+    await database["documents"].update_one({"_id": ObjectId(documents_id)}, {"$inc": {"chunks_version": 1}})
+
+
+async def make_index(database, **kwargs) -> LexicalIndex:
+    index = LexicalIndex(SimpleNamespace(db=database), "embedded_documents", **kwargs)
+    await index.load()
+    return index
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("getTokenCounts", ["gettokencounts", "get", "token", "counts"]),
+    ("get_token_counts", ["get_token_counts", "get", "token", "counts"]),
+    ("getHTTPResponse", ["gethttpresponse", "get", "http", "response"]),
+    ("DocumentHandler.ingest()", ["documenthandler", "document", "handler", "ingest"]),
+    ("The cat is on a mat", ["cat", "mat"]),
+    ("TOKEN token", ["token", "token"]),
+    ("x y 7", []),
+    ("a" * 65 + " kept", ["kept"]),
+])
+def test_tokenize(text, expected):
+    assert tokenize(text) == expected
+
+
+def test_search_ranks_by_bm25():
+    chunks = [
+        make_chunk(FIRST, 1, "alpha beta"),
+        make_chunk(FIRST, 2, "alpha alpha gamma delta"),
+        make_chunk(SECOND, 1, "epsilon zeta"),
+    ]
+
+    async def run():
+        index = await make_index(await make_database(chunks))
+        return await index.search("alpha"), await index.search("gamma epsilon", {"documents_id": SECOND})
+
+    hits, filtered = asyncio.run(run())
+
+    k1, b, average_length = 1.2, 0.75, 8 / 3
+    idf = math.log(1 + (3 - 2 + 0.5) / (2 + 0.5))
+
+    def score(tf, length):
+        return idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * length / average_length))
+
+    assert [hit["chunk_id"] for hit in hits] == [f"{FIRST}-2", f"{FIRST}-1"]
+    assert hits[0]["score"] == pytest.approx(score(2, 4), rel=1e-5)
+    assert hits[1]["score"] == pytest.approx(score(1, 2), rel=1e-5)
+    assert hits[0]["text"] == "alpha alpha gamma delta"
+    assert [hit["chunk_id"] for hit in filtered] == [f"{SECOND}-1"]
+
+
+def test_sync_marks_replaced_rows_dead_until_merged():
+    chunks = [make_chunk(FIRST, 1, "alpha beta"), make_chunk(SECOND, 1, "alpha gamma")]
+
+    async def run():
+        database = await make_database(chunks)
+        index = await make_index(database)
+        await replace_chunks(database, FIRST, [make_chunk(FIRST, 2, "beta delta")])
+        await index.sync_document(FIRST)
+        before = [segment.alive.tolist() for segment in index.segments]
+        hits = await index.search("alpha beta delta")
+
+        merged = _Segment.merge("merged", index.segments)
+        index.segments = [merged]
+        merged_hits = await index.search("alpha beta delta")
+        return before, hits, merged, merged_hits
+
+    before, hits, merged, merged_hits = asyncio.run(run())
+
+    # The replaced row stays in the first segment as dead, the new chunk is a segment of its own
+    assert before == [[False, True], [True]]
+    assert {hit["chunk_id"] for hit in hits} == {f"{FIRST}-2", f"{SECOND}-1"}
+    # Merging drops the dead row and renumbers the postings of the live ones
+    assert len(merged) == 2
+    assert merged.columns["chunk_id"].tolist() == [f"{SECOND}-1", f"{FIRST}-2"]
+    assert merged.postings("alpha")[0].tolist() == [0]
+    assert merged.postings("delta")[0].tolist() == [1]
+    assert [(hit["chunk_id"], hit["score"]) for hit in merged_hits] == \
+        [(hit["chunk_id"], pytest.approx(hit["score"])) for hit in hits]
+
+
+def test_sync_merges_beyond_max_segments():
+    chunks = [make_chunk(FIRST, 1, "alpha"), make_chunk(SECOND, 1, "beta")]
+
+    async def run():
+        database = await make_database(chunks)
+        index = await make_index(database, max_segments=2)
+        for position in range(2, 5):
+            await replace_chunks(database, FIRST, [make_chunk(FIRST, position, f"alpha {position}")])
+            await index.sync_document(FIRST)
+        return index.segments
+
+    segments = asyncio.run(run())
+
+    assert len(segments) <= 2
+    assert sum(int(segment.alive.sum()) for segment in segments) == 2
+
+
+def test_manifest_reloads_and_catches_up(tmp_path, monkeypatch):
+    chunks = [make_chunk(FIRST, 1, "alpha beta"), make_chunk(SECOND, 1, "gamma")]
+
+    async def run():
+        database = await make_database(chunks)
+        index = await make_index(database, path=str(tmp_path))
+        await replace_chunks(database, FIRST, [make_chunk(FIRST, 2, "alpha delta")])
+        await index.sync_document(FIRST)
+        manifest = json.loads((tmp_path / "manifest.json").read_text())
+        # The process persisting the index stops, another document changes while it is down
+        index._path_lock.close()
+        await replace_chunks(database, SECOND, [make_chunk(SECOND, 2, "gamma epsilon")])
+
+        builds = []
+        build = _Segment.build
+        monkeypatch.setattr(_Segment, "build",
+                            classmethod(lambda cls, name, rows: builds.append(len(rows)) or build(name, rows)))
+        reloaded = await make_index(database, path=str(tmp_path))
+        hits = await reloaded.search("alpha epsilon gamma")
+        return manifest, reloaded, builds, hits
+
+    manifest, reloaded, builds, hits = asyncio.run(run())
+
+    assert manifest["versions"] == {FIRST: 2, SECOND: 1}
+    # Only the document changed while the index was down is indexed again, the segment left without live
+    # rows is dropped
+    assert builds == [1]
+    assert [segment.name for segment in reloaded.segments][:1] == manifest["segments"][1:]
+    assert len(reloaded.segments) == 2
+    assert reloaded._versions == {FIRST: 2, SECOND: 2}
+    assert {hit["chunk_id"] for hit in hits} == {f"{FIRST}-2", f"{SECOND}-2"}
+    assert json.loads((tmp_path / "manifest.json").read_text())["versions"] == {FIRST: 2, SECOND: 2}
+
+
+def test_fuse_sums_reciprocal_ranks():
+    retriever = VectorRetriever(None, None, vector_store=object(), rrf_k=60)
+
+    fused = retriever._fuse([
+        [{"chunk_id": "a", "score": 0.9}, {"chunk_id": "b", "score": 0.8}],
+        [{"chunk_id": "b", "score": 12.0}, {"chunk_id": "c", "score": 3.0}],
+    ])
+
+    assert [hit["chunk_id"] for hit in fused] == ["b", "a", "c"]
+    assert fused[0]["score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1]["score"] == pytest.approx(1 / 61)
+    assert fused[2]["score"] == pytest.approx(1 / 62)
+
+
+class RecordingOpenAI:
+    def __init__(self):
+        self.embedded = []
+
+    async def create_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[1.0, 0.0] for _ in texts]
+
+
+class FixedVectorStore:
+    async def search(self, collection: str, query_vector: List[float], filters: dict = None, limit: int = 1):
+        return [{"chunk_id": "vector", "score": 0.9, "text": "vector hit", "source": "vector.txt"}]
+
+
+@pytest.mark.parametrize("question, shortcut", [
+    # The whole identifier is a term of the index
+    ("getTokenCounts", True),
+    # Only the words of the identifier are, the BM25 hits are fused with the vector hits
+    ("get_token_counts()", False),
+    ("countTokens", False),
+])
+def test_identifier_shortcut_requires_the_whole_identifier(question, shortcut):
+    chunks = [make_chunk(FIRST, 1, "def getTokenCounts(texts): count the tokens of every text")]
+
+    async def run():
+        openai = RecordingOpenAI()
+        index = await make_index(await make_database(chunks))
+        retriever = VectorRetriever(openai, None, vector_store=FixedVectorStore(), lexical_index=index)
+        request = ChatRequest(document_id=FIRST, question=question, filters={}, expansion="off")
+        return json.loads(await retriever.invoke(request, ["embedded_documents"])), openai.embedded
+
+    hits, embedded = asyncio.run(run())
+
+    if shortcut:
+        assert embedded == []
+        assert [hit["source"] for hit in hits] == ["notes.txt"]
+    else:
+        assert embedded == [question]
+        assert "vector.txt" in [hit["source"] for hit in hits]
@@ -0,0 +1,112 @@
+from collections import Counter
+import pytest
+
+from services.repo_walker import GitIgnore, RepoWalker
+
+
+@pytest.mark.parametrize("lines, path, is_dir, expected", [
+    # Patterns without a slash match at any depth
+    (["*.log"], "debug.log", False, True),
+    (["*.log"], "logs/deep/debug.log", False, True),
+    (["*.log"], "debug.log.txt", False, False),
+    (["debug?.txt"], "debug1.txt", False, True),
+    (["debug?.txt"], "debug10.txt", False, False),
+    (["debug[0-9].txt"], "debug7.txt", False, True),
+    (["debug[!0-9].txt"], "debug7.txt", False, False),
+    (["debug[!0-9].txt"], "debuga.txt", False, True),
+    # A leading or inner slash anchors the pattern to the directory of the .gitignore
+    (["/build"], "build", True, True),
+    (["/build"], "src/build", True, False),
+    (["docs/*.md"], "docs/index.md", False, True),
+    (["docs/*.md"], "src/docs/index.md", False, False),
+    (["docs/*.md"], "docs/api/index.md", False, False),
+    # ** matches any number of directories
+    (["**/logs"], "logs", True, True),
+    (["**/logs"], "a/b/logs", True, True),
+    (["a/**/b.txt"], "a/b.txt", False, True),
+    (["a/**/b.txt"], "a/x/y/b.txt", False, True),
+    (["a/**/b.txt"], "c/a/x/b.txt", False, False),
+    (["out/**"], "out/x/y.txt", False, True),
+    (["out/**"], "out", True, False),
+    # A trailing slash only matches directories
+    (["tmp/"], "tmp", True, True),
+    (["tmp/"], "src/tmp", True, True),
+    (["tmp/"], "tmp", False, False),
+    # The last matching pattern wins, negation re-includes
+    (["*.txt", "!keep.txt"], "keep.txt", False, False),
+    (["*.txt", "!keep.txt"], "drop.txt", False, True),
+    (["!keep.txt", "*.txt"], "keep.txt", False, True),
+    # Comments, blank lines and escaped leading characters
+    (["# *.txt", "", "   "], "notes.txt", False, False),
+    (["\\#notes.txt"], "#notes.txt", False, True),
+    (["\\!important.txt"], "!important.txt", False, True),
+])
+def test_gitignore_matches(lines, path, is_dir, expected):
+    assert GitIgnore().extend("", lines).ignored(path, is_dir) is expected
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("generated.py", False),
+    ("src/generated.py", True),
+    ("src/lib/generated.py", True),
+    ("src/main.py", False),
+    ("src/keep/generated.py", False),
+    ("src/fixtures", True),
+    ("fixtures", False),
+])
+def test_gitignore_patterns_apply_below_their_directory(path, expected):
+    gitignore = GitIgnore().extend("", ["*.tmp"]).extend("src", ["generated.py", "/fixtures/", "!keep/generated.py"])
+
+    assert gitignore.ignored(path, path.endswith("fixtures")) is expected
+
+
+def make_tree(root, files):
+    for path, content in files.items():
+        target = root / path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(content)
+
+
+def test_walk_applies_exclude_and_gitignore_files(tmp_path):
+    make_tree(tmp_path, {
+        ".git/info/exclude": "local/\n*.secret.md\n",
+        ".git/config.txt": "never walked",
+        ".gitignore": "*.log.txt\nbuild/\n!important.log.txt\n",
+        "README.md": "readme",
+        "notes.secret.md": "excluded by .git/info/exclude",
+        "local/draft.md": "excluded directory",
+        "debug.log.txt": "ignored",
+        "important.log.txt": "re-included",
+        "build/output.txt": "ignored directory",
+        "vendor/lib.py": "not ignored, may be real source",
+        "node_modules/pkg/index.js": "skipped directory",
+        "src/.gitignore": "/generated/\n",
+        "src/main.py": "main",
+        "src/generated/models.py": "ignored below src",
+        "src/generated.txt": "kept, the pattern only matches directories",
+        "docs/generated/index.md": "kept, the pattern is anchored to src",
+        "image.png": "unsupported",
+    })
+    stats = Counter()
+
+    walked = sorted(relative for _, relative, _ in RepoWalker().walk(str(tmp_path), stats))
+
+    assert walked == [".gitignore", "README.md", "docs/generated/index.md", "important.log.txt", "src/.gitignore",
+                      "src/generated.txt", "src/main.py", "vendor/lib.py"]
+    assert stats["skipped_dir"] == 2
+    assert stats["ignored"] == 5
+    assert stats["unsupported"] == 1
+
+
+def test_walk_only_visits_requested_paths(tmp_path):
+    make_tree(tmp_path, {
+        ".gitignore": "*.tmp.txt\n",
+        "a/b/c.py": "wanted",
+        "a/b/d.py": "not requested",
+        "a/e.tmp.txt": "requested but ignored",
+        "f.md": "not requested",
+    })
+
+    walked = [relative for _, relative, _ in RepoWalker().walk(str(tmp_path), paths={"a/b/c.py", "a/e.tmp.txt"})]
+
+    assert walked == ["a/b/c.py"]
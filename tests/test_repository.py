@@ -0,0 +1,66 @@
+import asyncio
+import time
+from typing import List, Tuple
+from mongomock_motor import AsyncMongoMockClient
+
+from config.settings import mongo
+from models.embedded_document import EmbeddedDocument, EmbeddedDocumentRepository
+
+
+def make_chunks(count: int, dimensions: int = 256) -> List[EmbeddedDocument]:
+    return [
+        EmbeddedDocument(chunk_id=f"document-{index}", documents_id="document", raw_chunk=f"chunk {index}",
+                         vector_chunk=[index / count] * dimensions, token_count=2, expires_at=None)
+        for index in range(count)
+    ]
+
+
+async def save_while_ticking(repository: EmbeddedDocumentRepository,
+                             chunks: List[EmbeddedDocument]) -> Tuple[List[float], float]:
+    """
+    Saves the chunks next to a coroutine recording when the event loop lets it run.
+    """
+    ticks = []
+    saved = asyncio.Event()
+
+    async def ticker():
+        while not saved.is_set():
+            ticks.append(time.perf_counter())
+            await asyncio.sleep(0)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await repository.save_many(chunks)
+    elapsed = time.perf_counter() - started
+    saved.set()
+    await task
+    return [tick for tick in ticks if tick >= started], elapsed
+
+
+def test_save_many_keeps_event_loop_serving(monkeypatch):
+    monkeypatch.setattr(mongo, "write_batch_size", 100)
+    repository = EmbeddedDocumentRepository(database=AsyncMongoMockClient()["test"])
+    chunks = make_chunks(2000)
+
+    ticks, elapsed = asyncio.run(save_while_ticking(repository, chunks))
+
+    # The in-memory stand-in writes synchronously, so the loop only runs between batches
+    assert len(ticks) >= len(chunks) // mongo.write_batch_size - 1
+    gaps = [later - earlier for earlier, later in zip(ticks, ticks[1:])]
+    assert max(gaps) < elapsed / 4
+
+
+def test_save_many_writes_every_batch(monkeypatch):
+    monkeypatch.setattr(mongo, "write_batch_size", 100)
+    database = AsyncMongoMockClient()["test"]
+    repository = EmbeddedDocumentRepository(database=database)
+    chunks = make_chunks(250, dimensions=8)
+
+    asyncio.run(repository.save_many(chunks))
+
+    collection = database[mongo.embedded_collection]
+    assert asyncio.run(collection.count_documents({"documents_id": "document"})) == 250
+    saved = asyncio.run(repository.find_one_by({"chunk_id": "document-249"}))
+    assert saved.id == chunks[249].id
+    assert saved.vector_chunk == chunks[249].vector_chunk
@@ -0,0 +1,171 @@
+import asyncio
+from types import SimpleNamespace
+from typing import List
+import numpy as np
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+
+from services.synced_index import match_filters
+from services.vector_store import NumpyVectorStore
+
+
+def make_chunk(documents_id: str, position: int, vector: List[float], file_name: str = "notes.txt") -> dict:
+    return {"chunk_id": f"{documents_id}-{position}", "documents_id": documents_id, "file_name": file_name,
+            "raw_chunk": f"chunk {position} of {documents_id}", "vector_chunk": vector}
+
+
+async def make_store(chunks: List[dict], **kwargs) -> NumpyVectorStore:
+    """
+    Stores the chunks and one document per documents_id, then loads a store over them.
+    """
+    database = AsyncMongoMockClient()["test"]
+    await database["embedded_documents"].insert_many([dict(chunk) for chunk in chunks])
+    documents = sorted({chunk["documents_id"] for chunk in chunks})
+    if documents:
+        await database["documents"].insert_many(
+            [{"_id": ObjectId(documents_id), "chunks_version": 1} for documents_id in documents])
+    store = NumpyVectorStore(SimpleNamespace(db=database), "embedded_documents", **kwargs)
+    await store.load()
+    return store
+
+
+FIRST, SECOND = str(ObjectId()), str(ObjectId())
+
+
+def test_search_returns_closest_chunks_first():
+    chunks = [
+        make_chunk(FIRST, 1, [1.0, 0.0]),
+        make_chunk(FIRST, 2, [0.0, 1.0]),
+        make_chunk(SECOND, 1, [1.0, 1.0], file_name="other.txt"),
+    ]
+
+    async def run():
+        store = await make_store(chunks)
+        return await store.search("embedded_documents", [2.0, 0.0], limit=2)
+
+    hits = asyncio.run(run())
+
+    assert [hit["chunk_id"] for hit in hits] == [f"{FIRST}-1", f"{SECOND}-1"]
+    # Scores follow the Atlas cosine score, (1 + cosine) / 2
+    assert hits[0]["score"] == pytest.approx(1.0)
+    assert hits[1]["score"] == pytest.approx((1 + 2 ** -0.5) / 2)
+    assert hits[1]["text"] == f"chunk 1 of {SECOND}"
+    assert hits[1]["source"] == "other.txt"
+
+
+def test_search_applies_filters_before_ranking():
+    chunks = [make_chunk(FIRST, 1, [1.0, 0.0]), make_chunk(SECOND, 1, [0.9, 0.1])]
+
+    async def run():
+        store = await make_store(chunks)
+        return await store.search("embedded_documents", [1.0, 0.0], {"documents_id": SECOND}, limit=5)
+
+    hits = asyncio.run(run())
+
+    assert [hit["chunk_id"] for hit in hits] == [f"{SECOND}-1"]
+
+
+def test_search_rejects_another_collection():
+    async def run():
+        store = await make_store([make_chunk(FIRST, 1, [1.0, 0.0])])
+        await store.search("other", [1.0, 0.0])
+
+    with pytest.raises(ValueError):
+        asyncio.run(run())
+
+
+COLUMNS = {
+    "documents_id": np.array(["a", "a", "b", "c"], dtype=object),
+    "file_name": np.array(["x", "y", "x", None], dtype=object),
+}
+
+
+@pytest.mark.parametrize("filters, expected", [
+    ({}, [True, True, True, True]),
+    ({"documents_id": "a"}, [True, True, False, False]),
+    ({"documents_id": {"$eq": "b"}}, [False, False, True, False]),
+    ({"documents_id": {"$ne": "a"}}, [False, False, True, True]),
+    ({"documents_id": {"$in": ["a", "c"]}}, [True, True, False, True]),
+    ({"documents_id": {"$nin": ["a", "c"]}}, [False, False, True, False]),
+    ({"documents_id": "a", "file_name": "x"}, [True, False, False, False]),
+    ({"$and": [{"documents_id": "a"}, {"file_name": "y"}]}, [False, True, False, False]),
+    ({"$or": [{"documents_id": "b"}, {"file_name": None}]}, [False, False, True, True]),
+    ({"$or": []}, [False, False, False, False]),
+])
+def test_match_filters(filters, expected):
+    assert match_filters(filters, COLUMNS).tolist() == expected
+
+
+@pytest.mark.parametrize("filters", [{"raw_chunk": "a"}, {"documents_id": {"$gt": "a"}}])
+def test_match_filters_rejects_unsupported_filters(filters):
+    with pytest.raises(ValueError):
+        match_filters(filters, COLUMNS)
+
+
+def test_ivf_search_matches_exact_search_when_probing_every_list():
+    rng = np.random.default_rng(1)
+    # Clustered vectors, so the lists are balanced enough for a few probes to find the neighbours
+    centers = rng.normal(size=(8, 16))
+    vectors = centers[rng.integers(0, 8, size=400)] + rng.normal(scale=0.1, size=(400, 16))
+    chunks = [make_chunk(FIRST if i % 2 else SECOND, i, vector.tolist()) for i, vector in enumerate(vectors)]
+    queries = centers + rng.normal(scale=0.1, size=centers.shape)
+
+    async def run():
+        exact = await make_store(chunks)
+        ivf = await make_store(chunks, mode="ivf", ivf_lists=8, ivf_probes=8, ivf_min_rows=100)
+        probed = await make_store(chunks, mode="ivf", ivf_lists=8, ivf_probes=2, ivf_min_rows=100)
+        results = []
+        for query in queries.tolist():
+            results.append([
+                [hit["chunk_id"] for hit in await store.search("embedded_documents", query, limit=10)]
+                for store in (exact, ivf, probed)
+            ])
+        return ivf.index, results
+
+    index, results = asyncio.run(run())
+
+    assert index.centroids.shape == (8, 16)
+    assert sorted(np.concatenate(index.lists).tolist()) == list(range(400))
+    for exact, ivf, probed in results:
+        assert ivf == exact
+        # The neighbours of a query sit in the lists closest to it
+        assert len(set(probed) & set(exact)) >= 8
+
+
+def test_ivf_mode_searches_exactly_below_min_rows():
+    async def run():
+        store = await make_store([make_chunk(FIRST, 1, [1.0, 0.0])], mode="ivf", ivf_min_rows=100)
+        return store.index
+
+    assert asyncio.run(run()).centroids is None
+
+
+def test_refresh_applies_every_change_in_one_build(monkeypatch):
+    chunks = [make_chunk(FIRST, 1, [1.0, 0.0]), make_chunk(SECOND, 1, [0.0, 1.0])]
+    third = str(ObjectId())
+
+    async def run():
+        store = await make_store(chunks)
+        database = store.mongo_client.db
+        # Another process updates a document, deletes one and adds one
+        await database["embedded_documents"].delete_many({"documents_id": FIRST})
+        await database["embedded_documents"].insert_one(make_chunk(FIRST, 2, [1.0, 1.0]))
+        await database["documents"].update_one({"_id": ObjectId(FIRST)}, {"$inc": {"chunks_version": 1}})
+        await database["embedded_documents"].delete_many({"documents_id": SECOND})
+        await database["documents"].delete_one({"_id": ObjectId(SECOND)})
+        await database["embedded_documents"].insert_one(make_chunk(third, 1, [0.0, 1.0]))
+        await database["documents"].insert_one({"_id": ObjectId(third), "chunks_version": 1})
+
+        builds = []
+        build = store._build
+        monkeypatch.setattr(store, "_build", lambda *args: builds.append(args[1]) or build(*args))
+        await store.refresh()
+        await store.refresh()
+        return store.index, builds
+
+    index, builds = asyncio.run(run())
+
+    assert len(builds) == 1
+    assert sorted(builds[0]) == sorted([FIRST, SECOND, third])
+    assert sorted(index.columns["chunk_id"].tolist()) == sorted([f"{FIRST}-2", f"{third}-1"])
@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from typing import Callable, Generic, Hashable, Optional, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """
+    In-process cache evicting the least recently used item beyond `max_items` and items older than `ttl_seconds`.
+
+    Not thread-safe, meant to be used from the event loop.
+    """
+
+    def __init__(self, max_items: int, ttl_seconds: float, on_evict: Callable[[K, V], None] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Initializes the TTLCache.
+
+        Args:
+            max_items (int): The number of items kept.
+            ttl_seconds (float): How long an item stays valid after it was set.
+            on_evict (Callable[[K, V], None], optional): Called with every item removed other than by `set` replacing it.
+            clock (Callable[[], float], optional): The time source. Defaults to time.monotonic.
+        """
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self.on_evict = on_evict
+        self.clock = clock
+        self._items: "OrderedDict[K, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """
+        Returns the item for `key` and marks it as recently used, or `default` when missing or expired.
+        """
+        value = self.peek(key, default)
+        if key in self._items:
+            self._items.move_to_end(key)
+        return value
+
+    def peek(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """
+        Returns the item for `key` without marking it as recently used, or `default` when missing or expired.
+        """
+        item = self._items.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= self.clock():
+            self.pop(key)
+            return default
+        return value
+
+    def set(self, key: K, value: V):
+        """
+        Stores an item, evicting the least recently used items beyond `max_items`.
+        """
+        self._items[key] = (self.clock() + self.ttl_seconds, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            evicted_key, (_, evicted) = self._items.popitem(last=False)
+            if self.on_evict is not None:
+                self.on_evict(evicted_key, evicted)
+
+    def pop(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """
+        Removes the item for `key` and returns it, or `default` when missing.
+        """
+        item = self._items.pop(key, None)
+        if item is None:
+            return default
+        if self.on_evict is not None:
+            self.on_evict(key, item[1])
+        return item[1]
+
+    def clear(self):
+        for key in list(self._items):
+            self.pop(key)
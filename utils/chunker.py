@@ -0,0 +1,167 @@
+import zlib
+from typing import List, NamedTuple, Optional
+import numpy as np
+import tiktoken
+
+# Scores of the token boundaries a chunk may end at, higher is preferred
+PARAGRAPH, LINE, SENTENCE, WORD, TOKEN = 4, 3, 2, 1, 0
+INVALID = -1
+
+
+class Chunk(NamedTuple):
+    """
+    A chunk of text cut by the TokenChunker.
+
+    Attributes:
+        text (str): The text of the chunk, stripped of surrounding whitespace.
+        token_count (int): The number of tokens of the chunk encoded on its own, as the embedding model counts them.
+    """
+    text: str
+    token_count: int
+
+
+class TokenChunker:
+    """
+    Splits text into chunks of at most `chunk_size` tokens, encoding the whole text only once.
+
+    Chunks end at the most natural token boundary of the second half of their window: a paragraph break,
+    then a line break, a sentence end, a word and, failing all of these, any token that does not cut a
+    UTF-8 character. Consecutive chunks share `chunk_overlap` tokens. Every chunk is encoded again on its
+    own, since its first and last words may take more tokens without the text around them, and its window
+    is shortened until it fits in `chunk_size`.
+
+    With `anchor_modulus`, text longer than a chunk is first cut into sections at content-defined paragraph
+    breaks, once a section holds a quarter of a chunk: a paragraph ends a section when the checksum of its
+    text is a multiple of the modulus. The same paragraphs end sections in every version of a document, so
+    an edit only changes the chunks of its own section instead of shifting every chunk boundary after it.
+    """
+
+    def __init__(self, chunk_size: int = 8100, chunk_overlap: int = 0, anchor_modulus: Optional[int] = None,
+                 encoding_name: str = "cl100k_base"):
+        """
+        Initializes the TokenChunker.
+
+        Args:
+            chunk_size (int, optional): The most tokens of a chunk. Defaults to 8100, below the 8192 limit of the embedding models.
+            chunk_overlap (int, optional): The number of tokens shared by consecutive chunks. Defaults to 0.
+            anchor_modulus (int, optional): The checksum modulus of the paragraphs ending sections. Defaults to no sections.
+            encoding_name (str, optional): The tiktoken encoding. Defaults to "cl100k_base".
+        """
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError("chunk_overlap must be at least 0 and smaller than chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.anchor_modulus = anchor_modulus
+        self.encoding_name = encoding_name
+
+    @property
+    def encoding(self) -> tiktoken.Encoding:
+        # tiktoken caches encodings, only the first call loads the ranks
+        return tiktoken.get_encoding(self.encoding_name)
+
+    def split(self, text: str) -> List[Chunk]:
+        """
+        Splits text into chunks. CPU bound, meant to run off the event loop.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            List[Chunk]: The chunks with their token counts, in order, without empty chunks.
+        """
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if not tokens:
+            return []
+        token_bytes = self.encoding.decode_tokens_bytes(tokens)
+        data = b"".join(token_bytes)
+        # offsets[i] is the byte offset of the boundary before token i, offsets[n] the end of the text
+        offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, token_bytes), dtype=np.int64, count=len(tokens)), out=offsets[1:])
+        scores = self._score_boundaries(data, offsets)
+
+        sections = [(0, len(tokens))]
+        if self.anchor_modulus and len(tokens) > self.chunk_size:
+            sections = self._sections(data, offsets, scores)
+
+        chunks = []
+        for start, end in sections:
+            chunks.extend(self._chunks(data, offsets, scores, start, end))
+        return chunks
+
+    def _score_boundaries(self, data: bytes, offsets: np.ndarray) -> np.ndarray:
+        """
+        Scores every token boundary by the bytes around it.
+        """
+        text = np.frombuffer(data, dtype=np.uint8)
+        # The bytes before and after every boundary, a space stands in beyond the ends of the text
+        padded = np.concatenate(([32, 32], text, [32]))
+        before, before_2, after = padded[offsets + 1], padded[offsets], padded[offsets + 2]
+
+        newline, space = ord("\n"), ord(" ")
+        scores = np.full(len(offsets), TOKEN, dtype=np.int8)
+        scores[(before == space) | (after == space) | (after == newline)] = WORD
+        scores[np.isin(before, list(b".!?;:")) & np.isin(after, list(b" \n\t"))] = SENTENCE
+        scores[before == newline] = LINE
+        scores[(before == newline) & (before_2 == newline)] = PARAGRAPH
+        # Tokens may hold part of a multi-byte character, never cut before a continuation byte
+        scores[(after & 0xC0) == 0x80] = INVALID
+        return scores
+
+    def _sections(self, data: bytes, offsets: np.ndarray, scores: np.ndarray) -> List[tuple]:
+        """
+        Cuts the tokens into sections ending at content-defined paragraph breaks.
+        """
+        sections = []
+        section_start = paragraph_start = 0
+        for boundary in np.flatnonzero(scores == PARAGRAPH):
+            if boundary <= paragraph_start:
+                continue
+            paragraph = data[offsets[paragraph_start]:offsets[boundary]].strip()
+            paragraph_start = boundary
+            if boundary - section_start >= self.chunk_size // 4 and \
+                    zlib.crc32(paragraph) % self.anchor_modulus == 0:
+                sections.append((section_start, int(boundary)))
+                section_start = int(boundary)
+        if section_start < len(offsets) - 1:
+            sections.append((section_start, len(offsets) - 1))
+        return sections
+
+    def _chunks(self, data: bytes, offsets: np.ndarray, scores: np.ndarray, start: int, end: int) -> List[Chunk]:
+        """
+        Cuts the tokens of a section into chunks ending at the best boundary of their window.
+        """
+        chunks = []
+        while start < end:
+            size = self.chunk_size
+            while True:
+                stop = self._stop(scores, start, end, size)
+                text = data[offsets[start]:offsets[stop]].decode("utf-8", errors="replace").strip()
+                token_count = len(self.encoding.encode(text, disallowed_special=())) if text else 0
+                if token_count <= self.chunk_size or stop - start <= 1:
+                    break
+                # Shorten the window by the tokens the chunk gained when encoded on its own
+                size = stop - start - (token_count - self.chunk_size)
+            if text:
+                chunks.append(Chunk(text, token_count))
+            if stop == end:
+                break
+            next_start = max(stop - self.chunk_overlap, start + 1)
+            while next_start < stop and scores[next_start] == INVALID:
+                next_start += 1
+            start = next_start
+        return chunks
+
+    @staticmethod
+    def _stop(scores: np.ndarray, start: int, end: int, size: int) -> int:
+        """
+        Returns the end of the window of `size` tokens from `start`: the latest boundary with the best score
+        in its second half.
+        """
+        stop = min(start + size, end)
+        if stop < end:
+            low = start + max(size // 2, 1)
+            candidates = scores[low:stop + 1][::-1]
+            stop -= int(np.argmax(candidates))
+            while stop > start + 1 and scores[stop] == INVALID:
+                stop -= 1
+        return stop
@@ -1,8 +1,17 @@
 import tiktoken
+from functools import lru_cache
 from typing import List
 
-# Define encoding for the specified model
-encoding = tiktoken.encoding_for_model('gpt-3.5-turbo')
+
+@lru_cache
+def get_encoding() -> tiktoken.Encoding:
+    """
+    Returns the encoding of the chat model, loading it on the first call instead of at import.
+
+    Returns:
+        tiktoken.Encoding: The encoding of gpt-3.5-turbo.
+    """
+    return tiktoken.encoding_for_model('gpt-3.5-turbo')
 
 
 def get_token_counts(string: str) -> int:
@@ -15,5 +24,18 @@ def get_token_counts(string: str) -> int:
     Returns:
         int: The number of tokens in the string.
     """
-    num_tokens = len(encoding.encode(string))
+    num_tokens = len(get_encoding().encode(string))
     return num_tokens
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalizes a question for use as a cache key, ignoring case, repeated whitespace and trailing punctuation.
+
+    Args:
+        question (str): The question to normalize.
+
+    Returns:
+        str: The normalized question.
+    """
+    return " ".join(question.lower().split()).rstrip("?!. ")
@@ -0,0 +1,75 @@
+import numpy as np
+from typing import List, Optional, Tuple, Union
+
+# Storage formats of EmbeddedDocument.vector_chunk, "float" keeps the BSON double array
+VECTOR_FORMATS = ("float", "float16", "int8")
+
+_DTYPES = {"float16": np.float16, "int8": np.int8}
+_MAX_VALUES = {"float16": 1.0, "int8": 127.0}
+
+
+def encode_vector(vector: List[float], vector_format: str) -> Tuple[Union[List[float], bytes], Optional[float]]:
+    """
+    Packs a vector in the given storage format.
+
+    The vector is divided by a per-vector scale factor, its largest absolute value over the largest value
+    of the format, so every component uses the full range of the format.
+
+    Args:
+        vector (List[float]): The embedding.
+        vector_format (str): One of "float", "float16" and "int8".
+
+    Returns:
+        Tuple[Union[List[float], bytes], Optional[float]]: The stored vector and its scale factor, None for "float".
+    """
+    if vector_format == "float":
+        return [float(value) for value in vector], None
+    if vector_format not in _DTYPES:
+        raise ValueError(f"Invalid vector format: {vector_format}")
+
+    values = np.asarray(vector, dtype=np.float32)
+    peak = float(np.max(np.abs(values))) if len(values) else 0.0
+    scale = peak / _MAX_VALUES[vector_format] if peak > 0 else 1.0
+    scaled = values / scale
+    if vector_format == "int8":
+        scaled = np.rint(scaled)
+    return scaled.astype(_DTYPES[vector_format]).tobytes(), scale
+
+
+def decode_vector(data: Union[List[float], bytes], vector_format: Optional[str] = None, scale: Optional[float] = None,
+                  out: np.ndarray = None) -> np.ndarray:
+    """
+    Unpacks a stored vector to float32.
+
+    Packed vectors are read in place with numpy.frombuffer, the only copy is the float32 result, which is
+    written straight into `out` when given, e.g. a row of a preallocated matrix.
+
+    Args:
+        data (Union[List[float], bytes]): The stored vector.
+        vector_format (str, optional): The storage format, None or "float" for a plain array.
+        scale (float, optional): The scale factor of a packed vector.
+        out (np.ndarray, optional): A float32 array receiving the vector.
+
+    Returns:
+        np.ndarray: The float32 vector.
+    """
+    if vector_format in (None, "float"):
+        values = np.asarray(data, dtype=np.float32)
+        if out is None:
+            return values
+        out[:] = values
+        return out
+    if vector_format not in _DTYPES:
+        raise ValueError(f"Invalid vector format: {vector_format}")
+
+    packed = np.frombuffer(data, dtype=_DTYPES[vector_format])
+    return np.multiply(packed, np.float32(scale or 1.0), out=out, dtype=np.float32)
+
+
+def vector_dimensions(data: Union[List[float], bytes], vector_format: Optional[str] = None) -> int:
+    """
+    Returns the number of components of a stored vector without decoding it.
+    """
+    if vector_format in (None, "float"):
+        return len(data)
+    return len(data) // np.dtype(_DTYPES[vector_format]).itemsize
@@ -0,0 +1,52 @@
+import asyncio
+import signal
+from loguru import logger
+from prometheus_client import start_http_server
+
+import core.logging
+from config.settings import queue
+from models.document import DocumentRepository
+from models.embedded_document import EmbeddedDocumentRepository
+from vendor.mongodb import create_mongodb_client
+from vendor.openai import create_openai_client, get_embedding_cache
+from vendor.parser import create_document_parser
+from vendor.worker import create_ingestion_worker
+
+
+async def main():
+    """
+    Runs ingestion workers until the process receives SIGINT or SIGTERM.
+
+    Start as many of these processes, on as many nodes, as needed; they coordinate through the
+    documents collection. QUEUE_WORKERS sets the number of concurrent workers per process, and
+    QUEUE_METRICS_PORT the port serving the stage metrics of the process.
+    """
+    if queue.metrics_port:
+        start_http_server(queue.metrics_port)
+    mongo_client = create_mongodb_client()
+    openai_client = create_openai_client()
+    document_parser = create_document_parser()
+    await DocumentRepository(database=mongo_client.db).ensure_indexes()
+    await EmbeddedDocumentRepository(database=mongo_client.db).ensure_indexes()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    workers = [create_ingestion_worker(openai_client, mongo_client, document_parser)
+               for _ in range(max(queue.workers, 1))]
+    try:
+        await asyncio.gather(*(worker.run(stop) for worker in workers))
+    finally:
+        document_parser.executor.shutdown(cancel_futures=True)
+        await openai_client.close()
+        mongo_client.close()
+        embedding_cache = get_embedding_cache()
+        if embedding_cache is not None:
+            embedding_cache.close()
+        logger.info("Ingestion workers shut down")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())